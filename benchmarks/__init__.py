@@ -0,0 +1,9 @@
+"""
+Throughput benchmarks for the FLAC library tools.
+
+    synth_library.py -- generates a synthetic, metadata-valid FLAC library
+    run.py           -- times the scans and write paths against one
+    scan_order.py    -- cold-cache scan time / seek distance by read order
+
+See run.py for usage.
+"""
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+run.py
+
+Times the library tools' scans and write paths against a synthetic
+library (see synth_library.py) and reports files/sec and peak RSS, so a
+change that slows them down shows up before it meets a real library.
+
+Benchmarks (pick with --only, default all):
+    scan_albums_cold      genre tagger's scan_albums, no library index
+    scan_albums_warm      the same with an already-populated index
+    scan_tracks_cold      capitalisation fixer's scan_tracks, no index
+    scan_tracks_warm      the same with an already-populated index
+    group_by_album        image_fixer's build_snapshot + group_by_album
+    extract_tags          tag_normaliser.extract_tags
+    write_in_place        one tag edit + flac_writer.save_flac per file
+    plan_apply            a one-field tag plan applied with tag_plan.apply_plan
+
+Each benchmark runs in its own fresh interpreter, so its peak RSS is its
+own and one benchmark's page cache / imports don't flatter the next.
+The write benchmarks modify the library (that's the point of a synthetic
+one) and run last.
+
+Regression checking: save a run with --json, then pass it back as
+--baseline on a later run. Any benchmark whose files/sec dropped by more
+than --tolerance (default 20%) is flagged and the exit status is 1.
+
+Usage:
+    # Generate a default library in a temp folder, run everything:
+    python -m benchmarks.run
+
+    # Bigger library, kept for later runs:
+    python -m benchmarks.run --library /tmp/synth_lib --generate --artists 100 --picture-kb 2048
+
+    # Save results, then compare a later run against them:
+    python -m benchmarks.run --library /tmp/synth_lib --json baseline.json
+    python -m benchmarks.run --library /tmp/synth_lib --baseline baseline.json
+
+Requirements:
+    the same as the tools being timed (mutagen, tqdm, and for
+    group_by_album everything image_fixer.py imports)
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.synth_library import add_arguments, generate_from_args  # noqa: E402
+
+SCAN_BENCHMARKS = ("scan_albums_cold", "scan_albums_warm", "scan_tracks_cold", "scan_tracks_warm",
+                   "group_by_album", "extract_tags")
+WRITE_BENCHMARKS = ("write_in_place", "plan_apply")
+ALL_BENCHMARKS = SCAN_BENCHMARKS + WRITE_BENCHMARKS
+
+
+def load_tool(filename, module_name):
+    """Import one of the tool scripts (several have spaces in their names)."""
+    spec = importlib.util.spec_from_file_location(module_name, REPO_ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+# --------------------------------------------------------------------------
+# The benchmarks (each returns (seconds, files_processed))
+# --------------------------------------------------------------------------
+
+def _timed(fn):
+    start = time.perf_counter()
+    count = fn()
+    return time.perf_counter() - start, count
+
+
+def bench_scan_albums(root, workers, warm, tmp):
+    genre_tagger = load_tool("genre tagger.py", "genre_tagger")
+    index_file = Path(tmp) / "index.sqlite" if warm else None
+    if warm:
+        genre_tagger.scan_albums(root, index_file=index_file, workers=workers)
+
+    def run():
+        albums, skipped, _file_tags = genre_tagger.scan_albums(root, index_file=index_file, workers=workers)
+        return sum(len(files) for files in albums.values()) + len(skipped)
+    return _timed(run)
+
+
+def bench_scan_tracks(root, workers, warm, tmp):
+    fixer = load_tool("capitalisation fixer.py", "capitalisation_fixer")
+    index_file = Path(tmp) / "index.sqlite" if warm else None
+    if warm:
+        fixer.scan_tracks(root, index_file=index_file, workers=workers)
+
+    def run():
+        tracks, unreadable = fixer.scan_tracks(root, index_file=index_file, workers=workers)
+        return len(tracks) + len(unreadable)
+    return _timed(run)
+
+
+def bench_group_by_album(root, workers, warm, tmp):
+    import image_fixer
+    image_fixer.INDEX_FILE = None
+
+    def run():
+        snapshot = image_fixer.build_snapshot(image_fixer.find_flacs(str(root)))
+        image_fixer.group_by_album(snapshot)
+        return len(snapshot)
+    return _timed(run)
+
+
+def bench_extract_tags(root, workers, warm, tmp):
+    import tag_normaliser
+
+    def run():
+        return len(tag_normaliser.extract_tags(sorted(root.rglob("*.flac")), index_file=None))
+    return _timed(run)
+
+
+def bench_write_in_place(root, workers, warm, tmp):
+    from mutagen.flac import FLAC
+    from flac_writer import WriteStats, save_flac
+    stats = WriteStats()
+    stamp = str(time.time())
+
+    def run():
+        count = 0
+        for path in sorted(root.rglob("*.flac")):
+            audio = FLAC(path)
+            audio["comment"] = [f"benchmark {stamp}"]
+            save_flac(audio, stats=stats)
+            count += 1
+        return count
+    seconds, count = _timed(run)
+    print(f"  ({stats.summary()})", file=sys.stderr)
+    return seconds, count
+
+
+def bench_plan_apply(root, workers, warm, tmp):
+    from tag_plan import TagPlan, apply_plan
+    plan_file = Path(tmp) / "plan.jsonl"
+    stamp = str(time.time())
+    with TagPlan(plan_file, source="benchmark") as plan:
+        for path in sorted(root.rglob("*.flac")):
+            plan.add(path, "comment", None, [f"plan {stamp}"])
+
+    def run():
+        counts, _stats = apply_plan(plan_file, workers=workers, force=True)
+        return counts["applied"] + counts["unchanged"]
+    return _timed(run)
+
+
+BENCHMARKS = {
+    "scan_albums_cold": (bench_scan_albums, False),
+    "scan_albums_warm": (bench_scan_albums, True),
+    "scan_tracks_cold": (bench_scan_tracks, False),
+    "scan_tracks_warm": (bench_scan_tracks, True),
+    "group_by_album": (bench_group_by_album, False),
+    "extract_tags": (bench_extract_tags, False),
+    "write_in_place": (bench_write_in_place, False),
+    "plan_apply": (bench_plan_apply, False),
+}
+
+
+def run_child(name, root, workers):
+    """Entry point of the per-benchmark subprocess; prints one JSON line."""
+    fn, warm = BENCHMARKS[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            seconds, files = fn(Path(root), workers, warm, tmp)
+    print(json.dumps({"seconds": seconds, "files": files, "peak_rss_kb": peak_rss_kb()}))
+
+
+# --------------------------------------------------------------------------
+# Driver
+# --------------------------------------------------------------------------
+
+def run_benchmark(name, root, workers, repeat, verbose):
+    """Run one benchmark `repeat` times in fresh interpreters; keep the fastest."""
+    best = None
+    for _ in range(repeat):
+        cmd = [sys.executable, "-m", "benchmarks.run", "--child", name,
+               "--library", str(root), "--workers", str(workers)]
+        proc = subprocess.run(cmd, cwd=REPO_ROOT, stdout=subprocess.PIPE,
+                              stderr=None if verbose else subprocess.DEVNULL, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"benchmark '{name}' failed (exit {proc.returncode}); re-run with --verbose")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    best["files_per_sec"] = best["files"] / best["seconds"] if best["seconds"] else 0.0
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """Return [(name, old_fps, new_fps), ...] for benchmarks that regressed."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("files_per_sec"):
+            continue
+        if result["files_per_sec"] < old["files_per_sec"] * (1 - tolerance):
+            regressions.append((name, old["files_per_sec"], result["files_per_sec"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FLAC tools' scans and writes on a synthetic library.")
+    parser.add_argument("--library", type=str, default=None,
+                        help="Synthetic library to use (generated if missing or with --generate; "
+                             "default: a fresh temp folder)")
+    parser.add_argument("--generate", action="store_true",
+                        help="(Re)generate the library at --library before running.")
+    parser.add_argument("--only", type=str, default=None,
+                        help=f"Comma-separated subset of: {','.join(ALL_BENCHMARKS)}")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker count passed to the scans/apply (default: the tools' own default)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, fastest kept (default: 3)")
+    parser.add_argument("--json", type=str, default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Earlier --json output to check for regressions against.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed files/sec drop vs. the baseline before flagging (default: 0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="Show the benchmarks' own output.")
+    parser.add_argument("--child", type=str, default=None, help=argparse.SUPPRESS)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.workers is None:
+        from library_scan import DEFAULT_WORKERS
+        args.workers = DEFAULT_WORKERS
+
+    if args.child:
+        run_child(args.child, args.library, args.workers)
+        return 0
+
+    names = list(ALL_BENCHMARKS)
+    if args.only:
+        wanted = {n.strip() for n in args.only.split(",") if n.strip()}
+        unknown = wanted - set(ALL_BENCHMARKS)
+        if unknown:
+            print(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+            return 2
+        names = [n for n in ALL_BENCHMARKS if n in wanted]
+
+    tmp = None
+    if args.library is None:
+        tmp = tempfile.TemporaryDirectory(prefix="synth_lib_")
+        root = Path(tmp.name)
+    else:
+        root = Path(args.library).expanduser().resolve()
+
+    try:
+        if args.generate or tmp is not None or not root.is_dir():
+            print(f"Generating synthetic library in {root}...")
+            files = generate_from_args(root, args)
+        else:
+            files = sorted(root.rglob("*.flac"))
+        total_mb = sum(p.stat().st_size for p in files) / 1024 ** 2
+        print(f"Library: {len(files)} file(s), {total_mb:.1f} MB. Workers: {args.workers}.\n")
+
+        results = {}
+        print(f"{'benchmark':<20} {'files':>7} {'seconds':>9} {'files/sec':>11} {'peak RSS':>10}")
+        for name in names:
+            result = run_benchmark(name, root, args.workers, args.repeat, args.verbose)
+            results[name] = result
+            print(f"{name:<20} {result['files']:>7} {result['seconds']:>9.3f} "
+                  f"{result['files_per_sec']:>11.1f} {result['peak_rss_kb'] / 1024:>8.1f}MB")
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    report = {
+        "library": {"files": len(files), "megabytes": round(total_mb, 1)},
+        "workers": args.workers,
+        "results": results,
+    }
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nWrote results to {args.json}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) vs. {args.baseline}:")
+            for name, old, new in regressions:
+                print(f"  {name}: {old:.1f} -> {new:.1f} files/sec ({(new / old - 1) * 100:+.0f}%)")
+            return 1
+        print(f"\nNo regressions vs. {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
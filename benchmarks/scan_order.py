@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+scan_order.py
+
+Compares the metadata scan in path order against inode and physical
+(FIEMAP) order on a cold cache -- the case that matters on a spinning
+disk, where every jump between files is a seek.
+
+For each order, every file's cached pages are first dropped with
+posix_fadvise(POSIX_FADV_DONTNEED) (no root needed; on a real HDD this
+makes every read go to the platter), then the files are read one at a
+time with library_index.read_file_record, exactly as a cold
+LibraryIndex.scan(..., workers=1, order=...) would. Reported per order:
+
+    seconds      wall time of the reads
+    seek distance  sum of |start of file i - start of file i-1| over the
+                 read order, from FIEMAP ("n/a" where it isn't available)
+                 -- the distance the heads would have to travel
+
+Point it at a folder on the disk you care about; a synthetic library
+(synth_library.py) on an SSD or tmpfs will show the seek-distance
+difference but little time difference.
+
+Usage:
+    python -m benchmarks.scan_order /path/to/music
+    python -m benchmarks.scan_order /path/to/music --limit 2000 --repeat 3
+
+No third-party requirements (Linux for FIEMAP / fadvise).
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from library_index import read_file_record  # noqa: E402
+from library_scan import SCAN_ORDERS, first_extent, order_paths  # noqa: E402
+
+
+def drop_cache(paths):
+    """Ask the kernel to forget the cached pages of every file. Returns
+    False if posix_fadvise isn't available on this platform."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def seek_distance(ordered, extents):
+    """Total head travel (bytes) reading files in this order, or None if
+    no file has a known location."""
+    known = [extents[p] for p in ordered if extents.get(p) is not None]
+    if not known:
+        return None
+    return sum(abs(b - a) for a, b in zip(known, known[1:]))
+
+
+def time_order(ordered):
+    start = time.perf_counter()
+    failed = 0
+    for path in ordered:
+        try:
+            read_file_record(path)
+        except Exception:
+            failed += 1
+    return time.perf_counter() - start, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cold-cache scan time and seek distance by read order.")
+    parser.add_argument("folder", type=str, help="Folder of FLAC files, searched recursively")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N files (in path order)")
+    parser.add_argument("--repeat", type=int, default=1, help="Cold runs per order, fastest kept (default: 1)")
+    args = parser.parse_args()
+
+    root = Path(args.folder).expanduser().resolve()
+    paths = sorted(str(p) for p in root.rglob("*.flac"))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        print(f"No FLAC files under {root}.")
+        return 1
+
+    extents = {p: first_extent(p) for p in paths}
+    mapped = sum(1 for e in extents.values() if e is not None)
+    print(f"{len(paths)} file(s), {mapped} with a FIEMAP location.")
+    if not drop_cache(paths):
+        print("posix_fadvise isn't available here; timings are NOT cold-cache.")
+    print()
+
+    print(f"{'order':<10} {'seconds':>9} {'files/sec':>10} {'seek distance':>15}")
+    for order in SCAN_ORDERS:
+        ordered = order_paths(paths, order)
+        best = None
+        for _ in range(args.repeat):
+            drop_cache(paths)
+            seconds, failed = time_order(ordered)
+            best = seconds if best is None else min(best, seconds)
+        distance = seek_distance(ordered, extents)
+        shown = "n/a" if distance is None else f"{distance / 1024 ** 3:.2f} GB"
+        print(f"{order:<10} {best:>9.3f} {len(paths) / best:>10.1f} {shown:>15}"
+              + (f"   ({failed} unreadable)" if failed else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+synth_library.py
+
+Generates a synthetic FLAC library to benchmark the tools against,
+without pointing them at a real collection.
+
+Every file has real, well-formed FLAC metadata -- STREAMINFO, a Vorbis
+comment block with ARTIST / ALBUMARTIST / ALBUM / TITLE / TRACKNUMBER /
+DATE / GENRE, a front cover (type 3) and an artist image (type 8), and a
+PADDING block -- followed by filler "audio" bytes sized to the track
+length. The audio isn't decodable, but nothing in this folder decodes
+audio: mutagen and flac_meta only ever read the metadata and the
+STREAMINFO length, so scans and tag writes behave exactly as they do on
+real files of the same size.
+
+Layout: ROOT/<Artist>/<Album>/<NN> <Title>.flac, with every album's
+tracks sharing one cover and every artist's albums sharing one artist
+image (what image_fixer.py leaves behind). A configurable fraction of
+tracks gets a "; "-separated multi-artist ARTIST tag.
+
+Files are written directly (no mutagen), so generating a few thousand
+tracks takes seconds. Output is deterministic for a given --seed.
+
+Usage:
+    python -m benchmarks.synth_library /tmp/synth_lib
+    python -m benchmarks.synth_library /tmp/synth_lib --artists 50 --albums-per-artist 4 \\
+        --tracks-per-album 12 --track-seconds 200 --picture-kb 2048 --padding 8192
+
+No third-party requirements.
+"""
+
+import argparse
+import random
+import struct
+import sys
+from pathlib import Path
+
+STREAMINFO = 0
+PADDING = 1
+VORBIS_COMMENT = 4
+PICTURE = 6
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+BITS_PER_SAMPLE = 16
+
+# Roughly what a 16/44.1 FLAC averages (~900 kbps).
+DEFAULT_AUDIO_BYTES_PER_SECOND = 110_000
+
+# Filler audio is this block repeated; random enough that nothing along
+# the way (filesystem compression, page dedup) makes it unrealistically cheap.
+_FILLER_BLOCK_SIZE = 1 << 20
+
+WORDS = ("Echo", "Glass", "River", "Neon", "Static", "Velvet", "Hollow", "Signal", "Paper",
+         "Golden", "Midnight", "Ghost", "Orbit", "Wild", "Silent", "Electric", "Summer", "Iron")
+
+
+def _block(block_type, payload, is_last=False):
+    header = (0x80 if is_last else 0) | block_type
+    return bytes([header]) + len(payload).to_bytes(3, "big") + payload
+
+
+def _streaminfo(total_samples):
+    packed = (SAMPLE_RATE << 44) | ((CHANNELS - 1) << 41) | ((BITS_PER_SAMPLE - 1) << 36) | total_samples
+    return (struct.pack(">HH", 4096, 4096) + (0).to_bytes(3, "big") + (0).to_bytes(3, "big")
+            + packed.to_bytes(8, "big") + bytes(16))
+
+
+def _vorbis_comment(tags):
+    vendor = b"synth_library"
+    out = [struct.pack("<I", len(vendor)), vendor]
+    entries = [f"{key.upper()}={value}".encode("utf-8") for key, value in tags]
+    out.append(struct.pack("<I", len(entries)))
+    for entry in entries:
+        out.append(struct.pack("<I", len(entry)))
+        out.append(entry)
+    return b"".join(out)
+
+
+def _picture(pic_type, data, width=1000, height=1000):
+    mime = b"image/jpeg"
+    return (struct.pack(">II", pic_type, len(mime)) + mime + struct.pack(">I", 0)
+            + struct.pack(">IIIII", width, height, 24, 0, len(data)) + data)
+
+
+def build_flac(tags, track_seconds, pictures=(), padding=8192,
+               audio_bytes_per_second=DEFAULT_AUDIO_BYTES_PER_SECOND, filler=None):
+    """
+    Return the bytes of one synthetic FLAC file. tags: [(key, value), ...];
+    pictures: [(type, data), ...].
+    """
+    blocks = [_block(STREAMINFO, _streaminfo(int(track_seconds * SAMPLE_RATE))),
+              _block(VORBIS_COMMENT, _vorbis_comment(tags))]
+    blocks += [_block(PICTURE, _picture(pic_type, data)) for pic_type, data in pictures]
+    blocks.append(_block(PADDING, bytes(padding), is_last=True))
+
+    audio_len = int(track_seconds * audio_bytes_per_second)
+    filler = filler or random.Random(0).randbytes(_FILLER_BLOCK_SIZE)
+    reps, rest = divmod(audio_len, len(filler))
+    return b"fLaC" + b"".join(blocks) + filler * reps + filler[:rest]
+
+
+def _name(rng, words=2):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_library(root, artists=20, albums_per_artist=3, tracks_per_album=10, track_seconds=180,
+                     picture_kb=500, padding=8192, multi_artist_ratio=0.2,
+                     audio_bytes_per_second=DEFAULT_AUDIO_BYTES_PER_SECOND, seed=0):
+    """
+    Write a synthetic library under root. Returns the list of file paths
+    written. Existing files at the same paths are overwritten.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    filler = rng.randbytes(_FILLER_BLOCK_SIZE)
+    picture_len = max(1, picture_kb * 1024)
+    written = []
+
+    for a in range(artists):
+        artist = f"{_name(rng)} {a}"
+        artist_image = rng.randbytes(picture_len)
+        for b in range(albums_per_artist):
+            album = f"{_name(rng, 3)} {b}"
+            year = 1970 + rng.randrange(55)
+            genre = ";".join(rng.sample(("Rock", "Indie", "Pop", "Electronic", "Jazz", "Folk"), 2))
+            cover = rng.randbytes(picture_len)
+            album_dir = root / artist / album
+            album_dir.mkdir(parents=True, exist_ok=True)
+            for t in range(1, tracks_per_album + 1):
+                title = _name(rng, 3)
+                track_artist = artist
+                if rng.random() < multi_artist_ratio:
+                    track_artist = f"{artist}; {_name(rng)}"
+                tags = [
+                    ("title", title),
+                    ("artist", track_artist),
+                    ("albumartist", artist),
+                    ("album", album),
+                    ("tracknumber", f"{t:02d}/{tracks_per_album:02d}"),
+                    ("date", str(year)),
+                    ("genre", genre),
+                ]
+                length = track_seconds * rng.uniform(0.7, 1.3)
+                data = build_flac(tags, length, pictures=[(3, cover), (8, artist_image)],
+                                  padding=padding, audio_bytes_per_second=audio_bytes_per_second,
+                                  filler=filler)
+                path = album_dir / f"{t:02d} {title}.flac"
+                path.write_bytes(data)
+                written.append(path)
+    return written
+
+
+def add_arguments(parser):
+    """The generator options, shared with benchmarks/run.py."""
+    parser.add_argument("--artists", type=int, default=20, help="Number of artists (default: 20)")
+    parser.add_argument("--albums-per-artist", type=int, default=3, help="Albums per artist (default: 3)")
+    parser.add_argument("--tracks-per-album", type=int, default=10, help="Tracks per album (default: 10)")
+    parser.add_argument("--track-seconds", type=float, default=180,
+                        help="Average track length in seconds; sets the file size (default: 180)")
+    parser.add_argument("--picture-kb", type=int, default=500,
+                        help="Size of each embedded picture in KB, two per file (default: 500)")
+    parser.add_argument("--padding", type=int, default=8192,
+                        help="Bytes of FLAC padding per file (default: 8192)")
+    parser.add_argument("--multi-artist-ratio", type=float, default=0.2,
+                        help="Fraction of tracks with a '; '-separated multi-artist ARTIST tag (default: 0.2)")
+    parser.add_argument("--audio-bytes-per-second", type=int, default=DEFAULT_AUDIO_BYTES_PER_SECOND,
+                        help=f"Filler audio bytes per second of track (default: {DEFAULT_AUDIO_BYTES_PER_SECOND})")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+
+
+def generate_from_args(root, args):
+    return generate_library(
+        root, artists=args.artists, albums_per_artist=args.albums_per_artist,
+        tracks_per_album=args.tracks_per_album, track_seconds=args.track_seconds,
+        picture_kb=args.picture_kb, padding=args.padding, multi_artist_ratio=args.multi_artist_ratio,
+        audio_bytes_per_second=args.audio_bytes_per_second, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic FLAC library for benchmarking.")
+    parser.add_argument("folder", type=str, help="Where to write the library")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    root = Path(args.folder).expanduser()
+    files = generate_from_args(root, args)
+    total = sum(p.stat().st_size for p in files)
+    print(f"Wrote {len(files)} file(s), {total / 1024 ** 2:.1f} MB, under {root}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -39,26 +39,38 @@ MULTI-ARTIST TAGS:
     to ARTIST), and only its first name if that also contains "; ", since
     that's normally the "clean" canonical artist for the release.
 
-SPEED: title lookups are the expensive part of this (one Last.fm request
+SPEED: before anything is asked, every distinct artist, album and title
+that isn't already decided is looked up on Last.fm, several at a time
+(--prefetch-workers, within the same rate limit), so the review pass that
+follows waits on you, not the network.
+
+Title lookups are the expensive part of this (one Last.fm request
 per distinct track, versus far fewer distinct artists/albums). To avoid
 that, once an album has been resolved this script fetches that album's
-full tracklist from Last.fm ONE time (album.getInfo) and matches each
-local file's title against it directly -- no extra request per track.
-
-SAFETY: matching by track number against an album's Last.fm tracklist is
-only trusted when the resulting name is still reasonably similar to what
-you already have tagged (multi-disc/deluxe editions can otherwise make
-"track 4" on Last.fm correspond to a totally different song). A
-low-similarity rank match falls back to an individual track.search
-instead of being applied blind.
+full tracklist from Last.fm ONE time (album.getInfo) and matches the
+whole local album against it at once -- no extra request per track.
+Exact names match outright; the remaining titles are paired with the
+remaining tracklist entries so the overall similarity is highest, each
+entry used once (with rapidfuzz and scipy installed, that's a fast
+similarity score and an optimal assignment; without them, difflib and a
+greedy one).
+
+SAFETY: a pair is only trusted when the names are reasonably similar
+(0.6 when the track numbers agree, 0.85 when they don't -- multi-disc/
+deluxe editions can otherwise make "track 4" on Last.fm correspond to a
+totally different song). A title with no trusted pair falls back to an
+individual track.search instead of being applied blind.
 
 PERSISTENT CACHE: every Last.fm lookup result AND every approval decision
 you make is saved to disk (default: ~/.lastfm_genre_tagger/
-capitalization_cache.json) as you go. If the script is interrupted --
+capitalization_cache.sqlite) as you go. If the script is interrupted --
 Ctrl+C, a crash, choosing [q]uit -- nothing is lost: re-running the same
 folder reuses everything already resolved/decided, with no repeated
-network requests or repeated prompts. Use --no-cache to disable this, or
---clear-cache to start fresh.
+network requests or repeated prompts. Entries are read only when they're
+looked up and only new ones are written, so a cache tens of thousands of
+entries deep costs no more at startup than an empty one. Use --no-cache to
+disable this, or --clear-cache to start fresh. (A capitalization_cache.json
+from an older version is imported automatically on the first run.)
 
 Fixing via a Last.fm URL:
     If Last.fm's search comes up empty (or you don't trust the automatic
@@ -76,6 +88,7 @@ API KEY STORAGE:
 
 Requirements:
     pip install mutagen requests tqdm cryptography
+    pip install rapidfuzz scipy       # optional, better tracklist matching
 
 Usage:
     python lastfm_capitalization_fixer.py --set-api-key   # one-time
@@ -83,6 +96,15 @@ Usage:
     python lastfm_capitalization_fixer.py /path/to/music/folder --dry-run
     python lastfm_capitalization_fixer.py /path/to/music/folder --fields artist,album,tracknumber
     python lastfm_capitalization_fixer.py /path/to/music/folder --no-prompt
+
+    # Re-apply everything already decided without going online (no password
+    # prompt, no requests; anything not cached is left for a later run):
+    python lastfm_capitalization_fixer.py /path/to/music/folder --offline
+
+    # Record the approved fixes instead of writing them, then write them all
+    # in one resumable, parallel pass (see tag_plan.py):
+    python lastfm_capitalization_fixer.py /path/to/music/folder --plan caps_plan.jsonl
+    python tag_plan.py apply caps_plan.jsonl
 """
 
 import argparse
@@ -91,10 +113,13 @@ import difflib
 import getpass
 import json
 import os
+import sqlite3
 import sys
+import threading
 import time
 import urllib.parse
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
 
@@ -105,10 +130,29 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from mutagen.flac import FLAC
 from tqdm import tqdm
 
-LASTFM_API_URL = "https://ws.audioscrobbler.com/2.0/"
+# Optional: faster title similarity and an optimal (rather than greedy)
+# tracklist assignment. Everything works without them.
+try:
+    from rapidfuzz import fuzz
+except ImportError:
+    fuzz = None
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+from flac_writer import DEFAULT_PADDING_RESERVE, WriteStats, save_flac
+from lastfm_api import DEFAULT_MAX_IN_FLIGHT, DEFAULT_RATE, LastFmError, NotCached, get_client
+from lastfm_cache import DEFAULT_CACHE_FILE as DEFAULT_RESPONSE_CACHE, ResponseCache
+from library_daemon import daemon_records
+from library_index import DEFAULT_INDEX_FILE, LibraryIndex
+from library_scan import DEFAULT_WORKERS, SCAN_ORDERS
+from library_walk import walk_files
+from tag_plan import TagPlan, pending_changes
+
 
 DEFAULT_KEY_FILE = Path.home() / ".lastfm_genre_tagger" / "api_key.enc"
-DEFAULT_CACHE_FILE = Path.home() / ".lastfm_genre_tagger" / "capitalization_cache.json"
+DEFAULT_CACHE_FILE = Path.home() / ".lastfm_genre_tagger" / "capitalization_cache.sqlite"
 DEFAULT_LOG_FILE = "capitalization_skipped.log"
 PBKDF2_ITERATIONS = 480_000
 
@@ -116,7 +160,9 @@ VALID_FIELDS = {"title", "artist", "album", "tracknumber"}
 DEFAULT_FIELDS = "title,artist,album,tracknumber"
 
 MULTI_ARTIST_SEPARATOR = "; "
-TRACKLIST_RANK_SIMILARITY_THRESHOLD = 0.6
+TRACKLIST_RANK_SIMILARITY_THRESHOLD = 0.6   # same track number on Last.fm
+TRACKLIST_SIMILARITY_THRESHOLD = 0.85       # different track number
+TRACKLIST_RANK_BONUS = 0.1                  # added to the score of same-number pairs when assigning
 
 
 class QuitRequested(Exception):
@@ -202,56 +248,186 @@ def unlock_api_key(path: Path) -> str:
 # Persistent cache (Last.fm results + approval decisions)
 # --------------------------------------------------------------------------
 
-def _tuplify(obj):
-    """Recursively turn JSON-decoded lists back into hashable tuples (for dict keys)."""
-    if isinstance(obj, list):
-        return tuple(_tuplify(x) for x in obj)
-    return obj
-
-
 CACHE_NAMES = ("artist_cache", "album_cache", "track_cache", "album_info_cache",
                "tracklist_cache", "tracknumber_decisions")
 
+# First bytes of every SQLite database file.
+SQLITE_HEADER = b"SQLite format 3\x00"
 
-def load_caches(path: Path):
-    caches = {name: {} for name in CACHE_NAMES}
-    if not path.is_file():
-        return caches
-    try:
-        with path.open("r", encoding="utf-8") as f:
-            raw = json.load(f)
-    except (OSError, ValueError) as e:
-        tqdm.write(f"[WARN] Could not read cache file {path} ({e}); starting with an empty cache.")
-        return caches
 
-    for name in CACHE_NAMES:
-        for key, value in raw.get(name, []):
-            caches[name][_tuplify(key)] = value
+def _encode_key(key):
+    """Tuple keys are stored as JSON arrays, string keys as JSON strings."""
+    return json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+
+
+_MISSING = object()
+
+
+class CacheTable:
+    """
+    One of the named caches, looked up like a dict. Entries are read from
+    the store the first time they're asked for and kept in memory after
+    that; a new entry is written to the store straight away (committed at
+    the next checkpoint), so nothing is ever re-serialized.
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self._known = {}
+
+    def _lookup(self, key):
+        if key not in self._known:
+            self._known[key] = self.store.fetch(self.name, key)
+        return self._known[key]
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
 
-    total = sum(len(d) for d in caches.values())
-    if total:
-        tqdm.write(f"Loaded {total} cached Last.fm result(s)/decision(s) from {path}")
-    return caches
+    def __setitem__(self, key, value):
+        self._known[key] = value
+        self.store.store(self.name, key, value)
 
+    def setdefault(self, key, value):
+        if key not in self:
+            self[key] = value
+        return self[key]
 
-def save_caches(path: Path, caches: dict):
+
+class CacheStore:
+    """
+    SQLite store of Last.fm results + approval decisions, one row per
+    (cache name, key). Opening it and checkpointing cost the same however
+    big it's grown: nothing is loaded up front (see CacheTable) and
+    commit() only writes the rows added since the last one. cache_file=None
+    keeps everything in memory for this run (--no-cache).
+
+    A capitalization_cache.json left by an older version of this script
+    (legacy_file; by default the .json next to cache_file) is imported the
+    first time and renamed to .json.bak.
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE, legacy_file=None):
+        if cache_file is None:
+            self.path = ":memory:"
+        else:
+            cache_file = Path(cache_file).expanduser()
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            self.path = str(cache_file)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            " cache TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " PRIMARY KEY (cache, key))"
+        )
+        self.conn.commit()
+        self.tables = {name: CacheTable(self, name) for name in CACHE_NAMES}
+        self.loaded = 0
+        self.added = 0
+        if cache_file is not None:
+            self._migrate_json(Path(legacy_file) if legacy_file else cache_file.with_suffix(".json"))
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def fetch(self, name, key):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM decisions WHERE cache = ? AND key = ?",
+                                    (name, _encode_key(key))).fetchone()
+            if row is None:
+                return _MISSING
+            self.loaded += 1
+        return json.loads(row[0])
+
+    def store(self, name, key, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO decisions (cache, key, value) VALUES (?, ?, ?)",
+                              (name, _encode_key(key), json.dumps(value, ensure_ascii=False)))
+            self.added += 1
+
+    def commit(self):
+        with self._lock:
+            try:
+                self.conn.commit()
+            except sqlite3.Error as e:
+                tqdm.write(f"[WARN] Could not save cache to {self.path}: {e}")
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def _migrate_json(self, json_path: Path):
+        if json_path == Path(self.path) or not json_path.is_file():
+            return
+        try:
+            with json_path.open("r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as e:
+            tqdm.write(f"[WARN] Could not read old cache file {json_path} ({e}); not imported.")
+            return
+        rows = [(name, _encode_key(key), json.dumps(value, ensure_ascii=False))
+                for name in CACHE_NAMES for key, value in raw.get(name, [])]
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO decisions (cache, key, value) VALUES (?, ?, ?)", rows)
+        json_path.replace(json_path.with_name(json_path.name + ".bak"))
+        tqdm.write(f"Imported {len(rows)} cached result(s)/decision(s) from {json_path} into {self.path}")
+
+    def describe(self):
+        return (f"Cache: {self.loaded} earlier result(s)/decision(s) reused, {self.added} new one(s) "
+                f"saved to {self.path}.")
+
+
+def _is_sqlite(path: Path):
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        data = {name: list(caches[name].items()) for name in CACHE_NAMES}
-        tmp_path = path.with_suffix(path.suffix + ".tmp")
-        with tmp_path.open("w", encoding="utf-8") as f:
-            json.dump(data, f)
-        tmp_path.replace(path)
-    except OSError as e:
-        tqdm.write(f"[WARN] Could not save cache to {path}: {e}")
+        with path.open("rb") as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+
+def resolve_cache_file(cache_file):
+    """
+    (SQLite cache file, old JSON cache to import) for --cache-file. Given an
+    older version's capitalization_cache.json -- or any existing file that
+    isn't a SQLite database -- the cache goes in the .sqlite file next to it
+    and the old file is imported into that. Exits if that would be the same
+    file.
+    """
+    path = Path(cache_file).expanduser()
+    if path.suffix != ".json" and (not path.is_file() or path.stat().st_size == 0 or _is_sqlite(path)):
+        return path, path.with_suffix(".json")
+    sqlite_path = path.with_suffix(".sqlite")
+    if sqlite_path == path:
+        tqdm.write(f"Error: cache file '{path}' isn't a SQLite database. "
+                   f"Move it aside or pass a different --cache-file.")
+        sys.exit(1)
+    tqdm.write(f"'{path}' is an old-style JSON cache; using '{sqlite_path}' instead.")
+    return sqlite_path, path
 
 
 # --------------------------------------------------------------------------
 # FLAC scanning
 # --------------------------------------------------------------------------
 
-def find_flac_files(root: Path):
-    yield from root.rglob("*.flac")
+def find_flac_files(root: Path, index_file=DEFAULT_INDEX_FILE):
+    """Recursively yield all .flac files under root. Folders that haven't
+    changed since the last run aren't re-listed (see library_walk.py)."""
+    for path in walk_files(root, index_file):
+        if path.endswith(".flac"):
+            yield Path(path)
 
 
 def get_tag(audio: FLAC, key: str) -> Optional[str]:
@@ -260,9 +436,9 @@ def get_tag(audio: FLAC, key: str) -> Optional[str]:
 
 
 class TrackInfo:
-    __slots__ = ("path", "title", "artist", "albumartist", "album", "trackno_raw", "tracktotal_raw")
+    __slots__ = ("path", "title", "artist", "albumartist", "album", "trackno_raw", "tracktotal_raw", "tags")
 
-    def __init__(self, path, title, artist, albumartist, album, trackno_raw, tracktotal_raw):
+    def __init__(self, path, title, artist, albumartist, album, trackno_raw, tracktotal_raw, tags=None):
         self.path = path
         self.title = title
         self.artist = artist
@@ -270,6 +446,7 @@ class TrackInfo:
         self.album = album
         self.trackno_raw = trackno_raw
         self.tracktotal_raw = tracktotal_raw
+        self.tags = tags if tags is not None else {}
 
     def album_key(self):
         """Grouping key for tracklist/track-count lookups: (artist_lower, album_lower)."""
@@ -279,24 +456,43 @@ class TrackInfo:
         return (context_artist.lower(), self.album.lower())
 
 
-def scan_tracks(root: Path):
+def scan_tracks(root: Path, index_file=DEFAULT_INDEX_FILE, workers=DEFAULT_WORKERS, overlay=None,
+                order="path", use_daemon=False):
+    """
+    Read every FLAC under root into TrackInfo records, sorted by path.
+    Tags come from the shared library index (library_index.py), so only
+    files changed since the last run are re-read, `workers` at a time;
+    index_file=None skips the on-disk index. overlay: pending plan changes
+    (tag_plan.pending_changes) to read on top of the files' tags.
+    order: read order for changed files (library_scan.order_paths).
+    use_daemon: try a running library_daemon.py first (see scan_albums in
+    the genre tagger).
+    """
     tracks = []
     unreadable = []
-    for flac_path in find_flac_files(root):
-        try:
-            audio = FLAC(flac_path)
-        except Exception as e:
-            tqdm.write(f"  [WARN] Could not read {flac_path}: {e}")
-            unreadable.append(flac_path)
-            continue
+    found = daemon_records(root, overlay=overlay) if use_daemon else None
+    if found is not None:
+        records, failed = found
+        tqdm.write(f"Library daemon: {len(records)} file(s) served from memory.")
+    else:
+        with LibraryIndex(index_file) as index:
+            records, failed = index.scan(find_flac_files(root, index_file), root=root, workers=workers,
+                                         overlay=overlay, order=order)
+            tqdm.write(index.describe())
+    for flac_path, e in failed:
+        tqdm.write(f"  [WARN] Could not read {flac_path}: {e}")
+        unreadable.append(flac_path)
+    for rec in records:
+        tags = rec.tags
         tracks.append(TrackInfo(
-            path=flac_path,
-            title=get_tag(audio, "title"),
-            artist=get_tag(audio, "artist"),
-            albumartist=get_tag(audio, "albumartist"),
-            album=get_tag(audio, "album"),
-            trackno_raw=get_tag(audio, "tracknumber"),
-            tracktotal_raw=get_tag(audio, "tracktotal") or get_tag(audio, "totaltracks"),
+            path=rec.path,
+            title=get_tag(tags, "title"),
+            artist=get_tag(tags, "artist"),
+            albumartist=get_tag(tags, "albumartist"),
+            album=get_tag(tags, "album"),
+            trackno_raw=get_tag(tags, "tracknumber"),
+            tracktotal_raw=get_tag(tags, "tracktotal") or get_tag(tags, "totaltracks"),
+            tags=tags,
         ))
     return tracks, unreadable
 
@@ -321,19 +517,14 @@ def primary_artist(raw: Optional[str]) -> Optional[str]:
 
 def _lastfm_request(params: dict, label: str):
     try:
-        resp = requests.get(LASTFM_API_URL, params=params, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
+        return get_client().get(params)
+    except LastFmError as e:
+        tqdm.write(f"    [ERROR] Last.fm API error for '{label}': {e.message}")
     except requests.RequestException as e:
         tqdm.write(f"    [ERROR] Last.fm request failed for '{label}': {e}")
-        return None
     except ValueError:
         tqdm.write(f"    [ERROR] Bad JSON from Last.fm for '{label}'")
-        return None
-    if "error" in data:
-        tqdm.write(f"    [ERROR] Last.fm API error for '{label}': {data.get('message')}")
-        return None
-    return data
+    return None
 
 
 def _as_list(value):
@@ -381,7 +572,7 @@ def search_track_candidates(api_key: str, artist: str, title: str):
     return out
 
 
-def get_album_info(api_key: str, artist: str, album: str, cache: dict, delay: float):
+def get_album_info(api_key: str, artist: str, album: str, cache: dict):
     """
     Fetch album.getInfo for (artist, album). Cached by (artist.lower(), album.lower()).
     Returns {"name","listeners","tracks":[(num_or_None,name),...]} or None.
@@ -394,7 +585,6 @@ def get_album_info(api_key: str, artist: str, album: str, cache: dict, delay: fl
         {"method": "album.getinfo", "artist": artist, "album": album, "api_key": api_key, "format": "json"},
         f"album.getinfo:{artist} - {album}",
     )
-    time.sleep(delay)
 
     if not data:
         cache[key] = None
@@ -422,7 +612,7 @@ def get_album_info(api_key: str, artist: str, album: str, cache: dict, delay: fl
     return result
 
 
-def search_album_candidates(api_key: str, artist: str, album: str, album_info_cache: dict, delay: float):
+def search_album_candidates(api_key: str, artist: str, album: str, album_info_cache: dict):
     data = _lastfm_request(
         {"method": "album.search", "album": album, "api_key": api_key, "format": "json", "limit": 30},
         f"album.search:{artist} - {album}",
@@ -446,13 +636,13 @@ def search_album_candidates(api_key: str, artist: str, album: str, album_info_ca
 
     out = []
     for name, m_artist in pairs:
-        info = get_album_info(api_key, m_artist, name, album_info_cache, delay)
+        info = get_album_info(api_key, m_artist, name, album_info_cache)
         out.append((name, info["listeners"] if info else 0))
     return out
 
 
 def get_tracklist_for_album(api_key: str, album_artist_query: str, album_context_artist: str, album_name: str,
-                             album_info_cache: dict, tracklist_cache: dict, delay: float):
+                             album_info_cache: dict, tracklist_cache: dict):
     """
     Fetch the Last.fm tracklist for an album, cached under the ORIGINAL
     (album_context_artist, album_name) as found in the file tags -- so
@@ -464,7 +654,7 @@ def get_tracklist_for_album(api_key: str, album_artist_query: str, album_context
     if key in tracklist_cache:
         return tracklist_cache[key]
 
-    info = get_album_info(api_key, album_artist_query, album_name, album_info_cache, delay)
+    info = get_album_info(api_key, album_artist_query, album_name, album_info_cache)
     tracks = info["tracks"] if info else []
     tracklist_cache[key] = tracks
     return tracks
@@ -716,25 +906,81 @@ def resolve(entity_type: str, key, original: str, cache: dict, fetch_fn, interac
     return chosen
 
 
-def match_title_in_tracklist(track_number: Optional[int], title: str, tracklist):
+def title_similarity(a: str, b: str) -> float:
+    """0..1 similarity of two lowercased titles (rapidfuzz if installed, else difflib)."""
+    if fuzz is not None:
+        return fuzz.ratio(a, b) / 100.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def _assign(scores):
+    """
+    Pairs (row, col) maximizing the total score of a rows x cols matrix,
+    each row and column used at most once: scipy's optimal assignment if
+    installed, else greedily, best pair first.
+    """
+    if not scores or not scores[0]:
+        return []
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(scores, maximize=True)
+        return list(zip(rows.tolist(), cols.tolist()))
+    pairs = sorted(((score, r, c) for r, row in enumerate(scores) for c, score in enumerate(row)), reverse=True)
+    used_rows, used_cols, out = set(), set(), []
+    for _, r, c in pairs:
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            out.append((r, c))
+    return out
+
+
+def match_album_tracklist(tracks, tracklist):
     """
-    Find this track's corrected title in an already-fetched album tracklist.
-    Exact case-insensitive name match is trusted outright. A track-number
-    match is only trusted if the candidate name is still reasonably similar
-    (guards against multi-disc/deluxe editions misaligning rank numbers).
+    Match a whole local album against its Last.fm tracklist in one go.
+    Returns {track.path: Last.fm name} for the tracks that could be matched.
+
+    Exact case-insensitive name matches are trusted outright. The rest of
+    the album is then assigned to the rest of the tracklist so the total
+    similarity is highest, each Last.fm track used once -- so two similar
+    titles can't both claim the same entry, and a title that moved
+    position (deluxe/multi-disc editions) still finds its match. An
+    assigned pair is only trusted if the names are similar enough:
+    TRACKLIST_RANK_SIMILARITY_THRESHOLD when the track numbers agree,
+    TRACKLIST_SIMILARITY_THRESHOLD when they don't.
     """
     if not tracklist:
-        return None
-    title_lower = title.lower()
+        return {}
+    by_name = {}
     for _, name in tracklist:
-        if name.lower() == title_lower:
-            return name
-    if track_number is not None:
-        for num, name in tracklist:
-            if num == track_number:
-                similarity = difflib.SequenceMatcher(None, title_lower, name.lower()).ratio()
-                return name if similarity >= TRACKLIST_RANK_SIMILARITY_THRESHOLD else None
-    return None
+        by_name.setdefault(name.lower(), name)
+
+    matches = {}
+    leftover = []
+    for t in tracks:
+        if not t.title:
+            continue
+        name = by_name.get(t.title.lower())
+        if name is not None:
+            matches[t.path] = name
+        else:
+            leftover.append(t)
+
+    taken = {name.lower() for name in matches.values()}
+    remaining = [(num, name) for num, name in tracklist if name.lower() not in taken]
+    if not leftover or not remaining:
+        return matches
+
+    numbers = [parse_n_m(t.trackno_raw, t.tracktotal_raw)[0] for t in leftover]
+    similarity = [[title_similarity(t.title.lower(), name.lower()) for _, name in remaining] for t in leftover]
+    scores = [[sim + (TRACKLIST_RANK_BONUS if n is not None and n == num else 0.0)
+               for sim, (num, _) in zip(row, remaining)]
+              for row, n in zip(similarity, numbers)]
+    for r, c in _assign(scores):
+        same_rank = numbers[r] is not None and numbers[r] == remaining[c][0]
+        threshold = TRACKLIST_RANK_SIMILARITY_THRESHOLD if same_rank else TRACKLIST_SIMILARITY_THRESHOLD
+        if similarity[r][c] >= threshold:
+            matches[leftover[r].path] = remaining[c][1]
+    return matches
 
 
 # --------------------------------------------------------------------------
@@ -779,6 +1025,93 @@ def show_diff(t: TrackInfo, updates: dict):
         tqdm.write(f"    {field_name}: {old_value!r} -> {new_value!r}")
 
 
+# --------------------------------------------------------------------------
+# Prefetch (all the network work, before any prompt)
+# --------------------------------------------------------------------------
+
+def title_cache_key(t: TrackInfo):
+    """track_cache key for a track's title (None if it has no title/artist)."""
+    if not t.title or not t.artist:
+        return None
+    context_artist = t.albumartist or t.artist
+    return (context_artist.lower(), t.title.lower())
+
+
+def prefetch_candidates(api_key: str, tracks, fields, caches, workers: int = DEFAULT_MAX_IN_FLIGHT):
+    """
+    Fetch, `workers` at a time (all still paced by the shared Last.fm
+    client), everything the per-track pass would otherwise ask for one
+    prompt at a time:
+      1. artist.search for every distinct artist part and album.search
+         (+ album.getInfo for each match) for every distinct album whose
+         decision isn't cached yet, plus every album's tracklist
+      2. track.search for every distinct title the tracklists don't cover
+    Tracklists/album info land in the caches as usual; search results are
+    returned as {(entity_type, cache_key): candidates}, for resolve() to use
+    in place of a request.
+    """
+    artist_cache, album_cache, track_cache = caches["artist_cache"], caches["album_cache"], caches["track_cache"]
+    album_info_cache, tracklist_cache = caches["album_info_cache"], caches["tracklist_cache"]
+    needs_tracklist = "title" in fields or "tracknumber" in fields
+
+    artist_jobs = {}
+    album_jobs = {}
+    for t in tracks:
+        if "artist" in fields:
+            for raw in (t.artist, t.albumartist):
+                for part in split_multi_artist(raw) if raw else ():
+                    if part.lower() not in artist_cache:
+                        artist_jobs.setdefault(part.lower(), part)
+        album_context_artist = t.albumartist or t.artist
+        if t.album and album_context_artist:
+            akey = (album_context_artist.lower(), t.album.lower())
+            wanted = ("album" in fields and akey not in album_cache) or (needs_tracklist and akey not in tracklist_cache)
+            if wanted and akey not in album_jobs:
+                album_jobs[akey] = (primary_artist(album_context_artist), album_context_artist, t.album)
+
+    def fetch_album(akey, lookup_artist, album_context_artist, album):
+        found = None
+        if "album" in fields and akey not in album_cache:
+            found = search_album_candidates(api_key, lookup_artist, album, album_info_cache)
+        if needs_tracklist:
+            get_tracklist_for_album(api_key, lookup_artist, album_context_artist, album,
+                                    album_info_cache, tracklist_cache)
+        return found
+
+    candidates = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(search_artist_candidates, api_key, part): ("artist", pkey)
+                   for pkey, part in artist_jobs.items()}
+        futures.update({pool.submit(fetch_album, akey, *job): ("album", akey) for akey, job in album_jobs.items()})
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Prefetch artists/albums",
+                           unit="lookup", leave=False):
+            found = future.result()
+            if found is not None:
+                candidates[futures[future]] = found
+
+        title_jobs = {}
+        if "title" in fields:
+            by_album = defaultdict(list)
+            for t in tracks:
+                by_album[t.album_key()].append(t)
+            for akey, group in by_album.items():
+                covered = match_album_tracklist(group, tracklist_cache.get(akey, [])) if akey is not None else {}
+                for t in group:
+                    tkey = title_cache_key(t)
+                    if tkey is None or tkey in track_cache or tkey in title_jobs or t.path in covered:
+                        continue
+                    title_jobs[tkey] = (primary_artist(t.albumartist or t.artist), t.title)
+        futures = {pool.submit(search_track_candidates, api_key, *job): ("title", tkey)
+                   for tkey, job in title_jobs.items()}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Prefetch titles", unit="lookup",
+                           leave=False):
+            candidates[futures[future]] = future.result()
+
+    tqdm.write(f"Prefetched {len(artist_jobs)} artist(s), {len(album_jobs)} album(s) and {len(title_jobs)} "
+               f"title(s) not covered by a tracklist.")
+    return candidates
+
+
 # --------------------------------------------------------------------------
 # Main
 # --------------------------------------------------------------------------
@@ -795,8 +1128,17 @@ def main():
                          help=f"Path to the encrypted API key file (default: {DEFAULT_KEY_FILE})")
     parser.add_argument("--fields", type=str, default=DEFAULT_FIELDS,
                          help=f"Comma-separated subset of: title,artist,album,tracknumber (default: {DEFAULT_FIELDS})")
-    parser.add_argument("--delay", type=float, default=0.25,
-                         help="Seconds to wait between Last.fm requests. Default 0.25")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                         help=f"Maximum Last.fm requests per second; requests only wait once this budget is "
+                              f"spent (default: {DEFAULT_RATE})")
+    parser.add_argument("--prefetch-workers", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                         help="Before the first prompt, look every distinct artist, album and title up "
+                              "this many at a time, so the review pass runs from memory "
+                              f"(default: {DEFAULT_MAX_IN_FLIGHT}; 0 = look each up when it's reached)")
+    parser.add_argument("--offline", action="store_true",
+                         help="Never contact Last.fm (and don't ask for the API key password): use only "
+                              "cached decisions and cached Last.fm replies. Anything not cached is left "
+                              "as it is, and undecided, for a later online run")
     parser.add_argument("--no-prompt", action="store_true",
                          help="Never pause for disambiguation or unmatched entries; auto-pick the "
                               "entry with the most listeners and leave unmatched tags untouched.")
@@ -811,6 +1153,30 @@ def main():
                          help="Don't load or save the persistent cache for this run.")
     parser.add_argument("--clear-cache", action="store_true",
                          help="Delete the cache file before running (forces everything to be re-resolved).")
+    parser.add_argument("--response-cache", type=str, default=str(DEFAULT_RESPONSE_CACHE),
+                         help=f"On-disk cache of raw Last.fm replies, shared with the genre tagger "
+                              f"(default: {DEFAULT_RESPONSE_CACHE})")
+    parser.add_argument("--no-response-cache", action="store_true",
+                         help="Don't read or write the raw Last.fm response cache.")
+    parser.add_argument("--index-file", type=str, default=str(DEFAULT_INDEX_FILE),
+                         help=f"Shared library index, so unchanged files aren't re-read (default: {DEFAULT_INDEX_FILE})")
+    parser.add_argument("--no-index", action="store_true",
+                         help="Don't read or update the on-disk library index; read every file fresh.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                         help=f"Parallel file reads while scanning (default: {DEFAULT_WORKERS}; 1 = no pool)")
+    parser.add_argument("--scan-order", choices=SCAN_ORDERS, default="path",
+                         help="Order to read changed files in: path (default), inode, or physical (disk offset "
+                              "via FIEMAP, falling back to inode). inode/physical cut seeking on a spinning "
+                              "disk; pair them with a low --workers")
+    parser.add_argument("--no-daemon", action="store_true",
+                         help="Don't ask a running library_daemon.py for the library's tags; always scan.")
+    parser.add_argument("--padding-reserve", type=int, default=DEFAULT_PADDING_RESERVE,
+                         help="Bytes of FLAC padding to add whenever a tag edit forces a full-file rewrite, "
+                              f"so later edits are written in place (default: {DEFAULT_PADDING_RESERVE})")
+    parser.add_argument("--plan", type=str, default=None,
+                         help="Don't write any files; append every approved change to this plan file instead, "
+                              "to be written later with 'python tag_plan.py apply PLAN'. Changes other tools "
+                              "already planned there are read on top of the files' tags")
     parser.add_argument("--log-file", type=str, default=DEFAULT_LOG_FILE,
                          help=f"Where to write a summary of items that couldn't be auto-fixed (default: {DEFAULT_LOG_FILE})")
     parser.add_argument("--no-log", action="store_true", help="Don't write the skipped-items log file.")
@@ -828,20 +1194,27 @@ def main():
     if args.set_api_key:
         setup_api_key(key_path)
         sys.exit(0)
-    api_key = unlock_api_key(key_path)
+    api_key = None if args.offline else unlock_api_key(key_path)
+    started = time.monotonic()
+    response_cache = None if args.no_response_cache else ResponseCache(args.response_cache)
+    get_client(api_key, rate=args.rate, cache=response_cache, offline=args.offline)
 
     root = Path(args.folder).expanduser().resolve()
     if not root.is_dir():
         tqdm.write(f"Error: '{root}' is not a valid directory.")
         sys.exit(1)
 
-    cache_path = Path(args.cache_file).expanduser()
+    cache_path, legacy_cache_path = resolve_cache_file(args.cache_file)
     if args.clear_cache and cache_path.is_file():
         cache_path.unlink()
+        legacy_cache_path.unlink(missing_ok=True)
         tqdm.write(f"Cleared cache: {cache_path}")
 
     tqdm.write(f"Scanning '{root}' for FLAC files...")
-    tracks, unreadable = scan_tracks(root)
+    index_file = None if args.no_index else Path(args.index_file).expanduser()
+    pending = pending_changes(args.plan) if args.plan else None
+    tracks, unreadable = scan_tracks(root, index_file=index_file, workers=args.workers, overlay=pending,
+                                     order=args.scan_order, use_daemon=not args.no_daemon)
     if not tracks:
         tqdm.write("No readable FLAC files found. Nothing to do.")
         sys.exit(0)
@@ -873,10 +1246,7 @@ def main():
     album_counts = Counter(t.album_key() for t in tracks if t.album_key() is not None)
 
     # --- Caches ---
-    if args.no_cache:
-        caches = {name: {} for name in CACHE_NAMES}
-    else:
-        caches = load_caches(cache_path)
+    caches = CacheStore(None if args.no_cache else cache_path, legacy_cache_path)
     artist_cache = caches["artist_cache"]
     album_cache = caches["album_cache"]
     track_cache = caches["track_cache"]
@@ -884,16 +1254,13 @@ def main():
     tracklist_cache = caches["tracklist_cache"]
     tracknumber_decisions = caches["tracknumber_decisions"]
 
-    def persist():
-        if not args.no_cache:
-            save_caches(cache_path, caches)
-
     if args.dry_run or args.auto_apply:
         review_state = {"mode": "all"}
     else:
         review_state = {"mode": "ask"}
 
     skipped_log = []
+    write_stats = WriteStats()
     changed_files = 0
     changed_fields = 0
     track_search_calls_saved = 0
@@ -902,9 +1269,37 @@ def main():
     if args.dry_run:
         tqdm.write("\n--- DRY RUN: no files will be modified, everything will be shown ---")
 
+    plan = TagPlan(args.plan, source="capitalisation_fixer") if args.plan and not args.dry_run else None
+    if plan is not None:
+        tqdm.write(f"\n--- PLAN MODE: changes are recorded to '{plan.path}', no files will be modified ---")
+
     quit_early = False
+    prefetched = {}
+    lookup_counts = Counter()
+    tracklist_matches = {}
+
+    def candidates_for(entity_type, key, fetch):
+        found = prefetched.get((entity_type, key))
+        return found if found is not None else fetch()
+
+    def lookup(cache, key, fetch, default=None):
+        """Run one resolve/tracklist lookup, counting whether its cache
+        already had the answer. With --offline, a lookup that would need a
+        request leaves the tag alone and decides nothing."""
+        lookup_counts["cached" if key in cache else "looked up"] += 1
+        try:
+            return fetch()
+        except NotCached:
+            lookup_counts["not cached"] += 1
+            return default
+
+    if args.offline:
+        tqdm.write("\n--- OFFLINE: only cached decisions and Last.fm replies are used ---")
 
     try:
+        if args.prefetch_workers > 0 and not args.offline:
+            prefetched = prefetch_candidates(api_key, tracks, fields, caches, workers=args.prefetch_workers)
+
         for idx, t in enumerate(tqdm(tracks, desc="Tracks", unit="file"), start=1):
             updates = {}
             album_context_artist = t.albumartist or t.artist
@@ -920,14 +1315,14 @@ def main():
                     any_change = False
                     for part in parts:
                         pkey = part.lower()
-                        corrected = resolve(
+                        corrected = lookup(artist_cache, pkey, lambda: resolve(
                             "artist", pkey, part, artist_cache,
-                            fetch_fn=lambda p=part: search_artist_candidates(api_key, p),
+                            fetch_fn=lambda: candidates_for(
+                                "artist", pkey, lambda: search_artist_candidates(api_key, part)),
                             interactive=not args.no_prompt, skipped_log=skipped_log, review_state=review_state,
                             seed_ctx=(t, album_context_artist, artist_cache, album_cache, track_cache),
                             usage_count=artist_part_counts.get(pkey, 0),
-                        )
-                        time.sleep(args.delay)
+                        ))
                         corrected_parts.append(corrected if corrected else part)
                         if corrected and corrected != part:
                             any_change = True
@@ -938,42 +1333,51 @@ def main():
 
             # --- ALBUM ---
             corrected_album = None
-            tracklist = []
+            title_matches = {}
             if t.album and album_context_artist:
                 if "album" in fields:
                     akey = (album_context_artist.lower(), t.album.lower())
-                    corrected_album = resolve(
+                    corrected_album = lookup(album_cache, akey, lambda: resolve(
                         "album", akey, t.album, album_cache,
-                        fetch_fn=lambda: search_album_candidates(api_key, lookup_artist, t.album, album_info_cache, args.delay),
+                        fetch_fn=lambda: candidates_for("album", akey, lambda: search_album_candidates(
+                            api_key, lookup_artist, t.album, album_info_cache)),
                         interactive=not args.no_prompt, skipped_log=skipped_log, review_state=review_state,
                         seed_ctx=(t, album_context_artist, artist_cache, album_cache, track_cache),
                         context_artist=album_context_artist,
                         usage_count=album_counts.get(t.album_key(), 0),
-                    )
-                    time.sleep(args.delay)
+                    ))
                     if corrected_album and corrected_album != t.album:
                         updates["album"] = corrected_album
 
                 if needs_tracklist:
                     effective_album = corrected_album or t.album
-                    tracklist = get_tracklist_for_album(
-                        api_key, lookup_artist, album_context_artist, t.album, album_info_cache, tracklist_cache, args.delay
-                    )
+                    tracklist_album = t.album
+                    tracklist = lookup(tracklist_cache, t.album_key(), lambda: get_tracklist_for_album(
+                        api_key, lookup_artist, album_context_artist, t.album, album_info_cache, tracklist_cache
+                    ), default=[])
                     if not tracklist and effective_album != t.album:
-                        tracklist = get_tracklist_for_album(
-                            api_key, lookup_artist, album_context_artist, effective_album,
-                            album_info_cache, tracklist_cache, args.delay
-                        )
+                        tracklist_album = effective_album
+                        tracklist = lookup(
+                            tracklist_cache, (album_context_artist.lower(), effective_album.lower()),
+                            lambda: get_tracklist_for_album(api_key, lookup_artist, album_context_artist,
+                                                            effective_album, album_info_cache, tracklist_cache),
+                            default=[])
+                    # The whole album is matched against its tracklist once,
+                    # the first time one of its tracks gets here.
+                    mkey = (t.album_key(), tracklist_album.lower())
+                    if mkey not in tracklist_matches:
+                        tracklist_matches[mkey] = match_album_tracklist(album_groups[t.album_key()], tracklist)
+                    title_matches = tracklist_matches[mkey]
 
             # --- TITLE ---
             if "title" in fields and t.title and t.artist:
-                tkey = (album_context_artist.lower() if album_context_artist else t.artist.lower(), t.title.lower())
+                tkey = title_cache_key(t)
 
                 if tkey in track_cache:
+                    lookup_counts["cached"] += 1
                     corrected_title = track_cache[tkey]
                 else:
-                    trackno_n, _ = parse_n_m(t.trackno_raw, t.tracktotal_raw)
-                    tl_match = match_title_in_tracklist(trackno_n, t.title, tracklist)
+                    tl_match = title_matches.get(t.path)
 
                     if tl_match:
                         track_search_calls_saved += 1
@@ -988,14 +1392,14 @@ def main():
                             if corrected_title is None:
                                 skipped_log.append(("title", t.title, "user declined automatic correction"))
                     else:
-                        corrected_title = resolve(
+                        corrected_title = lookup(track_cache, tkey, lambda: resolve(
                             "title", tkey, t.title, track_cache,
-                            fetch_fn=lambda: search_track_candidates(api_key, lookup_artist, t.title),
+                            fetch_fn=lambda: candidates_for("title", tkey, lambda: search_track_candidates(
+                                api_key, lookup_artist, t.title)),
                             interactive=not args.no_prompt, skipped_log=skipped_log, review_state=review_state,
                             seed_ctx=(t, album_context_artist, artist_cache, album_cache, track_cache),
                             context_artist=lookup_artist,
-                        )
-                        time.sleep(args.delay)
+                        ))
 
                 if corrected_title and corrected_title != t.title:
                     updates["title"] = corrected_title
@@ -1033,17 +1437,20 @@ def main():
                 changed_files += 1
                 changed_fields += len(updates)
                 show_diff(t, updates)
-                if not args.dry_run:
+                if plan is not None:
+                    for field_name, new_value in updates.items():
+                        plan.add(t.path, field_name, t.tags.get(field_name), [new_value])
+                elif not args.dry_run:
                     try:
                         audio = FLAC(t.path)
                         for field_name, new_value in updates.items():
                             audio[field_name] = [new_value]
-                        audio.save()
+                        save_flac(audio, args.padding_reserve, write_stats)
                     except Exception as e:
                         tqdm.write(f"    [ERROR] Failed to write tags to {t.path}: {e}")
 
             if idx % 50 == 0:
-                persist()
+                caches.commit()
 
     except QuitRequested:
         tqdm.write("\nStopping here (quit requested); nothing further will be changed.")
@@ -1052,14 +1459,31 @@ def main():
         tqdm.write("\nInterrupted; progress so far is saved to the cache.")
         quit_early = True
     finally:
-        persist()
+        caches.close()
+        if plan is not None:
+            plan.close()
 
     tqdm.write(f"\n{changed_files} file(s) had {changed_fields} tag(s) corrected.")
+    if plan is not None:
+        tqdm.write(f"{plan.added} change(s) recorded. Apply them with: python tag_plan.py apply '{plan.path}'")
+    elif not args.dry_run and changed_files:
+        tqdm.write(write_stats.summary())
+    tqdm.write(get_client().describe())
     if track_search_calls_saved:
-        tqdm.write(f"({track_search_calls_saved} track title(s) matched directly from album tracklists, "
-                    f"skipping an individual lookup for each.)")
+        matcher = (f"{'rapidfuzz' if fuzz is not None else 'difflib'} similarity, "
+                   f"{'optimal' if linear_sum_assignment is not None else 'greedy'} assignment")
+        tqdm.write(f"({track_search_calls_saved} track title(s) matched directly from album tracklists "
+                    f"({matcher}), skipping an individual lookup for each.)")
     if not args.no_cache:
-        tqdm.write(f"Cache saved to: {cache_path}")
+        tqdm.write(caches.describe())
+    total_lookups = lookup_counts["cached"] + lookup_counts["looked up"]
+    if total_lookups:
+        summary = (f"{lookup_counts['cached']} of {total_lookups} lookup(s) answered from the cache, "
+                   f"{get_client().requests} Last.fm request(s) sent")
+        if lookup_counts["not cached"]:
+            summary += f", {lookup_counts['not cached']} left undecided (not cached, offline)"
+        tqdm.write(summary + ".")
+    tqdm.write(f"Finished in {time.monotonic() - started:.1f}s.")
 
     if skipped_log:
         tqdm.write(f"{len(skipped_log)} item(s) could not be auto-corrected (see log for details).")
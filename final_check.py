@@ -1,18 +1,16 @@
 import os
 import readline
-from mutagen.flac import FLAC
 import re
 import unicodedata
 
-def get_flacs(directory):
-    """Get all FLAC files in a directory and their tags."""
-    flac_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".flac"):
-                full_path = os.path.join(root, file)
-                flac_files.append(full_path)
-    return flac_files
+from library_daemon import daemon_records
+from library_index import DEFAULT_INDEX_FILE, LibraryIndex
+from library_walk import walk_files
+
+def get_flacs(directory, index_file=DEFAULT_INDEX_FILE):
+    """Get all FLAC files in a directory (unchanged folders come from the
+    directory cache, see library_walk.py)."""
+    return [path for path in walk_files(directory, index_file) if path.endswith(".flac")]
 
 def normalize(s):
     return unicodedata.normalize("NFKC", s).strip().lower()
@@ -32,16 +30,27 @@ def ask_skip(message):
     response = input(f"{message}\nSkip this check for this file? (y/n): ").strip().lower()
     return response == "y"
 
-def confirm_and_move(directory, new_directory):
-    flacs = get_flacs(directory)
+def confirm_and_move(directory, new_directory, index_file=DEFAULT_INDEX_FILE, use_daemon=True):
+    # Tags/pictures come from a running library_daemon.py if there is one,
+    # otherwise from the shared library index, so files already checked on
+    # a previous run aren't re-parsed.
+    found = daemon_records(directory, path_type=str) if use_daemon else None
+    if found is not None:
+        records, unreadable = found
+    else:
+        with LibraryIndex(index_file) as index:
+            records, unreadable = index.scan(get_flacs(directory, index_file), root=directory)
+    for flac, e in unreadable:
+        print(f"⚠️ Could not read {flac}: {e}")
     required_tags = [
         "artist", "title", "album", "date", "lyrics",
         "albumartist", "replaygain_album_gain", "replaygain_album_peak",
         "replaygain_track_gain", "replaygain_track_peak"
     ]
 
-    for flac in flacs:
-        audio_file = FLAC(flac)
+    for rec in records:
+        flac = rec.path
+        audio_file = rec.tags
         print(f"\nChecking: {flac}")
 
         # --- Check for missing tags ---
@@ -88,7 +97,7 @@ def confirm_and_move(directory, new_directory):
                 continue
 
         # --- Album image check ---
-        if not audio_file.pictures:
+        if not rec.pictures:
             msg = f"No album image for {os.path.basename(flac)}."
             if not ask_skip(msg):
                 print("Skipping file.")
@@ -3,14 +3,14 @@ import readline
 import re
 from mutagen.flac import FLAC
 
+from flac_writer import save_flac
+from library_walk import walk_files
+from tag_plan import TagPlan, pending_changes
+
 def get_flacs(directory):
-    """Get all FLAC files in a directory and their tags."""
-    flac_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith(".flac"):
-                flac_files.append(os.path.join(root, file))
-    return flac_files
+    """Get all FLAC files in a directory (unchanged folders come from the
+    directory cache, see library_walk.py)."""
+    return [path for path in walk_files(directory) if path.lower().endswith(".flac")]
 
 def sanitize_filename(filename):
     """Remove or replace characters that are invalid in Windows filenames."""
@@ -27,8 +27,25 @@ def confirm(prompt):
     choice = input(f"{prompt} (y/n): ").strip().lower()
     return choice == 'y'
 
-def fix_tags(directory):
-    flacs = get_flacs(directory)
+def fix_tags(directory, plan_file=None):
+    """
+    Interactively fix the Stage 1 tagging rules and file names.
+    With plan_file, tag fixes are recorded to that tag plan (see
+    tag_plan.py) instead of saved, so later stages sharing the plan can
+    add theirs and each file is written once; renames still happen
+    immediately and are recorded in the plan.
+    """
+    flacs = get_flacs(os.path.abspath(directory) if plan_file else directory)
+    plan = TagPlan(plan_file, source="fix_tags") if plan_file else None
+    pending = pending_changes(plan_file) if plan_file else {}
+    try:
+        _fix_tags(flacs, plan, pending)
+    finally:
+        if plan is not None:
+            plan.close()
+            print(f"\n{plan.added} change(s) recorded. Apply them with: python tag_plan.py apply '{plan.path}'")
+
+def _fix_tags(flacs, plan, pending):
     required_tags = ["artist", "title", "album", "date", "albumartist"]
     
     # Dictionary to store user preferences for artist formatting
@@ -42,6 +59,14 @@ def fix_tags(directory):
         print(f"\n[{idx}/{total}] 🎧 Checking: {flac}")
         audio_file = FLAC(flac)
         updated = False
+        if plan is not None:
+            # Start from what earlier runs/stages already planned.
+            for field, values in pending.get(flac, {}).items():
+                if values is None:
+                    audio_file.pop(field, None)
+                else:
+                    audio_file[field] = values
+            before = audio_file.tags.as_dict() if audio_file.tags else {}
 
         # Fill missing tags
         for tag in required_tags:
@@ -116,8 +141,11 @@ def fix_tags(directory):
                 audio_file["album"] = [new_album]
                 updated = True
 
-        if updated:
-            audio_file.save()
+        final_path = flac
+        if updated and plan is not None:
+            print(f"📝 Tag changes planned for: {flac}")
+        elif updated:
+            save_flac(audio_file)
             print(f"✅ Tags updated for: {flac}")
         else:
             print(f"✔ No tag changes needed for: {flac}")
@@ -153,13 +181,23 @@ def fix_tags(directory):
                 new_path = os.path.join(os.path.dirname(flac), expected_name)
                 try:
                     os.rename(flac, new_path)
+                    final_path = new_path
                     print(f"✅ Renamed to: {expected_name}")
                 except FileExistsError:
                     alt_name = expected_name.replace('.flac', ' (1).flac')
-                    os.rename(flac, os.path.join(os.path.dirname(flac), alt_name))
+                    final_path = os.path.join(os.path.dirname(flac), alt_name)
+                    os.rename(flac, final_path)
                     print(f"⚠️ File exists. Saved as: {alt_name}")
         else:
             print(f"✔ Filename already correct: {current_name}")
 
+        if plan is not None:
+            if final_path != flac and flac in pending:
+                plan.move(flac, final_path)
+            if updated:
+                after = audio_file.tags.as_dict()
+                for field in sorted(set(before) | set(after)):
+                    plan.add(final_path, field, before.get(field), after.get(field))
+
 if __name__ == "__main__":
     fix_tags("/home/adam/driveBig/Music/New unformated songs")
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""
+flac_meta.py
+
+Fast, metadata-only FLAC reader.
+
+mutagen.flac.FLAC() turns every metadata block into Python objects on
+load -- including the ~2 MB front cover and the artist image that
+image_fixer.py guarantees are in every file -- even when the caller only
+wants ALBUM/ARTIST/TITLE. This instead memory-maps the file, walks the
+metadata block headers, and decodes only the block types asked for.
+PICTURE blocks are never copied: each one comes back as a PictureRef
+holding its type, mime, width, height and the (offset, length) of the
+image bytes inside the file. Its .data is a memoryview over the mapping,
+so the payload is only paged in from disk if something actually touches
+it (hashing it, writing it somewhere, ...).
+
+Usage:
+
+    from flac_meta import read_flac_metadata, VORBIS_COMMENT
+
+    with read_flac_metadata(path, blocks={VORBIS_COMMENT}) as meta:
+        album = meta.tags.get("album", [None])[0]
+
+meta.tags has the same {lowercased_key: [value, ...]} shape as a mutagen
+FLAC object / library index record, so the tools' existing
+audio.get("album", [None])[0] helpers work on it unchanged.
+
+Memoryviews handed out by PictureRef.data are only valid until the
+FlacMetadata is closed; copy with bytes(...) if you need to keep them.
+
+No third-party requirements.
+"""
+
+import mmap
+import struct
+
+STREAMINFO = 0
+PADDING = 1
+APPLICATION = 2
+SEEKTABLE = 3
+VORBIS_COMMENT = 4
+CUESHEET = 5
+PICTURE = 6
+
+ALL_BLOCKS = frozenset({STREAMINFO, VORBIS_COMMENT, PICTURE})
+
+
+class FlacMetaError(Exception):
+    """Raised when a file isn't a FLAC file or its metadata is truncated."""
+    pass
+
+
+class PictureRef:
+    """A PICTURE block located in the file, without its payload copied out."""
+    __slots__ = ("_meta", "type", "mime", "desc", "width", "height", "depth", "offset", "length")
+
+    def __init__(self, meta, type, mime, desc, width, height, depth, offset, length):
+        self._meta = meta
+        self.type = type
+        self.mime = mime
+        self.desc = desc
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.offset = offset
+        self.length = length
+
+    @property
+    def data(self):
+        """The image bytes, as a lazy memoryview into the mapped file."""
+        return self._meta._view(self.offset, self.length)
+
+
+class FlacMetadata:
+    """
+    Result of read_flac_metadata(). Attributes:
+        streaminfo: dict of STREAMINFO fields (or {} if not requested)
+        tags:       {lowercased_key: [value, ...]} (or {} if not requested)
+        vendor:     Vorbis comment vendor string, or None
+        pictures:   [PictureRef, ...] (or [] if not requested)
+        padding:    total bytes held in PADDING blocks
+        audio_offset: byte offset where the first audio frame starts
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.streaminfo = {}
+        self.tags = {}
+        self.vendor = None
+        self.pictures = []
+        self.padding = 0
+        self.audio_offset = 0
+        self._file = None
+        self._mm = None
+        self._views = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _view(self, offset, length):
+        view = memoryview(self._mm)[offset:offset + length]
+        self._views.append(view)
+        return view
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# --------------------------------------------------------------------------
+# Block decoders
+# --------------------------------------------------------------------------
+
+def _parse_streaminfo(buf, pos):
+    min_block, max_block = struct.unpack_from(">HH", buf, pos)
+    min_frame = int.from_bytes(buf[pos + 4:pos + 7], "big")
+    max_frame = int.from_bytes(buf[pos + 7:pos + 10], "big")
+    packed = int.from_bytes(buf[pos + 10:pos + 18], "big")
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x07) + 1
+    bits_per_sample = ((packed >> 36) & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    return {
+        "min_blocksize": min_block,
+        "max_blocksize": max_block,
+        "min_framesize": min_frame,
+        "max_framesize": max_frame,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "bits_per_sample": bits_per_sample,
+        "total_samples": total_samples,
+        "length": total_samples / sample_rate if sample_rate else 0.0,
+        "md5_signature": buf[pos + 18:pos + 34].hex(),
+    }
+
+
+def _parse_vorbis_comment(buf, pos, end):
+    """Vorbis comments are little-endian, unlike every other FLAC block."""
+    vendor_len = struct.unpack_from("<I", buf, pos)[0]
+    pos += 4
+    vendor = bytes(buf[pos:pos + vendor_len]).decode("utf-8", "replace")
+    pos += vendor_len
+    count = struct.unpack_from("<I", buf, pos)[0]
+    pos += 4
+
+    tags = {}
+    for _ in range(count):
+        if pos + 4 > end:
+            break
+        length = struct.unpack_from("<I", buf, pos)[0]
+        pos += 4
+        entry = bytes(buf[pos:pos + length]).decode("utf-8", "replace")
+        pos += length
+        key, sep, value = entry.partition("=")
+        if not sep:
+            continue
+        tags.setdefault(key.lower(), []).append(value)
+    return vendor, tags
+
+
+def _parse_picture(meta, buf, pos):
+    pic_type, mime_len = struct.unpack_from(">II", buf, pos)
+    pos += 8
+    mime = bytes(buf[pos:pos + mime_len]).decode("ascii", "replace")
+    pos += mime_len
+    desc_len = struct.unpack_from(">I", buf, pos)[0]
+    pos += 4
+    desc = bytes(buf[pos:pos + desc_len]).decode("utf-8", "replace")
+    pos += desc_len
+    width, height, depth, _colors, data_len = struct.unpack_from(">IIIII", buf, pos)
+    pos += 20
+    return PictureRef(meta, pic_type, mime, desc, width, height, depth, pos, data_len)
+
+
+def _skip_id3(buf):
+    """Some taggers prepend an ID3v2 tag; return the offset just past it."""
+    if bytes(buf[:3]) != b"ID3" or len(buf) < 10:
+        return 0
+    size = 0
+    for b in buf[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if buf[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+# --------------------------------------------------------------------------
+# Entry point
+# --------------------------------------------------------------------------
+
+def read_flac_metadata(path, blocks=ALL_BLOCKS):
+    """
+    Memory-map a FLAC file and decode the metadata block types in `blocks`
+    (any of STREAMINFO, VORBIS_COMMENT, PICTURE). Other blocks are only
+    stepped over. Returns a FlacMetadata, which should be closed (or used
+    as a context manager) once you're done with any PictureRef.data views.
+
+    Raises FlacMetaError for non-FLAC or truncated files, OSError if the
+    file can't be opened.
+    """
+    meta = FlacMetadata(path)
+    meta._file = open(path, "rb")
+    try:
+        try:
+            meta._mm = mmap.mmap(meta._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise FlacMetaError(f"{path} is empty")
+        buf = meta._mm
+
+        pos = _skip_id3(buf)
+        if bytes(buf[pos:pos + 4]) != b"fLaC":
+            raise FlacMetaError(f"{path} is not a valid FLAC file")
+        pos += 4
+
+        size = len(buf)
+        while True:
+            if pos + 4 > size:
+                raise FlacMetaError(f"{path}: metadata runs past end of file")
+            header = buf[pos]
+            is_last = header & 0x80
+            block_type = header & 0x7F
+            length = int.from_bytes(buf[pos + 1:pos + 4], "big")
+            start = pos + 4
+            end = start + length
+            if end > size:
+                raise FlacMetaError(f"{path}: metadata block runs past end of file")
+
+            if block_type == PADDING:
+                meta.padding += length
+            elif block_type not in blocks:
+                pass
+            elif block_type == STREAMINFO:
+                meta.streaminfo = _parse_streaminfo(buf, start)
+            elif block_type == VORBIS_COMMENT:
+                meta.vendor, meta.tags = _parse_vorbis_comment(buf, start, end)
+            elif block_type == PICTURE:
+                meta.pictures.append(_parse_picture(meta, buf, start))
+
+            pos = end
+            if is_last:
+                break
+        meta.audio_offset = pos
+    except (struct.error, IndexError) as e:
+        meta.close()
+        raise FlacMetaError(f"{path}: corrupt metadata ({e})")
+    except BaseException:
+        meta.close()
+        raise
+    return meta
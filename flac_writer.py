@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+flac_writer.py
+
+Shared FLAC save helper that keeps a padding reserve, so tag edits land
+in place instead of rewriting the whole file.
+
+A FLAC file's metadata sits in front of the audio. When an edit makes the
+metadata bigger than what's there now (tags + the PADDING block), mutagen
+has to shift every byte of audio after it -- i.e. rewrite the entire
+30-50 MB file -- to make room. With a decent PADDING block in place, the
+same edit just eats into the padding and only the metadata bytes at the
+front of the file are rewritten.
+
+save_flac(audio) is a drop-in for audio.save() with this policy:
+    - if the new metadata still fits in the existing space, keep ALL the
+      leftover padding (never shrink it -- shrinking is a full rewrite too)
+    - if it doesn't fit, the file has to be rewritten anyway, so add a
+      generous reserve (default 64 KB) while we're at it; the next edit
+      then fits in place
+
+Every call is counted in a WriteStats, so tools can report how many saves
+were in-place updates versus full rewrites.
+
+One-off "re-pad library" (rewrites only files with less padding than the
+reserve, so every later edit by any tool is in-place):
+    python flac_writer.py /path/to/music/folder
+    python flac_writer.py /path/to/music/folder --padding 131072 --dry-run
+
+Requirements:
+    pip install mutagen tqdm
+"""
+
+import argparse
+import sys
+import threading
+from pathlib import Path
+
+from mutagen.flac import FLAC
+from tqdm import tqdm
+
+from flac_meta import STREAMINFO, read_flac_metadata
+
+DEFAULT_PADDING_RESERVE = 64 * 1024
+
+
+class WriteStats:
+    """Thread-safe counters of in-place saves vs. full-file rewrites."""
+
+    def __init__(self):
+        self.in_place = 0
+        self.rewrites = 0
+        self._lock = threading.Lock()
+
+    def record(self, in_place: bool):
+        with self._lock:
+            if in_place:
+                self.in_place += 1
+            else:
+                self.rewrites += 1
+
+    def summary(self):
+        total = self.in_place + self.rewrites
+        return (f"{total} file save(s): {self.in_place} in place, "
+                f"{self.rewrites} full rewrite(s) (padding reserve added to those).")
+
+
+def save_flac(audio: FLAC, padding_reserve: int = DEFAULT_PADDING_RESERVE, stats: WriteStats = None):
+    """
+    Save a mutagen FLAC object, keeping existing padding when the new
+    metadata fits and adding padding_reserve bytes when it doesn't.
+    Returns True if the save was in place, False if the file was rewritten.
+    """
+    outcome = {}
+
+    def choose_padding(info):
+        # info.padding: what would be left of the current metadata space
+        # after writing the new blocks (negative = doesn't fit).
+        if info.padding >= 0:
+            outcome["in_place"] = True
+            return info.padding
+        outcome["in_place"] = False
+        return padding_reserve
+
+    audio.save(padding=choose_padding)
+    in_place = outcome.get("in_place", False)
+    if stats is not None:
+        stats.record(in_place)
+    return in_place
+
+
+def repad_file(path, padding_reserve: int = DEFAULT_PADDING_RESERVE, dry_run: bool = False):
+    """
+    Make sure a file has at least padding_reserve bytes of padding.
+    Returns True if the file was (or, with dry_run, would be) rewritten.
+    """
+    with read_flac_metadata(path, blocks={STREAMINFO}) as meta:
+        current = meta.padding
+    if current >= padding_reserve:
+        return False
+    if not dry_run:
+        audio = FLAC(path)
+        audio.save(padding=lambda info: max(info.padding, padding_reserve))
+    return True
+
+
+def repad_library(root: Path, padding_reserve: int = DEFAULT_PADDING_RESERVE, dry_run: bool = False):
+    """Re-pad every FLAC under root. Returns (repadded, already_ok, failed)."""
+    repadded, already_ok, failed = 0, 0, 0
+    for path in tqdm(sorted(root.rglob("*.flac")), desc="Re-padding", unit="file"):
+        try:
+            if repad_file(path, padding_reserve, dry_run=dry_run):
+                repadded += 1
+            else:
+                already_ok += 1
+        except Exception as e:
+            tqdm.write(f"  [ERROR] Could not re-pad {path}: {e}")
+            failed += 1
+    return repadded, already_ok, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Give every FLAC file a padding reserve so later tag edits are written in place."
+    )
+    parser.add_argument("folder", type=str, help="Folder containing FLAC files, searched recursively")
+    parser.add_argument("--padding", type=int, default=DEFAULT_PADDING_RESERVE,
+                        help=f"Minimum padding in bytes to leave in each file (default: {DEFAULT_PADDING_RESERVE})")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report which files would be rewritten.")
+    args = parser.parse_args()
+
+    root = Path(args.folder).expanduser().resolve()
+    if not root.is_dir():
+        tqdm.write(f"Error: '{root}' is not a valid directory.")
+        sys.exit(1)
+
+    repadded, already_ok, failed = repad_library(root, args.padding, dry_run=args.dry_run)
+    verb = "would be re-padded" if args.dry_run else "re-padded"
+    tqdm.write(f"\n{repadded} file(s) {verb}, {already_ok} already had >= {args.padding} bytes, "
+               f"{failed} failed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,8 +24,14 @@ Tag resolution order per album:
        itself, then against every distinct TITLE found among its files.
        This covers singles that aren't registered as "albums" on
        Last.fm, and cases where the track name differs slightly from
-       the album name (e.g. a remix credit in one but not the other)
-    3. If all of that fails and prompting is enabled (default): show a
+       the album name (e.g. a remix credit in one but not the other).
+       Steps 0-2 stop once the album's request budget (--request-budget)
+       is spent, so a big compilation can't cost dozens of requests.
+       Answers from the response cache don't count against it.
+    3. Last resort: the artist's own tags (artist.getTopTags by name),
+       fetched once per artist and shared by all of its albums --
+       usually a run of singles (disable with --no-artist-fallback)
+    4. If all of that fails and prompting is enabled (default): show a
        Last.fm search link for the artist/album and pause to ask
        whether to retry, enter tags manually, or skip that album
 
@@ -75,9 +81,39 @@ Usage:
     # Never pause for manual input; just skip albums with no tags found:
     python lastfm_genre_tagger.py /path/to/music/folder --no-prompt
 
+    # Last.fm requests are paced by a shared token bucket (lastfm_api.py);
+    # lower the rate if the key is shared with other tools running at once:
+    python lastfm_genre_tagger.py /path/to/music/folder --rate 2
+
+    # Nightly run: skip albums that haven't changed since they were last
+    # tagged, then retry just the ones that were skipped last time:
+    python lastfm_genre_tagger.py /path/to/music/folder --incremental --no-prompt
+    python lastfm_genre_tagger.py /path/to/music/folder --retry-skipped
+
+    # Look up 8 albums at a time; anything that needs manual input is
+    # asked about at the end, after the automatic pass:
+    python lastfm_genre_tagger.py /path/to/music/folder --lookup-workers 8
+
+    # GENRE is written on 2 background threads while the next albums are
+    # looked up; use more on fast storage, or 0 to write album by album:
+    python lastfm_genre_tagger.py /path/to/music/folder --write-workers 4
+
+    # Last.fm replies are cached on disk (lastfm_cache.py), so a re-run only
+    # asks about new albums; bypass the cache to re-fetch everything:
+    python lastfm_genre_tagger.py /path/to/music/folder --no-response-cache
+
     # Use a non-default location for the encrypted key file:
     python lastfm_genre_tagger.py /path/to/music/folder --key-file /path/to/key.enc
 
+    # Re-read every file instead of using the shared library index
+    # (~/.lastfm_genre_tagger/library_index.sqlite, see library_index.py):
+    python lastfm_genre_tagger.py /path/to/music/folder --no-index
+
+    # Only look tags up and record the changes; write them all afterwards
+    # in one resumable, parallel pass (see tag_plan.py):
+    python lastfm_genre_tagger.py /path/to/music/folder --plan genre_plan.jsonl
+    python tag_plan.py apply genre_plan.jsonl
+
 How to get a free Last.fm API key:
     1. Go to https://www.last.fm/api/account/create
     2. Log in / create a Last.fm account if you don't have one.
@@ -93,10 +129,14 @@ How to get a free Last.fm API key:
 import argparse
 import base64
 import getpass
+import hashlib
 import os
+import sqlite3
 import sys
+import threading
 import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
 
@@ -107,7 +147,15 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from mutagen.flac import FLAC
 from tqdm import tqdm
 
-LASTFM_API_URL = "https://ws.audioscrobbler.com/2.0/"
+from flac_writer import DEFAULT_PADDING_RESERVE, WriteStats, save_flac
+from lastfm_api import DEFAULT_MAX_IN_FLIGHT, DEFAULT_RATE, LastFmError, get_client
+from lastfm_cache import DEFAULT_CACHE_FILE, ResponseCache
+from library_daemon import daemon_records
+from library_index import DEFAULT_INDEX_FILE, LibraryIndex
+from library_scan import DEFAULT_WORKERS, SCAN_ORDERS
+from library_walk import walk_files
+from tag_plan import TagPlan, pending_changes
+
 
 # Where the encrypted API key lives by default. Overridable with --key-file.
 DEFAULT_KEY_FILE = Path.home() / ".lastfm_genre_tagger" / "api_key.enc"
@@ -117,6 +165,15 @@ DEFAULT_KEY_FILE = Path.home() / ".lastfm_genre_tagger" / "api_key.enc"
 # or disable with --no-log).
 DEFAULT_LOG_FILE = "skipped_albums.log"
 
+# What --incremental remembers about each album, see GenreState.
+DEFAULT_STATE_FILE = Path.home() / ".lastfm_genre_tagger" / "genre_state.sqlite"
+
+# Most Last.fm requests sent for one album before giving up on it (MBID,
+# album and track-level tags; the shared artist-level fallback is extra).
+# Replies from the response cache don't count.
+# Override with --request-budget.
+DEFAULT_REQUEST_BUDGET = 6
+
 # PBKDF2 iteration count for deriving the encryption key from the password.
 PBKDF2_ITERATIONS = 480_000
 
@@ -289,9 +346,12 @@ def load_denylist(path: Optional[str]):
     return denylist
 
 
-def find_flac_files(root: Path):
-    """Recursively yield all .flac files under root."""
-    yield from root.rglob("*.flac")
+def find_flac_files(root: Path, index_file=DEFAULT_INDEX_FILE):
+    """Recursively yield all .flac files under root. Folders that haven't
+    changed since the last run aren't re-listed (see library_walk.py)."""
+    for path in walk_files(root, index_file):
+        if path.endswith(".flac"):
+            yield Path(path)
 
 
 def get_track_title(audio: FLAC):
@@ -314,7 +374,8 @@ def get_artist_mbid(audio: FLAC):
 
 def get_album_key(audio: FLAC):
     """
-    Build a grouping key from a FLAC file's tags.
+    Build a grouping key from a FLAC file's tags (a mutagen FLAC, or the
+    tag dict of a library index record -- both support .get()).
     Prefers ALBUMARTIST, falls back to ARTIST, paired with ALBUM.
     Returns (album_artist, album_title) or None if ALBUM tag is missing.
     """
@@ -331,36 +392,72 @@ def get_album_key(audio: FLAC):
     return (artist.strip(), album.strip())
 
 
-def scan_albums(root: Path):
+def scan_albums(root: Path, index_file=DEFAULT_INDEX_FILE, workers=DEFAULT_WORKERS, overlay=None,
+                order="path", use_daemon=False):
     """
     Scan all FLAC files under root and group their file paths by
-    (album_artist, album_title). Returns a dict:
-        {(artist, album): [Path, Path, ...]}
-    Files without an ALBUM tag are skipped and reported.
+    (album_artist, album_title). Returns (albums, skipped, file_tags):
+        albums:    {(artist, album): [Path, Path, ...]}
+        skipped:   [Path, ...] -- no ALBUM tag, or unreadable (reported)
+        file_tags: {Path: {tag: [values]}} for every grouped file, so the
+                   lookups and writes never have to re-open a file for
+                   its titles / MBIDs / current GENRE
+
+    Tags come from the shared library index (see library_index.py), so
+    only files that changed since the last run are actually re-read,
+    `workers` at a time. index_file=None uses a throwaway in-memory index
+    instead. overlay: pending plan changes to group by (see tag_plan.py).
+    order: read order for changed files (library_scan.order_paths).
+    use_daemon: ask a running library_daemon.py for the records first,
+    falling back to the index if it isn't running or doesn't watch root.
     """
     albums = {}
     skipped = []
-
-    for flac_path in find_flac_files(root):
-        try:
-            audio = FLAC(flac_path)
-        except Exception as e:
-            tqdm.write(f"  [WARN] Could not read {flac_path}: {e}")
-            skipped.append(flac_path)
-            continue
-
-        key = get_album_key(audio)
+    file_tags = {}
+
+    found = daemon_records(root, overlay=overlay) if use_daemon else None
+    if found is not None:
+        records, unreadable = found
+        tqdm.write(f"Library daemon: {len(records)} file(s) served from memory.")
+    else:
+        with LibraryIndex(index_file) as index:
+            records, unreadable = index.scan(find_flac_files(root, index_file), root=root, workers=workers,
+                                             overlay=overlay, order=order)
+            tqdm.write(index.describe())
+
+    for flac_path, e in unreadable:
+        tqdm.write(f"  [WARN] Could not read {flac_path}: {e}")
+        skipped.append(flac_path)
+
+    for rec in records:
+        key = get_album_key(rec.tags)
         if key is None:
-            tqdm.write(f"  [WARN] No ALBUM tag, skipping: {flac_path}")
-            skipped.append(flac_path)
+            tqdm.write(f"  [WARN] No ALBUM tag, skipping: {rec.path}")
+            skipped.append(rec.path)
             continue
 
-        albums.setdefault(key, []).append(flac_path)
+        albums.setdefault(key, []).append(rec.path)
+        file_tags[rec.path] = rec.tags
+
+    return albums, skipped, file_tags
 
-    return albums, skipped
 
+# Lines logged while an album is looked up on a worker thread (see
+# lookup_album_tags_buffered) are collected here instead of printed, so
+# concurrent albums' output doesn't interleave.
+_log_buffer = threading.local()
 
-def fetch_lastfm_artist_tags_by_mbid(api_key: str, artist_mbid: str, min_weight: int = 0, denylist: Optional[set] = None):
+
+def log(message: str):
+    lines = getattr(_log_buffer, "lines", None)
+    if lines is None:
+        tqdm.write(message)
+    else:
+        lines.append(message)
+
+
+def fetch_lastfm_artist_tags_by_mbid(api_key: str, artist_mbid: str, min_weight: int = 0,
+                                     denylist: Optional[set] = None, fresh: bool = False):
     """
     Query Last.fm's artist.getTopTags using a MusicBrainz Artist ID
     instead of an artist name string. This sidesteps name-collision
@@ -377,10 +474,28 @@ def fetch_lastfm_artist_tags_by_mbid(api_key: str, artist_mbid: str, min_weight:
         "format": "json",
     }
 
-    return _query_lastfm_tags(params, f"mbid:{artist_mbid} (artist)", min_weight, denylist)
+    return _query_lastfm_tags(params, f"mbid:{artist_mbid} (artist)", min_weight, denylist, fresh)
+
+
+def fetch_lastfm_artist_tags(api_key: str, artist: str, min_weight: int = 0, denylist: Optional[set] = None,
+                             fresh: bool = False):
+    """
+    Query Last.fm's artist.getTopTags by artist name. The last-resort
+    fallback for albums (mostly singles) with no album or track tags.
+    """
+    params = {
+        "method": "artist.gettoptags",
+        "artist": artist,
+        "api_key": api_key,
+        "format": "json",
+        "autocorrect": 1,
+    }
+
+    return _query_lastfm_tags(params, f"{artist} (artist)", min_weight, denylist, fresh)
 
 
-def fetch_lastfm_tags(api_key: str, artist: str, album: str, min_weight: int = 0, denylist: Optional[set] = None):
+def fetch_lastfm_tags(api_key: str, artist: str, album: str, min_weight: int = 0, denylist: Optional[set] = None,
+                      fresh: bool = False):
     """
     Query Last.fm's album.getTopTags for the given artist/album.
     Returns a list of tag names in order of weight (highest first),
@@ -399,10 +514,11 @@ def fetch_lastfm_tags(api_key: str, artist: str, album: str, min_weight: int = 0
         "autocorrect": 1,
     }
 
-    return _query_lastfm_tags(params, f"{artist} - {album}", min_weight, denylist)
+    return _query_lastfm_tags(params, f"{artist} - {album}", min_weight, denylist, fresh)
 
 
-def fetch_lastfm_track_tags(api_key: str, artist: str, track: str, min_weight: int = 0, denylist: Optional[set] = None):
+def fetch_lastfm_track_tags(api_key: str, artist: str, track: str, min_weight: int = 0,
+                            denylist: Optional[set] = None, fresh: bool = False):
     """
     Query Last.fm's track.getTopTags for a given artist/track.
     Used as a fallback when album-level tags aren't available (e.g. for
@@ -417,24 +533,23 @@ def fetch_lastfm_track_tags(api_key: str, artist: str, track: str, min_weight: i
         "autocorrect": 1,
     }
 
-    return _query_lastfm_tags(params, f"{artist} - {track} (track)", min_weight, denylist)
+    return _query_lastfm_tags(params, f"{artist} - {track} (track)", min_weight, denylist, fresh)
 
 
-def _query_lastfm_tags(params: dict, label: str, min_weight: int, denylist: Optional[set]):
-    """Shared request/parse/filter logic for album and track tag lookups."""
+def _query_lastfm_tags(params: dict, label: str, min_weight: int, denylist: Optional[set], fresh: bool = False):
+    """Shared request/parse/filter logic for album and track tag lookups.
+    fresh=True asks Last.fm again instead of using a cached reply (the new
+    reply replaces it in the cache)."""
     try:
-        resp = requests.get(LASTFM_API_URL, params=params, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
+        data = get_client().get(params, refresh=fresh)
+    except LastFmError as e:
+        log(f"    [ERROR] Last.fm API error for '{label}': {e.message}")
+        return []
     except requests.RequestException as e:
-        tqdm.write(f"    [ERROR] Last.fm request failed for '{label}': {e}")
+        log(f"    [ERROR] Last.fm request failed for '{label}': {e}")
         return []
     except ValueError:
-        tqdm.write(f"    [ERROR] Bad JSON from Last.fm for '{label}'")
-        return []
-
-    if "error" in data:
-        tqdm.write(f"    [ERROR] Last.fm API error for '{label}': {data.get('message')}")
+        log(f"    [ERROR] Bad JSON from Last.fm for '{label}'")
         return []
 
     toptags = data.get("toptags", {})
@@ -446,7 +561,7 @@ def _query_lastfm_tags(params: dict, label: str, min_weight: int, denylist: Opti
     resolved_artist = toptags.get("@attr", {}).get("artist") or toptags.get("artist")
     requested_artist = params.get("artist")
     if resolved_artist and requested_artist and resolved_artist.lower() != requested_artist.lower():
-        tqdm.write(f"    [NOTE] Last.fm resolved artist '{requested_artist}' -> '{resolved_artist}' for '{label}'")
+        log(f"    [NOTE] Last.fm resolved artist '{requested_artist}' -> '{resolved_artist}' for '{label}'")
 
     # Last.fm returns a dict (not a list) when there's exactly one tag
     if isinstance(tag_list, dict):
@@ -506,7 +621,127 @@ def prompt_manual_tags(search_url: Optional[str] = None):
         tqdm.write("    Please enter 'r', 'm', or 's'.")
 
 
-def resolve_album_tags(api_key, artist, album, files, min_weight, denylist, delay, interactive):
+class ArtistTagCache:
+    """
+    Artist-level tags (artist.getTopTags by name) for the last-resort
+    fallback, fetched at most once per artist per run and shared by all of
+    that artist's albums -- typically a run of singles, none of which
+    Last.fm has album or track tags for. Thread-safe.
+    """
+
+    def __init__(self):
+        self._tags = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str, artist: str, min_weight: int, denylist: Optional[set]):
+        """(tags, fetched): fetched is True if this call sent the request."""
+        key = artist.casefold()
+        with self._lock:
+            artist_lock = self._locks.setdefault(key, threading.Lock())
+        with artist_lock:
+            if key in self._tags:
+                return self._tags[key], False
+            tags = fetch_lastfm_artist_tags(api_key, artist, min_weight=min_weight, denylist=denylist)
+            self._tags[key] = tags
+            return tags, True
+
+
+def lookup_album_tags(api_key, artist, album, file_tags, min_weight, denylist,
+                      budget=DEFAULT_REQUEST_BUDGET, artist_cache=None, use_mbid=True, fresh=False):
+    """
+    The automatic part of resolve_album_tags (steps 0-4). Returns (tags,
+    lookups): the tags found ([] if none) and how many requests it sent
+    to Last.fm (answers from the response cache aren't counted). Never
+    prompts, so it's safe to run on a worker thread.
+
+    file_tags: the tag dicts of the album's files, from the library scan
+    (no file is opened here). budget: the most requests steps 0-3 may
+    send for this album; track titles beyond it aren't tried. artist_cache: an
+    ArtistTagCache for step 4 (None = no artist-level fallback).
+    use_mbid=False skips step 0; fresh=True re-asks Last.fm instead of
+    using cached replies (for a user-requested retry), updating the cache.
+    """
+    client = get_client()
+    start = client.sent_by_thread()
+
+    def spent():
+        return client.sent_by_thread() - start
+
+    # Step 0: MBID-based artist lookup, if available.
+    artist_mbid = None
+    if use_mbid:
+        artist_mbid = next((mbid for mbid in map(get_artist_mbid, file_tags) if mbid), None)
+
+    if artist_mbid:
+        tags = fetch_lastfm_artist_tags_by_mbid(api_key, artist_mbid, min_weight=min_weight, denylist=denylist,
+                                                fresh=fresh)
+        if tags:
+            log(f"    Found tags via MusicBrainz artist ID ({artist_mbid}).")
+            return tags, spent()
+        log(f"    No tags via MusicBrainz artist ID ({artist_mbid}); falling back to name-based lookup.")
+
+    if spent() < budget:
+        tags = fetch_lastfm_tags(api_key, artist, album, min_weight=min_weight, denylist=denylist, fresh=fresh)
+        if tags:
+            return tags, spent()
+
+    # Collect candidate "track name" strings to try as a fallback.
+    # Always try the album title itself first (singles are often
+    # filed as a track under the same name, sometimes with extra
+    # text like a remix credit).
+    candidates = [album]
+    seen = {album.casefold()}
+    for tags in file_tags:
+        title = get_track_title(tags)
+        if title and title.casefold() not in seen:
+            seen.add(title.casefold())
+            candidates.append(title)
+
+    for i, candidate in enumerate(candidates):
+        if spent() >= budget:
+            log(f"    Request budget ({budget}) spent; {len(candidates) - i} track title(s) not tried.")
+            break
+        log(f"    No album-level tags. Trying track-level tags for '{candidate}'...")
+        tags = fetch_lastfm_track_tags(
+            api_key, artist, candidate, min_weight=min_weight, denylist=denylist, fresh=fresh
+        )
+        if tags:
+            log(f"    Found tags via track-level fallback ('{candidate}').")
+            return tags, spent()
+
+    # Step 4: the artist's own tags, unless step 0 already tried them by ID.
+    if artist_cache is not None and not artist_mbid:
+        tags, _fetched = artist_cache.get(api_key, artist, min_weight, denylist)
+        if tags:
+            log(f"    Using artist-level tags for '{artist}' (no album or track tags found).")
+            return tags, spent()
+
+    return [], spent()
+
+
+def ask_album_tags(api_key, artist, album, file_tags, min_weight, denylist, budget=DEFAULT_REQUEST_BUDGET):
+    """
+    Step 5 of resolve_album_tags: show a Last.fm search link and prompt
+    until the user enters tags or skips. A retry repeats the name-based
+    lookup, re-asking Last.fm rather than reusing cached replies (what it
+    gets back is cached for later runs). Returns (tags or None, lookups).
+    """
+    search_url = build_lastfm_search_url(artist, album)
+    lookups = 0
+    while True:
+        result = prompt_manual_tags(search_url=search_url)
+        if result != "RETRY":
+            return result, lookups  # either None (skip) or a list of manual tags
+        tags, spent = lookup_album_tags(api_key, artist, album, file_tags, min_weight, denylist, budget,
+                                        use_mbid=False, fresh=True)
+        lookups += spent
+        if tags:
+            return tags, lookups
+
+
+def resolve_album_tags(api_key, artist, album, file_tags, min_weight, denylist, interactive,
+                       budget=DEFAULT_REQUEST_BUDGET, artist_cache=None):
     """
     Try to get a list of genre tags for an album, in this order:
       0. If any file in the album has a MUSICBRAINZ_ARTISTID /
@@ -524,87 +759,206 @@ def resolve_album_tags(api_key, artist, album, files, min_weight, denylist, dela
          also the reverse case.
       3. track.getTopTags for each distinct TITLE tag found among the
          album's files (in case the album title and the track title
-         differ, e.g. a single named after its A-side).
-      4. If interactive and still nothing: show a Last.fm search link
+         differ, e.g. a single named after its A-side), until the
+         album's request budget is spent.
+      4. artist.getTopTags by name (see ArtistTagCache), if no MBID was
+         tried in step 0.
+      5. If interactive and still nothing: show a Last.fm search link
          and prompt the user to retry, enter tags manually, or skip.
 
-    Returns a list of tags, or None if the album should be left untouched.
+    Returns (tags, lookups): a list of tags, or None if the album should
+    be left untouched, and the number of Last.fm requests sent for it.
     """
-    # Step 0: MBID-based artist lookup, if available.
-    artist_mbid = None
-    for f in files:
-        try:
-            audio = FLAC(f)
-        except Exception:
-            continue
-        artist_mbid = get_artist_mbid(audio)
-        if artist_mbid:
-            break
+    tags, lookups = lookup_album_tags(api_key, artist, album, file_tags, min_weight, denylist, budget,
+                                      artist_cache)
+    if tags:
+        return tags, lookups
+    if not interactive:
+        return None, lookups
+    tags, spent = ask_album_tags(api_key, artist, album, file_tags, min_weight, denylist, budget)
+    return tags, lookups + spent
+
+
+def lookup_album_tags_buffered(*args, **kwargs):
+    """lookup_album_tags for a worker thread: returns (tags, lookups, log
+    lines), the lines held back so they can be printed with the album."""
+    _log_buffer.lines = []
+    try:
+        tags, lookups = lookup_album_tags(*args, **kwargs)
+        return tags, lookups, _log_buffer.lines
+    finally:
+        _log_buffer.lines = None
 
-    if artist_mbid:
-        tags = fetch_lastfm_artist_tags_by_mbid(api_key, artist_mbid, min_weight=min_weight, denylist=denylist)
-        if tags:
-            tqdm.write(f"    Found tags via MusicBrainz artist ID ({artist_mbid}).")
-            return tags
-        tqdm.write(f"    No tags via MusicBrainz artist ID ({artist_mbid}); falling back to name-based lookup.")
 
-    while True:
-        tags = fetch_lastfm_tags(api_key, artist, album, min_weight=min_weight, denylist=denylist)
-        if tags:
-            return tags
+def apply_genre_tag(flac_path: Path, genre_string: str, dry_run: bool,
+                    padding_reserve: int = DEFAULT_PADDING_RESERVE, stats: Optional[WriteStats] = None):
+    """
+    Replace the GENRE tag on a single FLAC file. Saved via
+    flac_writer.save_flac, so the edit lands in place whenever the file has
+    enough padding (and a padding reserve is added when it doesn't).
+    Returns False, without writing, if the file already has exactly this
+    GENRE.
+    """
+    audio = FLAC(flac_path)
 
-        # Collect candidate "track name" strings to try as a fallback.
-        # Always try the album title itself first (singles are often
-        # filed as a track under the same name, sometimes with extra
-        # text like a remix credit).
-        candidates = [album]
+    if audio.get("genre") == [genre_string]:
+        return False
 
-        for f in files:
-            try:
-                audio = FLAC(f)
-            except Exception:
-                continue
-            title = get_track_title(audio)
-            if title and title not in candidates:
-                candidates.append(title)
-
-        found_via = None
-        for candidate in candidates:
-            tqdm.write(f"    No album-level tags. Trying track-level tags for '{candidate}'...")
-            tags = fetch_lastfm_track_tags(
-                api_key, artist, candidate, min_weight=min_weight, denylist=denylist
-            )
-            if tags:
-                found_via = candidate
+    if "genre" in audio:
+        del audio["genre"]
+
+    audio["genre"] = [genre_string]
+
+    if not dry_run:
+        save_flac(audio, padding_reserve, stats)
+    return True
+
+
+DEFAULT_WRITE_WORKERS = 2
+DEFAULT_WRITE_QUEUE = 64
+
+
+class GenreWriter:
+    """
+    Writes GENRE tags on a small pool of background threads, so the disk
+    work for one album overlaps with the Last.fm lookups for the next.
+
+    submit() queues an album's files to write and returns straight away, unless
+    queue_depth files are already waiting, in which case it blocks until
+    one is written -- a slow disk holds the lookups back instead of piling
+    up work. A file that can't be written is reported as soon as it fails.
+    completed() hands back, in the order they were submitted, the albums
+    whose writes have all finished, as (artist, album, files, genre_string,
+    written, unchanged, failed).
+    """
+
+    def __init__(self, workers=DEFAULT_WRITE_WORKERS, queue_depth=DEFAULT_WRITE_QUEUE, dry_run=False,
+                 padding_reserve=DEFAULT_PADDING_RESERVE, stats: Optional[WriteStats] = None):
+        self.workers = workers
+        self.dry_run = dry_run
+        self.padding_reserve = padding_reserve
+        self.stats = stats
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="genre-writer")
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._albums = []
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.queue_waited = 0.0
+        self.started = None
+        self.finished = None
+
+    def submit(self, artist, album, files, to_write, genre_string, unchanged=0):
+        """Queue to_write (those of the album's files that need the new
+        GENRE); unchanged counts the ones already known to have it."""
+        futures = []
+        for f in to_write:
+            if not self._slots.acquire(blocking=False):
+                waited_from = time.monotonic()
+                self._slots.acquire()
+                self.queue_waited += time.monotonic() - waited_from
+            if self.started is None:
+                self.started = time.monotonic()
+            future = self._pool.submit(self._write, f, genre_string)
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+        self._albums.append((artist, album, files, genre_string, unchanged, futures))
+
+    def _write(self, f, genre_string):
+        """True if written, False if it already had this GENRE, None on error."""
+        try:
+            wrote = apply_genre_tag(f, genre_string, dry_run=self.dry_run,
+                                    padding_reserve=self.padding_reserve, stats=self.stats)
+        except Exception as e:
+            tqdm.write(f"      [ERROR] Failed to write tag to {f}: {e}")
+            wrote = None
+        with self._lock:
+            if wrote is None:
+                self.failed += 1
+            elif wrote:
+                self.written += 1
+            self.finished = time.monotonic()
+        return wrote
+
+    def completed(self, wait=False):
+        """Pop the finished albums off the front of the queue (all of them,
+        waiting for their writes, if wait is set)."""
+        done = []
+        while self._albums:
+            artist, album, files, genre_string, unchanged, futures = self._albums[0]
+            if not wait and not all(future.done() for future in futures):
                 break
+            self._albums.pop(0)
+            results = [future.result() for future in futures]
+            done.append((artist, album, files, genre_string, results.count(True),
+                         unchanged + results.count(False), results.count(None)))
+        return done
 
-        if tags:
-            tqdm.write(f"    Found tags via track-level fallback ('{found_via}').")
-            return tags
+    def close(self):
+        self._pool.shutdown(wait=True)
 
-        if not interactive:
-            return None
+    def describe(self):
+        elapsed = (self.finished - self.started) if self.started is not None and self.finished else 0.0
+        verb = "would be written" if self.dry_run else "written"
+        rate = f" ({self.written / elapsed:.1f} files/s)" if elapsed > 0 else ""
+        return (f"GENRE writer: {self.written} file(s) {verb} in {elapsed:.1f}s{rate} on {self.workers} "
+                f"thread(s), {self.failed} failed; lookups waited {self.queue_waited:.1f}s on a full "
+                f"write queue.")
 
-        search_url = build_lastfm_search_url(artist, album)
-        result = prompt_manual_tags(search_url=search_url)
-        if result == "RETRY":
-            time.sleep(delay)
-            continue
-        return result  # either None (skip) or a list of manual tags
 
+class GenreState:
+    """
+    What --incremental remembers per album: a fingerprint of its track set
+    (its sorted file paths) and the GENRE string last applied to it. An
+    album whose files are the same and all still carry that GENRE is
+    skipped without a single Last.fm lookup; adding/removing a track or
+    editing GENRE by hand brings it back.
+    """
 
-def apply_genre_tag(flac_path: Path, genre_string: str, dry_run: bool):
-    """Replace the GENRE tag on a single FLAC file."""
-    audio = FLAC(flac_path)
+    def __init__(self, state_file=DEFAULT_STATE_FILE):
+        state_file = Path(state_file).expanduser()
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(state_file)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS albums ("
+            " album_key TEXT PRIMARY KEY,"
+            " fingerprint TEXT NOT NULL,"
+            " genre TEXT NOT NULL)"
+        )
+        self.conn.commit()
+        self._albums = {row[0]: (row[1], row[2])
+                        for row in self.conn.execute("SELECT album_key, fingerprint, genre FROM albums")}
 
-    if "genre" in audio:
-        del audio["genre"]
+    def close(self):
+        self.conn.close()
 
-    audio["genre"] = [genre_string]
+    @staticmethod
+    def _key(artist, album):
+        return f"{artist}\x1f{album}"
+
+    @staticmethod
+    def fingerprint(files):
+        return hashlib.sha1("\n".join(sorted(str(f) for f in files)).encode("utf-8")).hexdigest()
+
+    def unchanged(self, artist, album, files, file_tags):
+        known = self._albums.get(self._key(artist, album))
+        if known is None or known[0] != self.fingerprint(files):
+            return False
+        return all(file_tags[f].get("genre") == [known[1]] for f in files)
+
+    def record(self, artist, album, files, genre_string):
+        key = self._key(artist, album)
+        self._albums[key] = (self.fingerprint(files), genre_string)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO albums (album_key, fingerprint, genre) VALUES (?, ?, ?)",
+                              (key, self._albums[key][0], genre_string))
 
-    if dry_run:
-        return
-    audio.save()
+
+def read_skipped_log(path: Path):
+    """The "artist - album" lines of a skipped-albums log from an earlier run."""
+    lines = path.read_text(encoding="utf-8").splitlines()[2:]   # past the header + rule
+    return {line for line in lines if line.strip() and not line[0].isspace()}
 
 
 def main():
@@ -637,10 +991,68 @@ def main():
         help="Minimum Last.fm tag weight (0-100) to keep a tag. Default 0 = keep all tags.",
     )
     parser.add_argument(
-        "--delay",
+        "--rate",
         type=float,
-        default=0.25,
-        help="Seconds to wait between Last.fm requests, to be polite to the API. Default 0.25",
+        default=DEFAULT_RATE,
+        help="Maximum Last.fm requests per second, sustained. Requests only wait once this "
+             f"budget is spent (default: {DEFAULT_RATE}).",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=DEFAULT_MAX_IN_FLIGHT,
+        help=f"Maximum concurrent Last.fm requests (default: {DEFAULT_MAX_IN_FLIGHT}).",
+    )
+    parser.add_argument(
+        "--request-budget",
+        type=int,
+        default=DEFAULT_REQUEST_BUDGET,
+        help="Most Last.fm requests to send for one album (MBID, album and track-level tags) "
+             "before giving up on it; cached replies don't count "
+             f"(default: {DEFAULT_REQUEST_BUDGET}).",
+    )
+    parser.add_argument(
+        "--no-artist-fallback",
+        action="store_true",
+        help="Don't fall back to the artist's own Last.fm tags for albums with no album or "
+             "track-level tags. By default they're fetched once per artist and shared.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip albums whose tracks are the same as when this script last tagged them and "
+             "still carry the GENRE it wrote then -- no Last.fm lookups at all for those.",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=str,
+        default=str(DEFAULT_STATE_FILE),
+        help=f"Where --incremental keeps its per-album record (default: {DEFAULT_STATE_FILE})",
+    )
+    parser.add_argument(
+        "--retry-skipped",
+        action="store_true",
+        help="Only look at the albums listed in the skipped-albums log (--log-file) from an "
+             "earlier run.",
+    )
+    parser.add_argument(
+        "--lookup-workers",
+        type=int,
+        default=1,
+        help="Look this many albums up at once (still within --rate). With more than 1, albums "
+             "no tags were found for are prompted for only after every other album is done, so "
+             "the automatic pass runs unattended (default: 1 = one album at a time).",
+    )
+    parser.add_argument(
+        "--response-cache",
+        type=str,
+        default=str(DEFAULT_CACHE_FILE),
+        help=f"On-disk cache of Last.fm replies shared with the other tools (default: {DEFAULT_CACHE_FILE})",
+    )
+    parser.add_argument(
+        "--no-response-cache",
+        action="store_true",
+        help="Don't read or write the Last.fm response cache; ask Last.fm about everything.",
     )
     parser.add_argument(
         "--denylist-file",
@@ -660,6 +1072,67 @@ def main():
         action="store_true",
         help="Show what would happen without writing any tags to disk.",
     )
+    parser.add_argument(
+        "--index-file",
+        type=str,
+        default=str(DEFAULT_INDEX_FILE),
+        help=f"Path to the shared library index, so unchanged files aren't re-read "
+             f"(default: {DEFAULT_INDEX_FILE})",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Don't read or update the on-disk library index; read every file fresh.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Parallel file reads while scanning (default: {DEFAULT_WORKERS}; 1 = no pool).",
+    )
+    parser.add_argument(
+        "--scan-order",
+        choices=SCAN_ORDERS,
+        default="path",
+        help="Order to read changed files in: path (default), inode, or physical (disk offset via "
+             "FIEMAP, falling back to inode). inode/physical cut seeking on a spinning disk; pair "
+             "them with a low --workers.",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Don't ask a running library_daemon.py for the library's tags; always scan.",
+    )
+    parser.add_argument(
+        "--padding-reserve",
+        type=int,
+        default=DEFAULT_PADDING_RESERVE,
+        help="Bytes of FLAC padding to add whenever a tag edit forces a full-file rewrite, so "
+             f"later edits are written in place (default: {DEFAULT_PADDING_RESERVE}).",
+    )
+    parser.add_argument(
+        "--write-workers",
+        type=int,
+        default=DEFAULT_WRITE_WORKERS,
+        help="Threads writing GENRE tags in the background while the next albums are looked up "
+             f"(default: {DEFAULT_WRITE_WORKERS}; 0 = write each album before looking up the next).",
+    )
+    parser.add_argument(
+        "--write-queue",
+        type=int,
+        default=DEFAULT_WRITE_QUEUE,
+        help="Most files waiting to be written before lookups pause for the writers to catch up "
+             f"(default: {DEFAULT_WRITE_QUEUE}).",
+    )
+    parser.add_argument(
+        "--plan",
+        type=str,
+        default=None,
+        help="Don't write any files; append every GENRE change to this plan file instead, "
+             "to be written later with 'python tag_plan.py apply PLAN'. Changes other tools "
+             "already planned there are taken into account, so several tools can share one "
+             "plan and each file is written once.",
+    )
     parser.add_argument(
         "--log-file",
         type=str,
@@ -682,6 +1155,8 @@ def main():
         sys.exit(0)
 
     api_key = unlock_api_key(key_path)
+    cache = None if args.no_response_cache else ResponseCache(args.response_cache)
+    get_client(api_key, rate=args.rate, max_in_flight=args.max_in_flight, cache=cache)
 
     root = Path(args.folder).expanduser().resolve()
 
@@ -692,7 +1167,11 @@ def main():
     denylist = load_denylist(args.denylist_file)
 
     tqdm.write(f"Scanning '{root}' for FLAC files...")
-    albums, skipped = scan_albums(root)
+    index_file = None if args.no_index else Path(args.index_file).expanduser()
+    pending = pending_changes(args.plan) if args.plan else None
+    albums, skipped, file_tags = scan_albums(root, index_file=index_file, workers=args.workers,
+                                             overlay=pending, order=args.scan_order,
+                                             use_daemon=not args.no_daemon)
 
     if not albums:
         tqdm.write("No albums with ALBUM tags found. Nothing to do.")
@@ -705,43 +1184,174 @@ def main():
     if args.dry_run:
         tqdm.write("\n--- DRY RUN: no files will be modified ---")
 
+    plan = TagPlan(args.plan, source="genre_tagger") if args.plan and not args.dry_run else None
+    if plan is not None:
+        tqdm.write(f"\n--- PLAN MODE: changes are recorded to '{plan.path}', no files will be modified ---")
+
     album_items = sorted(albums.items())
-    progress = tqdm(album_items, desc="Albums", unit="album")
-    skipped_albums = []
 
-    for (artist, album), files in progress:
-        progress.set_postfix_str(f"{artist} - {album}"[:60])
-        tqdm.write(f"\n'{artist}' - '{album}'  ({len(files)} track(s))")
-
-        tags = resolve_album_tags(
-            api_key=api_key,
-            artist=artist,
-            album=album,
-            files=files,
-            min_weight=args.min_weight,
-            denylist=denylist,
-            delay=args.delay,
-            interactive=not args.no_prompt,
-        )
+    if args.retry_skipped:
+        log_path = Path(args.log_file).expanduser()
+        try:
+            wanted = read_skipped_log(log_path)
+        except OSError as e:
+            tqdm.write(f"[ERROR] Could not read {log_path}: {e}")
+            sys.exit(1)
+        album_items = [item for item in album_items if f"{item[0][0]} - {item[0][1]}" in wanted]
+        tqdm.write(f"Retrying {len(album_items)} album(s) listed in {log_path}.")
+
+    state = GenreState(args.state_file) if args.incremental else None
+    if state is not None:
+        before = len(album_items)
+        album_items = [((artist, album), files) for (artist, album), files in album_items
+                       if not state.unchanged(artist, album, files, file_tags)]
+        tqdm.write(f"Incremental: {before - len(album_items)} unchanged album(s) skipped, "
+                   f"{len(album_items)} to look up.")
 
+    skipped_albums = []
+    write_stats = WriteStats()
+    artist_cache = None if args.no_artist_fallback else ArtistTagCache()
+    lookups_by_album = {}
+    already_set = 0
+    writer = None
+    if plan is None and args.write_workers > 0:
+        writer = GenreWriter(args.write_workers, max(1, args.write_queue), dry_run=args.dry_run,
+                             padding_reserve=args.padding_reserve, stats=write_stats)
+
+    def album_written(artist, album, files, genre_string, unchanged, failed):
+        """Book-keeping once every file of an album has been written (or planned)."""
+        nonlocal already_set
+        if unchanged:
+            tqdm.write(f"      {unchanged} track(s) already had this GENRE; left alone.")
+        already_set += unchanged
+        if state is not None and not args.dry_run and not failed:
+            state.record(artist, album, files, genre_string)
+
+    def drain_writer(wait=False):
+        for artist, album, files, genre_string, written, unchanged, failed in writer.completed(wait):
+            action = "Would set" if args.dry_run else "Set"
+            tqdm.write(f"\n    '{artist}' - '{album}': {action} GENRE on {written} track(s)"
+                       + (f", {failed} failed." if failed else "."))
+            album_written(artist, album, files, genre_string, unchanged, failed)
+
+    def finish_album(artist, album, files, tags, lookups):
+        """Record/write the resolved tags for one album (or note it as skipped)."""
+        lookups_by_album[(artist, album)] = lookups
+        tqdm.write(f"    Last.fm requests: {lookups}")
         if not tags:
             tqdm.write("    Skipping this album (genre left untouched).")
             skipped_albums.append((artist, album))
-            time.sleep(args.delay)
-            continue
+            return
 
         genre_string = ";".join(tags)
         tqdm.write(f"    Tags: {genre_string}")
 
-        for f in tqdm(files, desc="  Tracks", unit="file", leave=False):
+        # Files that already carry exactly this GENRE aren't touched.
+        to_write = [f for f in files if file_tags[f].get("genre") != [genre_string]]
+        unchanged = len(files) - len(to_write)
+
+        if plan is not None:
+            for f in to_write:
+                plan.add(f, "genre", file_tags[f].get("genre"), [genre_string])
+            tqdm.write(f"      Planned GENRE for {len(to_write)} track(s).")
+        elif writer is not None:
+            # Written in the background; reported once the album's writes are done.
+            writer.submit(artist, album, files, to_write, genre_string, unchanged)
+            if to_write:
+                tqdm.write(f"      Queued GENRE for {len(to_write)} track(s).")
+            drain_writer()
+            return
+        else:
+            failed = 0
+            for f in tqdm(to_write, desc="  Tracks", unit="file", leave=False):
+                try:
+                    if apply_genre_tag(f, genre_string, dry_run=args.dry_run,
+                                       padding_reserve=args.padding_reserve, stats=write_stats):
+                        action = "Would set" if args.dry_run else "Set"
+                        tqdm.write(f"      {action} GENRE on: {f.name}")
+                    else:
+                        unchanged += 1
+                except Exception as e:
+                    failed += 1
+                    tqdm.write(f"      [ERROR] Failed to write tag to {f}: {e}")
+            if failed:
+                return
+
+        album_written(artist, album, files, genre_string, unchanged, 0)
+
+    if args.lookup_workers > 1:
+        # Look every album up concurrently (paced by the shared Last.fm
+        # client), writing each as soon as its lookup finishes. Albums
+        # nothing was found for are only prompted for once the automatic
+        # pass is over.
+        deferred = []
+        with ThreadPoolExecutor(max_workers=args.lookup_workers) as pool:
+            futures = {
+                pool.submit(lookup_album_tags_buffered, api_key, artist, album, [file_tags[f] for f in files],
+                            args.min_weight, denylist, args.request_budget, artist_cache): (artist, album, files)
+                for (artist, album), files in album_items
+            }
             try:
-                apply_genre_tag(f, genre_string, dry_run=args.dry_run)
-                action = "Would set" if args.dry_run else "Set"
-                tqdm.write(f"      {action} GENRE on: {f.name}")
-            except Exception as e:
-                tqdm.write(f"      [ERROR] Failed to write tag to {f}: {e}")
-
-        time.sleep(args.delay)
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Albums", unit="album"):
+                    artist, album, files = futures[future]
+                    tags, lookups, lines = future.result()
+                    tqdm.write(f"\n'{artist}' - '{album}'  ({len(files)} track(s))")
+                    for line in lines:
+                        tqdm.write(line)
+                    if not tags and not args.no_prompt:
+                        tqdm.write("    No tags found; you'll be asked about this album at the end.")
+                        deferred.append((artist, album, files, lookups))
+                        continue
+                    finish_album(artist, album, files, tags, lookups)
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        if deferred:
+            tqdm.write(f"\n{len(deferred)} album(s) need manual input.")
+        for artist, album, files, lookups in sorted(deferred):
+            tqdm.write(f"\n'{artist}' - '{album}'  ({len(files)} track(s))")
+            tags, spent = ask_album_tags(api_key, artist, album, [file_tags[f] for f in files], args.min_weight,
+                                         denylist, args.request_budget)
+            finish_album(artist, album, files, tags, lookups + spent)
+    else:
+        progress = tqdm(album_items, desc="Albums", unit="album")
+        for (artist, album), files in progress:
+            progress.set_postfix_str(f"{artist} - {album}"[:60])
+            tqdm.write(f"\n'{artist}' - '{album}'  ({len(files)} track(s))")
+
+            tags, lookups = resolve_album_tags(
+                api_key=api_key,
+                artist=artist,
+                album=album,
+                file_tags=[file_tags[f] for f in files],
+                min_weight=args.min_weight,
+                denylist=denylist,
+                interactive=not args.no_prompt,
+                budget=args.request_budget,
+                artist_cache=artist_cache,
+            )
+            finish_album(artist, album, files, tags, lookups)
+
+    if writer is not None:
+        drain_writer(wait=True)
+        writer.close()
+    if state is not None:
+        state.close()
+    if already_set:
+        tqdm.write(f"\n{already_set} file(s) already had the right GENRE and weren't rewritten.")
+
+    if lookups_by_album:
+        total = sum(lookups_by_album.values())
+        at_budget = sum(1 for n in lookups_by_album.values() if n >= args.request_budget)
+        tqdm.write(f"\nLast.fm requests: {total} for {len(lookups_by_album)} album(s), "
+                   f"{total / len(lookups_by_album):.1f} per album; {at_budget} album(s) spent the "
+                   f"whole budget of {args.request_budget}.")
+        costliest = sorted(lookups_by_album.items(), key=lambda item: (-item[1], item[0]))[:5]
+        for (artist, album), n in costliest:
+            if n > 1:
+                tqdm.write(f"  {n:>3}  '{artist}' - '{album}'")
 
     if skipped_albums:
         tqdm.write(f"\n{len(skipped_albums)} album(s) were skipped (no tags found):")
@@ -760,6 +1370,20 @@ def main():
                 tqdm.write(f"\nWrote skipped-album list to: {log_path}")
             except OSError as e:
                 tqdm.write(f"[ERROR] Could not write log file {log_path}: {e}")
+    elif args.retry_skipped and not args.no_log and not args.dry_run:
+        # Everything that was skipped last time has been resolved now.
+        Path(args.log_file).expanduser().unlink(missing_ok=True)
+
+    if plan is not None:
+        plan.close()
+        tqdm.write(f"\n{plan.added} change(s) recorded. Apply them with: python tag_plan.py apply '{plan.path}'")
+    else:
+        tqdm.write("")
+        if writer is not None:
+            tqdm.write(writer.describe())
+        if not args.dry_run:
+            tqdm.write(write_stats.summary())
+    tqdm.write(get_client().describe())
 
     tqdm.write("\nDone." if not args.dry_run else "\nDry run complete. Re-run without --dry-run to apply changes.")
 
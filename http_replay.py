@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+http_replay.py
+
+Record the web traffic of the tools in this folder, and replay it from a
+local stand-in server -- so throughput, retry and concurrency changes can
+be measured (and the tools run end to end) on a machine with no network,
+against the same answers every time.
+
+Every client that goes out to the web hands its session to attach():
+
+    - lastfm_api.LastFmClient (genre tagger, capitalisation fixer,
+      wishlistcehcker.py, vinyl_finder's Last.fm client)
+    - the MusicBrainz ID tagger's session (mb_request)
+    - vinyl_finder's DiscogsClient, JBHiFiClient and CurrencyConverter
+    - image_fixer's gallery scraper (a curl_cffi session)
+
+attach() does nothing unless one of these is set in the environment:
+
+    HTTP_REPLAY_RECORD=FILE   every request goes out as usual, and the
+                              request/response pair is appended to FILE
+                              (JSON lines; a 2nd run appends to it)
+    HTTP_REPLAY_SERVER=URL    every request is sent to the stand-in at URL
+                              instead (e.g. http://127.0.0.1:8765)
+
+Recordings are keyed on method + URL with the query parameters sorted;
+credentials (api_key, token, ...) are left out of both the key and the
+file, so a recording can be shared. Only the response's status, body,
+Content-Type and Retry-After are kept.
+
+The stand-in answers a recorded request with its recorded response (the
+last successful one, if it was recorded more than once) and anything else
+with a 404. It can also make the network worse on purpose:
+
+    --latency / --jitter      seconds added to every response (or
+                              --recorded-latency: however long it took
+                              when it was recorded)
+    --rate / --burst          per-host token bucket; past it a request gets
+                              the host's rate-limit reply (HTTP 429 with
+                              Last.fm's error 29 body, 503 for MusicBrainz)
+    --error-rate              fraction of requests answered with a 503
+
+Usage:
+    # Record a real run
+    HTTP_REPLAY_RECORD=lastfm.jsonl python "genre tagger.py" /music --no-prompt
+
+    # Replay it with 80 ms of latency and Last.fm's 5 requests/s limit
+    # (RATE_GOVERNOR=off: let the stand-in, not rate_governor.py, push back)
+    python http_replay.py serve lastfm.jsonl --port 8765 --latency 0.08 --rate 5
+    HTTP_REPLAY_SERVER=http://127.0.0.1:8765 RATE_GOVERNOR=off python "genre tagger.py" /music --no-prompt
+
+    python http_replay.py stats lastfm.jsonl
+
+From Python (benchmarks): `with StandInServer("lastfm.jsonl", latency=0.08)
+as server:` starts it on a free port in a background thread; set
+os.environ["HTTP_REPLAY_SERVER"] = server.url before the clients are made.
+
+No third-party requirements.
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+RECORD_ENV = "HTTP_REPLAY_RECORD"
+SERVER_ENV = "HTTP_REPLAY_SERVER"
+
+DEFAULT_PORT = 8765
+
+# Never written to a recording, never part of a key.
+SECRET_PARAMS = {"api_key", "api_sig", "sk", "token", "key", "secret", "access_token"}
+KEPT_HEADERS = ("content-type", "retry-after")
+
+# What each host says when it's rate-limited.
+RATE_LIMIT_REPLIES = {
+    "ws.audioscrobbler.com": (429, {"error": 29, "message": "Rate Limit Exceeded"}),
+    "musicbrainz.org": (503, {"error": "Your requests are exceeding the allowable rate limit."}),
+}
+DEFAULT_RATE_LIMIT_REPLY = (429, {"error": "Too many requests"})
+
+
+def request_key(method, url, params=None):
+    """method + URL with the query (URL's own + params) sorted and the
+    credentials dropped."""
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        query += [(str(k), str(v)) for k, v in items if v is not None]
+    query = sorted((k, v) for k, v in query if k not in SECRET_PARAMS)
+    path = urllib.parse.quote(urllib.parse.unquote(parts.path or "/"))
+    clean = urllib.parse.urlunsplit((parts.scheme, parts.netloc.lower(), path,
+                                     urllib.parse.urlencode(query), ""))
+    return f"{method.upper()} {clean}"
+
+
+# --------------------------------------------------------------------------
+# Client side
+# --------------------------------------------------------------------------
+
+_record_lock = threading.Lock()
+
+
+def _record(path, key, resp, elapsed):
+    content = resp.content or b""
+    try:
+        body, encoding = content.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        body, encoding = base64.b64encode(content).decode("ascii"), "base64"
+    headers = {name: resp.headers.get(name) for name in KEPT_HEADERS if resp.headers.get(name)}
+    entry = {"key": key, "status": resp.status_code, "headers": headers, "body": body,
+             "encoding": encoding, "elapsed": round(elapsed, 4)}
+    with _record_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def attach(session):
+    """
+    Route a requests / curl_cffi session through the recorder or the
+    stand-in server, as the environment says (see the module docstring).
+    Returns the session, so it can wrap the constructor call.
+    """
+    record_path = os.environ.get(RECORD_ENV)
+    server = os.environ.get(SERVER_ENV)
+    if not record_path and not server:
+        return session
+
+    send = session.request
+
+    def request(method, url, *args, **kwargs):
+        if server:
+            parts = urllib.parse.urlsplit(url)
+            local = f"{server.rstrip('/')}/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+            if parts.query:
+                local += "?" + parts.query
+            return send(method, local, *args, **kwargs)
+        started = time.monotonic()
+        resp = send(method, url, *args, **kwargs)
+        _record(record_path, request_key(method, url, kwargs.get("params")), resp, time.monotonic() - started)
+        return resp
+
+    session.request = request
+    return session
+
+
+# --------------------------------------------------------------------------
+# Stand-in server
+# --------------------------------------------------------------------------
+
+def load_recording(path):
+    """{key: [entry, ...]} in recorded order."""
+    entries = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries.setdefault(entry["key"], []).append(entry)
+    return entries
+
+
+class _Bucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class StandInServer:
+    """
+    Threaded local HTTP server replaying a recording. Requests arrive as
+    /<scheme>/<host>/<path>?<query> (what attach() sends).
+    """
+
+    def __init__(self, recording, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, recorded_latency=False,
+                 rate=None, burst=5, error_rate=0.0, seed=None):
+        self.entries = load_recording(recording)
+        self.latency = latency
+        self.jitter = jitter
+        self.recorded_latency = recorded_latency
+        self.rate = rate
+        self.burst = burst
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.handle(self)
+
+            do_HEAD = do_GET
+            do_POST = do_GET
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return Handler
+
+    def _choose(self, key):
+        """The response to replay for key, or None."""
+        recorded = self.entries.get(key)
+        if not recorded:
+            return None
+        ok = [entry for entry in recorded if 200 <= entry["status"] < 300]
+        return (ok or recorded)[-1]
+
+    def handle(self, handler):
+        scheme, _, rest = handler.path.lstrip("/").partition("/")
+        netloc, _, path = rest.partition("/")
+        key = request_key(handler.command, f"{scheme}://{netloc}/{path}")
+        host = netloc.split(":")[0].lower()
+
+        with self._lock:
+            limited = False
+            if self.rate:
+                bucket = self._buckets.setdefault(host, _Bucket(self.rate, self.burst))
+                limited = not bucket.take()
+            failed = not limited and self.error_rate and self.random.random() < self.error_rate
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+        entry = self._choose(key)
+        if self.recorded_latency and entry is not None:
+            delay = entry.get("elapsed", 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        if limited:
+            status, body = next((reply for suffix, reply in RATE_LIMIT_REPLIES.items()
+                                 if host == suffix or host.endswith("." + suffix)), DEFAULT_RATE_LIMIT_REPLY)
+            self._reply(handler, status, json.dumps(body).encode("utf-8"),
+                        {"Content-Type": "application/json", "Retry-After": "1"}, "rate_limited")
+        elif failed:
+            self._reply(handler, 503, b"Service Unavailable (injected)", {"Content-Type": "text/plain"}, "errors")
+        elif entry is None:
+            self._reply(handler, 404, f"Not recorded: {key}".encode("utf-8"), {"Content-Type": "text/plain"},
+                        "not_recorded")
+        else:
+            body = entry["body"]
+            data = base64.b64decode(body) if entry.get("encoding") == "base64" else body.encode("utf-8")
+            headers = {name.title(): value for name, value in entry.get("headers", {}).items()}
+            self._reply(handler, entry["status"], data, headers, "replayed")
+
+    def _reply(self, handler, status, data, headers, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        if handler.command != "HEAD":
+            handler.wfile.write(data)
+
+    def describe(self):
+        return (f"Stand-in: {self.counts['replayed']} replayed, {self.counts['rate_limited']} rate-limited, "
+                f"{self.counts['errors']} injected error(s), {self.counts['not_recorded']} not recorded.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded HTTP traffic from a local stand-in server.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_p = sub.add_parser("serve", help="Serve a recording until interrupted.")
+    serve_p.add_argument("recording", help="JSON-lines file written with HTTP_REPLAY_RECORD")
+    serve_p.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve_p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    serve_p.add_argument("--latency", type=float, default=0.0,
+                         help="Seconds added to every response (default: 0)")
+    serve_p.add_argument("--jitter", type=float, default=0.0,
+                         help="Up to this many more seconds, at random (default: 0)")
+    serve_p.add_argument("--recorded-latency", action="store_true",
+                         help="Take as long as each request took when it was recorded (overrides --latency)")
+    serve_p.add_argument("--rate", type=float, default=None,
+                         help="Requests per second allowed per host before rate-limit replies (default: no limit)")
+    serve_p.add_argument("--burst", type=int, default=5, help="Burst allowed by --rate (default: 5)")
+    serve_p.add_argument("--error-rate", type=float, default=0.0,
+                         help="Fraction of requests answered with a 503 (default: 0)")
+    serve_p.add_argument("--seed", type=int, default=None, help="Random seed for --jitter/--error-rate")
+
+    stats_p = sub.add_parser("stats", help="Summarise a recording.")
+    stats_p.add_argument("recording")
+    args = parser.parse_args()
+
+    if not Path(args.recording).is_file():
+        print(f"Error: '{args.recording}' not found.")
+        sys.exit(1)
+
+    if args.command == "stats":
+        entries = load_recording(args.recording)
+        hosts = Counter()
+        statuses = Counter()
+        for key, recorded in entries.items():
+            hosts[urllib.parse.urlsplit(key.split(" ", 1)[1]).netloc] += len(recorded)
+            statuses.update(entry["status"] for entry in recorded)
+        print(f"{sum(hosts.values())} response(s) for {len(entries)} distinct request(s).")
+        for host, count in hosts.most_common():
+            print(f"  {host:<32} {count:>6}")
+        print("Status codes: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+        return
+
+    server = StandInServer(args.recording, host=args.host, port=args.port, latency=args.latency,
+                           jitter=args.jitter, recorded_latency=args.recorded_latency, rate=args.rate,
+                           burst=args.burst, error_rate=args.error_rate, seed=args.seed)
+    print(f"Replaying {sum(len(v) for v in server.entries.values())} recorded response(s) at {server.url}")
+    print(f"Point the tools at it with: {SERVER_ENV}={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print("\n" + server.describe())
+
+
+if __name__ == "__main__":
+    main()
@@ -13,13 +13,17 @@ FLAC file in the target folder:
   * Any other embedded picture types (back cover, leaflet, etc.) are dropped.
 
 Pipeline:
-  1. Scan for FLAC files, group by (album artist, album) and by album artist.
+  1. Scan for FLAC files ONCE into a snapshot (grouping keys, picture list
+     with digests, file identity) via the shared library index, then group
+     by (album artist, album) and by album artist. Nothing re-opens a file
+     after this except to copy out one chosen picture or to write.
   2. For each album: find the best existing front cover across its tracks.
      If missing or it fails the quality bar, try to fix it (ffmpeg compress
      if just oversized, otherwise search Last.fm and let the user pick).
   3. For each artist: find an existing artist image, or search Last.fm.
   4. Write the final [front cover, artist image] pair into every track,
-     skipping files that already have exactly that pair.
+     skipping files that already have exactly that pair (decided by
+     comparing SHA-256 digests cached in the index, not image bytes).
 
 Requires: mutagen, Pillow, matplotlib, beautifulsoup4, curl_cffi, tqdm, ffmpeg.
 """
@@ -49,11 +53,21 @@ from curl_cffi import requests
 
 import matplotlib
 
+import http_replay
+from flac_meta import PICTURE, read_flac_metadata
+from flac_writer import DEFAULT_PADDING_RESERVE, WriteStats, save_flac
+from library_daemon import daemon_records
+from library_index import DEFAULT_INDEX_FILE, LibraryIndex, picture_digest
+from library_walk import walk_files
+
 # ============================================================================
 # CONFIG
 # ============================================================================
 
 RECURSIVE = True
+INDEX_FILE = DEFAULT_INDEX_FILE   # shared library index; None = don't persist
+USE_DAEMON = True                 # ask a running library_daemon.py before scanning
+PADDING_RESERVE = DEFAULT_PADDING_RESERVE  # bytes of padding added on a full rewrite
 MIN_RESOLUTION = 600          # pixels, both width and height
 MAX_SIZE_BYTES = 2 * 1024 * 1024  # 2 MB
 
@@ -131,50 +145,86 @@ def close_preview():
 # ============================================================================
 
 def find_flacs(folder):
-    flac_files = []
-    for root, dirs, files in os.walk(folder):
-        for f in files:
-            if f.lower().endswith(".flac"):
-                flac_files.append(os.path.join(root, f))
-        if not RECURSIVE:
-            break
-    return flac_files
-
-
-def read_album_artist_keys(path):
-    """Return (album, album_artist) with sane fallbacks, or (None, None)."""
-    try:
-        audio = FLAC(path)
-    except Exception as e:
-        print(f"Error reading {path}: {e}")
-        return None, None
-    album = audio.get("album", [None])[0] or "Unknown Album"
+    """Every .flac under folder; unchanged folders come from the directory
+    cache instead of being re-listed (see library_walk.py)."""
+    return [path for path in walk_files(folder, INDEX_FILE, recursive=RECURSIVE)
+            if path.lower().endswith(".flac")]
+
+
+def album_artist_keys(tags):
+    """Return (album, album_artist) with sane fallbacks."""
+    album = tags.get("album", [None])[0] or "Unknown Album"
     album_artist = (
-        audio.get("albumartist", audio.get("artist", [None]))[0] or "Unknown Artist"
+        tags.get("albumartist", tags.get("artist", [None]))[0] or "Unknown Artist"
     )
     return album, album_artist
 
 
-def group_by_album(flac_files):
-    """{(album_artist, album): [file_path, ...]}"""
+class SnapshotEntry:
+    """One file's state as of the library scan: grouping keys, its embedded
+    pictures (type, mime, width, height, length, sha256 - no image bytes)
+    and its identity (size, mtime) at the time it was read."""
+    __slots__ = ("path", "album", "album_artist", "pictures", "size", "mtime_ns")
+
+    def __init__(self, path, album, album_artist, pictures, size, mtime_ns):
+        self.path = path
+        self.album = album
+        self.album_artist = album_artist
+        self.pictures = pictures
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+
+def build_snapshot(flac_files):
+    """Read every file once (or not at all, if the shared library index
+    already has it) and return [SnapshotEntry, ...]. Every later step of
+    the pipeline works from this instead of re-opening files."""
+    with LibraryIndex(INDEX_FILE) as index:
+        records, unreadable = index.scan(flac_files)
+    return snapshot_from_records(records, unreadable)
+
+
+def snapshot_from_records(records, unreadable):
+    """[SnapshotEntry, ...] from library index / daemon records."""
+    for path, e in unreadable:
+        print(f"Error reading {path}: {e}")
+    snapshot = []
+    for rec in records:
+        album, album_artist = album_artist_keys(rec.tags)
+        snapshot.append(SnapshotEntry(rec.path, album, album_artist, rec.pictures,
+                                      rec.size, rec.mtime_ns))
+    return snapshot
+
+
+def group_by_album(snapshot):
+    """{(album_artist, album): [SnapshotEntry, ...]}"""
     albums = defaultdict(list)
-    for path in flac_files:
-        album, album_artist = read_album_artist_keys(path)
-        if album and album_artist:
-            albums[(album_artist, album)].append(path)
+    for entry in snapshot:
+        if entry.album and entry.album_artist:
+            albums[(entry.album_artist, entry.album)].append(entry)
     return albums
 
 
-def group_by_artist(flac_files):
-    """{album_artist: [file_path, ...]}"""
+def group_by_artist(snapshot):
+    """{album_artist: [SnapshotEntry, ...]}"""
     artists = defaultdict(list)
-    for path in flac_files:
-        _, album_artist = read_album_artist_keys(path)
-        if album_artist:
-            artists[album_artist].append(path)
+    for entry in snapshot:
+        if entry.album_artist:
+            artists[entry.album_artist].append(entry)
     return artists
 
 
+def load_picture_bytes(path, position):
+    """Copy out the bytes of the position-th embedded picture of one file,
+    without parsing or loading any of its other pictures."""
+    try:
+        with read_flac_metadata(path, blocks={PICTURE}) as meta:
+            return bytes(meta.pictures[position].data)
+    except Exception as e:
+        print(f"Error reading pictures from {path}: {e}")
+        return None
+
+
 # ============================================================================
 # QUALITY CHECK / COMPRESSION
 # ============================================================================
@@ -273,7 +323,7 @@ HEADERS = {
     "Upgrade-Insecure-Requests": "1",
 }
 
-session = requests.Session(impersonate=IMPERSONATE)
+session = http_replay.attach(requests.Session(impersonate=IMPERSONATE))
 session.headers.update(HEADERS)
 
 _warmed_up = False
@@ -467,33 +517,27 @@ def interactive_lastfm_picker(artist, album, label):
 # EXISTING PICTURE HELPERS
 # ============================================================================
 
-def best_existing_front_cover(files):
-    """Highest-resolution type-3 picture found across a set of FLAC files."""
-    best_pic, best_score = None, -1
-    for path in files:
-        try:
-            audio = FLAC(path)
-        except Exception as e:
-            print(f"Error reading pictures from {path}: {e}")
-            continue
-        for pic in audio.pictures:
-            if pic.type == 3:
-                score = pic.width * pic.height
+def best_existing_front_cover(entries):
+    """Bytes of the highest-resolution type-3 picture found across a set
+    of snapshot entries. Only the winning picture's payload is read."""
+    best, best_score = None, -1
+    for entry in entries:
+        for position, pic in enumerate(entry.pictures):
+            if pic["type"] == 3:
+                score = pic["width"] * pic["height"]
                 if score > best_score:
-                    best_pic, best_score = pic, score
-    return best_pic
-
-
-def existing_artist_image(files):
-    """First type-8 picture data found across a set of FLAC files."""
-    for path in files:
-        try:
-            audio = FLAC(path)
-        except Exception:
-            continue
-        for pic in audio.pictures:
-            if pic.type == 8:
-                return pic.data
+                    best, best_score = (entry.path, position), score
+    return load_picture_bytes(*best) if best else None
+
+
+def existing_artist_image(entries):
+    """Bytes of the first type-8 picture found across a set of snapshot entries."""
+    for entry in entries:
+        for position, pic in enumerate(entry.pictures):
+            if pic["type"] == 8:
+                data = load_picture_bytes(entry.path, position)
+                if data is not None:
+                    return data
     return None
 
 
@@ -505,31 +549,26 @@ def make_picture(image_data, pic_type, mime="image/jpeg"):
     return pic
 
 
-def current_pair_matches(path, front_bytes, artist_bytes):
+def current_pair_matches(entry, front_digest, artist_digest):
     """True if the file already has exactly [front(type3), artist(type8)]
-    matching the given bytes, in that order."""
-    try:
-        audio = FLAC(path)
-    except Exception:
-        return False
-    pics = audio.pictures
-    expected_len = (1 if front_bytes else 0) + (1 if artist_bytes else 0)
-    if len(pics) != expected_len:
+    with the given picture digests, in that order. Decided purely from the
+    snapshot's cached digests - the file itself is never opened."""
+    expected = []
+    if front_digest:
+        expected.append((3, front_digest))
+    if artist_digest:
+        expected.append((8, artist_digest))
+    pics = entry.pictures
+    if len(pics) != len(expected):
         return False
-    i = 0
-    if front_bytes:
-        if i >= len(pics) or pics[i].type != 3 or pics[i].data != front_bytes:
-            return False
-        i += 1
-    if artist_bytes:
-        if i >= len(pics) or pics[i].type != 8 or pics[i].data != artist_bytes:
-            return False
-    return True
-
-
-def write_front_and_artist(path, front_bytes, artist_bytes):
+    return all(pic["type"] == pic_type and pic["sha256"] == digest
+               for pic, (pic_type, digest) in zip(pics, expected))
+
+
+def write_front_and_artist(path, front_bytes, artist_bytes, stats=None):
     """Overwrite a file's pictures with exactly [front(type3), artist(type8)],
-    dropping every other embedded picture type."""
+    dropping every other embedded picture type. Swapping in a smaller image
+    (or one within the padding reserve) is written in place."""
     try:
         audio = FLAC(path)
         audio.clear_pictures()
@@ -537,7 +576,7 @@ def write_front_and_artist(path, front_bytes, artist_bytes):
             audio.add_picture(make_picture(front_bytes, 3))
         if artist_bytes:
             audio.add_picture(make_picture(artist_bytes, 8))
-        audio.save()
+        save_flac(audio, PADDING_RESERVE, stats)
         return True
     except Exception as e:
         print(f"   ✗ Failed {os.path.basename(path)}: {e}")
@@ -551,8 +590,7 @@ def write_front_and_artist(path, front_bytes, artist_bytes):
 def resolve_album_cover(album_name, artist_name, files):
     """Return validated front-cover bytes for an album, or None if none
     could be obtained (existing cover kept as-is / album left without one)."""
-    best_pic = best_existing_front_cover(files)
-    candidate = best_pic.data if best_pic else None
+    candidate = best_existing_front_cover(files)
 
     if candidate:
         is_valid, w, h, size, issue = check_image_quality(candidate)
@@ -601,15 +639,23 @@ def process_library(folder):
         print(f"Error: {folder} is not a valid directory")
         sys.exit(1)
 
-    print("Scanning for FLAC files...")
-    flac_files = find_flacs(folder)
-    if not flac_files:
+    found = daemon_records(folder, path_type=str) if USE_DAEMON and RECURSIVE else None
+    if found is not None:
+        print(f"Library daemon: {len(found[0])} FLAC files served from memory.\n")
+        snapshot = snapshot_from_records(*found)
+    else:
+        print("Scanning for FLAC files...")
+        flac_files = find_flacs(folder)
+        if not flac_files:
+            print("No FLAC files found.")
+            sys.exit(0)
+        print(f"Found {len(flac_files)} FLAC files.\n")
+        snapshot = build_snapshot(flac_files)
+    if not snapshot:
         print("No FLAC files found.")
         sys.exit(0)
-    print(f"Found {len(flac_files)} FLAC files.\n")
-
-    albums = group_by_album(flac_files)
-    artists = group_by_artist(flac_files)
+    albums = group_by_album(snapshot)
+    artists = group_by_artist(snapshot)
     print(f"Found {len(albums)} albums across {len(artists)} artists.\n")
 
     try:
@@ -635,20 +681,25 @@ def process_library(folder):
     # --- Step 3: write final [front, artist] pair into every track ---
     print(f"{'=' * 60}\nApplying final images to all tracks...\n{'=' * 60}")
     updated, skipped, failed = 0, 0, 0
+    write_stats = WriteStats()
+    artist_digests = {name: picture_digest(data) for name, data in artist_images.items() if data}
     for (artist_name, album_name), files in tqdm(albums.items(), desc="Writing"):
         front_bytes = album_covers.get((artist_name, album_name))
         artist_bytes = artist_images.get(artist_name)
-        for path in files:
-            if current_pair_matches(path, front_bytes, artist_bytes):
+        front_digest = picture_digest(front_bytes) if front_bytes else None
+        artist_digest = artist_digests.get(artist_name)
+        for entry in files:
+            if current_pair_matches(entry, front_digest, artist_digest):
                 skipped += 1
                 continue
-            if write_front_and_artist(path, front_bytes, artist_bytes):
+            if write_front_and_artist(entry.path, front_bytes, artist_bytes, write_stats):
                 updated += 1
             else:
                 failed += 1
 
     print(f"\n{'=' * 60}")
     print(f"Done. Updated: {updated}   Already correct: {skipped}   Failed: {failed}")
+    print(write_stats.summary())
     print(f"{'=' * 60}")
 
 
@@ -0,0 +1,273 @@
+"""
+lastfm_api.py
+
+One Last.fm API client shared by every tool that talks to Last.fm (the
+genre tagger, the capitalisation fixer, wishlistcehcker.py and
+vinyl_finder).
+
+Each of those used to call requests.get (or its own Session) and then
+time.sleep() a fixed delay after every request, which keeps a bulk run
+well below what the API allows and still opens a fresh connection each
+time. This client instead:
+
+    - keeps one requests.Session with a keep-alive connection pool, so
+      requests reuse an open HTTPS connection
+    - paces requests with a token bucket (default 5/s with a burst of 5,
+      Last.fm's documented per-key limit): a request only waits when the
+      budget is actually spent, never after a request that was fast
+    - allows a bounded number of requests in flight at once, so callers
+      can fan out over a thread pool without flooding the API
+    - also draws every request from the machine-wide Last.fm budget
+      (rate_governor.py), so several tools running at once stay under
+      the per-key limit together
+    - retries with exponential backoff on Last.fm error 29 (rate limit
+      exceeded) and the temporary errors (8, 11, 16), as well as HTTP 429 /
+      5xx and dropped connections. A rate-limit error also pauses the
+      bucket, so every thread backs off together.
+    - optionally answers from a persistent response cache first
+      (lastfm_cache.ResponseCache), so a re-run only sends what isn't
+      cached; "not found" replies are cached as well. An offline client
+      answers from that cache alone and raises NotCached for anything
+      else, without ever opening a connection
+
+Usage:
+
+    from lastfm_api import LastFmError, get_client
+
+    client = get_client()
+    data = client.get({"method": "album.gettoptags", "artist": a, "album": b, "api_key": key})
+
+get() fills in format=json (and api_key, if the client was made with
+one), returns the decoded JSON, and raises:
+    - LastFmError for an API error reply (with .code)
+    - requests.RequestException when the request itself failed after
+      retrying
+    - ValueError for a reply that isn't JSON
+    - NotCached, from an offline client, for a request with no cached
+      reply (its own exception, not a ValueError: catch it separately)
+
+get_client() returns one client per process, so every module in a run
+shares the same budget; make a LastFmClient directly for a separate one.
+Pass cache=lastfm_cache.ResponseCache() to either to enable caching;
+get(params, use_cache=False) bypasses it for one request;
+get(params, refresh=True) skips the cached reply but caches the new one.
+
+Requirements:
+    pip install requests
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import http_replay
+from rate_governor import governor
+
+API_HOST = "ws.audioscrobbler.com"
+API_ROOT = f"https://{API_HOST}/2.0/"
+
+DEFAULT_RATE = 5.0          # requests per second, sustained
+DEFAULT_BURST = 5           # requests allowed back-to-back after an idle spell
+DEFAULT_MAX_IN_FLIGHT = 4   # concurrent requests
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_TIMEOUT = 15
+USER_AGENT = "Music-Misc/1.0 (FLAC library tools)"
+
+RATE_LIMIT_ERROR = 29
+# Operation failed (8), service offline (11), temporary error (16): all
+# worth another try after a pause.
+RETRYABLE_ERRORS = {8, 11, 16, RATE_LIMIT_ERROR}
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0          # seconds; doubled per attempt
+BACKOFF_MAX = 30.0
+# Invalid parameters (6) is how Last.fm says "no such artist/album/track";
+# the answer won't change on a retry, so it's cached like a reply.
+CACHEABLE_ERRORS = {6}
+
+
+class LastFmError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"Last.fm API error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class NotCached(Exception):
+    """An offline client was asked for something its cache doesn't hold."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket. acquire() takes one token, sleeping only
+    if none is available."""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = max(self.paused_until - now, (1.0 - self.tokens) / self.rate)
+                self.waited += wait
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds` (after a rate-limit
+        reply) and start again from an empty bucket."""
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+class LastFmClient:
+    def __init__(self, api_key=None, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_retries=DEFAULT_MAX_RETRIES,
+                 timeout=DEFAULT_TIMEOUT, user_agent=USER_AGENT, cache=None, offline=False, shared_limit=True):
+        self.api_key = api_key
+        self.cache = cache
+        self.offline = offline
+        self.bucket = TokenBucket(rate, burst)
+        # Shared with every other process on this machine (rate_governor.py).
+        self.governor = governor(API_HOST) if shared_limit else None
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.session = http_replay.attach(requests.Session())
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": user_agent, "Accept": "application/json"})
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self._thread_stats = threading.local()
+
+    def get(self, params, use_cache=True, refresh=False):
+        """Send one API request (params must include "method") and return
+        the decoded JSON. See the module docstring for what it raises.
+        refresh=True asks Last.fm even if a reply is cached, and caches
+        the new one in its place."""
+        query = {"format": "json", **params}
+        if self.api_key and "api_key" not in query:
+            query["api_key"] = self.api_key
+
+        cache = self.cache if use_cache else None
+        if cache is not None and not refresh:
+            data = cache.get(query)
+            if data is not None:
+                if "error" in data:
+                    raise LastFmError(data["error"], data.get("message"))
+                return data
+        if self.offline:
+            raise NotCached(params.get("method"))
+
+        self._thread_stats.sent = self.sent_by_thread() + 1
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            if self.governor is not None:
+                self.governor.acquire()
+            with self._slots:
+                with self._stats_lock:
+                    self.requests += 1
+                try:
+                    resp = self.session.get(API_ROOT, params=query, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt >= self.max_retries:
+                        raise
+                    resp = None
+
+            retry_after = None
+            rate_limited = False
+            if resp is not None:
+                try:
+                    data = resp.json()
+                except ValueError:
+                    data = None
+                if isinstance(data, dict) and "error" in data:
+                    code = data.get("error")
+                    if code not in RETRYABLE_ERRORS or attempt >= self.max_retries:
+                        if cache is not None and code in CACHEABLE_ERRORS:
+                            cache.put(query, {"error": code, "message": data.get("message")})
+                        raise LastFmError(code, data.get("message"))
+                    if code == RATE_LIMIT_ERROR:
+                        rate_limited = True
+                        retry_after = _retry_after(resp)
+                elif resp.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                    rate_limited = resp.status_code == 429
+                    retry_after = _retry_after(resp)
+                else:
+                    resp.raise_for_status()
+                    if data is None:
+                        raise ValueError(f"Last.fm returned a non-JSON reply for {params.get('method')}")
+                    if cache is not None:
+                        cache.put(query, data)
+                    return data
+
+            delay = retry_after if retry_after is not None else min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            self.bucket.pause(delay)
+            if rate_limited and self.governor is not None:
+                # Everyone else sharing the key backs off too.
+                self.governor.pause(delay)
+            with self._stats_lock:
+                self.retries += 1
+            attempt += 1
+
+    def sent_by_thread(self):
+        """How many get() calls from the calling thread have gone to Last.fm
+        so far (retries not counted); cached answers don't count."""
+        return getattr(self._thread_stats, "sent", 0)
+
+    def describe(self):
+        summary = (f"Last.fm: {self.requests} request(s), {self.retries} retried, "
+                   f"{self.bucket.waited:.1f}s of rate-limit waits")
+        if self.governor is not None and self.governor.waited:
+            summary += f" (+{self.governor.waited:.1f}s on the machine-wide limit)"
+        summary += "."
+        if self.cache is not None:
+            summary += "\n" + self.cache.describe()
+        return summary
+
+
+def _retry_after(resp):
+    try:
+        return min(BACKOFF_MAX, float(resp.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(api_key=None, **kwargs):
+    """
+    The process-wide client, created on first use with these settings
+    (later calls' settings are ignored, except that an api_key is filled in
+    if the client doesn't have one yet).
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LastFmClient(api_key, **kwargs)
+        elif api_key and not _client.api_key:
+            _client.api_key = api_key
+        return _client
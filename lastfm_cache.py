@@ -0,0 +1,237 @@
+"""
+lastfm_cache.py
+
+On-disk cache of raw Last.fm API responses, shared by the genre tagger
+and the capitalisation fixer through lastfm_api.LastFmClient.
+
+Without it every run re-asks Last.fm for every album's top tags, every
+artist search, every tracklist -- a full-library re-tag after adding ten
+albums costs thousands of requests. With it, only what isn't cached (or
+has expired) goes out, so that run makes about ten albums' worth.
+
+    - keyed by method + normalized parameters: api_key/format are dropped
+      and artist/album/track names are case-folded and trimmed, so
+      "Radiohead" and "radiohead " share one entry
+    - a time-to-live per method (TTLS below): tags and tracklists barely
+      change, search results a bit more, per-user stats quickly. Error
+      replies (e.g. "album not found") are cached too, for ERROR_TTL
+    - a size cap (bytes of stored JSON) with least-recently-used eviction
+    - hit / miss / expired / stored / evicted counters, see describe()
+
+Stored in SQLite (same directory as the library index), safe to share
+between threads of one process.
+
+Usage:
+
+    from lastfm_api import get_client
+    from lastfm_cache import ResponseCache
+
+    get_client(api_key, cache=ResponseCache())   # LastFmClient checks it first
+
+    python lastfm_cache.py stats
+    python lastfm_cache.py clear
+
+No third-party requirements.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_FILE = Path.home() / ".lastfm_genre_tagger" / "lastfm_cache.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+DAY = 24 * 3600
+TTLS = {
+    "album.gettoptags": 30 * DAY,
+    "artist.gettoptags": 30 * DAY,
+    "track.gettoptags": 30 * DAY,
+    "album.getinfo": 14 * DAY,
+    "artist.getinfo": 14 * DAY,
+    "album.search": 7 * DAY,
+    "artist.search": 7 * DAY,
+    "track.search": 7 * DAY,
+}
+DEFAULT_TTL = 7 * DAY
+USER_TTL = 3600           # user.* methods: scrobble counts move constantly
+ERROR_TTL = DAY
+
+# Parameters that never change the response.
+IGNORED_PARAMS = {"api_key", "format"}
+# Free-text parameters Last.fm matches case-insensitively.
+NAME_PARAMS = {"artist", "album", "track", "mbid"}
+
+# Check the size cap every this many stores, not on every one.
+EVICT_EVERY = 100
+
+
+def cache_key(params):
+    """Stable key for one request: method + normalized parameters."""
+    method = str(params.get("method", "")).lower()
+    items = []
+    for name, value in params.items():
+        if name in IGNORED_PARAMS or name == "method":
+            continue
+        value = str(value)
+        if name in NAME_PARAMS:
+            value = " ".join(value.split()).casefold()
+        items.append((name, value))
+    return method + "?" + json.dumps(sorted(items), ensure_ascii=False, separators=(",", ":"))
+
+
+def ttl_for(method):
+    method = method.lower()
+    if method.startswith("user."):
+        return USER_TTL
+    return TTLS.get(method, DEFAULT_TTL)
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of decoded Last.fm replies. get() returns the
+    stored JSON (an error reply is returned as {"error": code, "message":
+    ...}) or None; put() stores one.
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES):
+        cache_file = Path(cache_file).expanduser()
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(cache_file)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " method TEXT NOT NULL,"
+            " body TEXT NOT NULL,"
+            " expires REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def get(self, params):
+        key = cache_key(params)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT body, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[1] < now:
+                self.expired += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, params, data):
+        key = cache_key(params)
+        method = str(params.get("method", "")).lower()
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        size = len(body.encode("utf-8"))
+        now = time.time()
+        ttl = ERROR_TTL if isinstance(data, dict) and "error" in data else ttl_for(method)
+        with self._lock:
+            with self.conn:
+                old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, method, body, expires, accessed, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, method, body, now + ttl, now, size),
+                )
+            self.total_bytes += size - (old[0] if old else 0)
+            self.stored += 1
+            self._since_evict += 1
+            if self._since_evict >= EVICT_EVERY or self.total_bytes > self.max_bytes * 1.1:
+                self._evict()
+
+    def _evict(self):
+        """Drop expired entries, then least-recently-used ones until the
+        cache is back under max_bytes. Caller holds the lock."""
+        self._since_evict = 0
+        with self.conn:
+            self.evicted += self.conn.execute("DELETE FROM responses WHERE expires < ?", (time.time(),)).rowcount
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if self.total_bytes <= self.max_bytes:
+                return
+            excess = self.total_bytes - self.max_bytes
+            doomed = []
+            for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                doomed.append((key,))
+                excess -= size
+                self.total_bytes -= size
+                if excess <= 0:
+                    break
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.evicted += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM responses")
+            self.total_bytes = 0
+
+    def entries(self):
+        """{method: (count, bytes)} of what's stored."""
+        with self._lock:
+            rows = self.conn.execute("SELECT method, COUNT(*), SUM(size) FROM responses GROUP BY method")
+            return {method: (count, size) for method, count, size in rows}
+
+    def describe(self):
+        return (f"Last.fm cache: {self.hits} hit(s), {self.misses} miss(es), {self.expired} expired, "
+                f"{self.stored} stored, {self.evicted} evicted ({self.total_bytes / 1024 ** 2:.1f} MB, "
+                f"{self.path}).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the Last.fm response cache.")
+    parser.add_argument("command", choices=("stats", "clear"))
+    parser.add_argument("--cache-file", type=str, default=str(DEFAULT_CACHE_FILE),
+                        help=f"Cache file (default: {DEFAULT_CACHE_FILE})")
+    args = parser.parse_args()
+
+    with ResponseCache(args.cache_file) as cache:
+        if args.command == "clear":
+            cache.clear()
+            print(f"Cleared {cache.path}")
+            return 0
+        entries = cache.entries()
+        if not entries:
+            print(f"{cache.path} is empty.")
+            return 0
+        for method, (count, size) in sorted(entries.items()):
+            print(f"{method:<22} {count:>8} entr{'y' if count == 1 else 'ies'} {size / 1024:>10.1f} KB")
+        print(f"{'total':<22} {sum(c for c, _ in entries.values()):>8}         "
+              f"{cache.total_bytes / 1024 ** 2:>7.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+library_daemon.py
+
+Long-running local daemon that keeps the library's tags and picture
+digests in memory, kept current with inotify, and answers queries over a
+Unix socket.
+
+Every tool in this folder is a short-lived process: interpreter start-up,
+imports, a walk of the library and an index lookup per file before any
+real work. With the daemon running, the scans in the genre tagger,
+capitalisation fixer, MusicBrainz ID tagger, image_fixer and final_check
+instead ask it for the records under their folder and get them back in
+milliseconds. When it isn't running (or doesn't watch that folder) they
+silently fall back to the library index exactly as before.
+
+What it does:
+    - on start, loads every FLAC under the watched folders through the
+      shared library index (library_index.py), so a restart is cheap too
+    - watches every folder under them with inotify; a file that's
+      written, created, moved or deleted is re-read (or dropped) after a
+      short quiet period, and the on-disk index is updated with it
+    - before answering any query it first applies every change inotify
+      has already reported, so a tool that just wrote files never gets a
+      stale answer for them
+
+Queries (one JSON object per line over the socket, see query()):
+    ping                      watched roots, file count
+    files    [root]           full records (path, size, mtime_ns, tags,
+                              streaminfo, pictures) under root
+    albums   [root]           {"albumartist - album": [path, ...]}
+    artists  [root]           {albumartist: [path, ...]}
+    missing  tag [root]       paths with no (or an empty) value for tag
+    pictures [root]           {path: [{type, width, height, sha256}, ...]}
+    stop                      shut the daemon down
+
+Usage:
+    python library_daemon.py serve "/home/adam/driveBig/Music/New unformated songs" \\
+                                   "/home/adam/driveBig/Music/My Playlist"
+    python library_daemon.py query ping
+    python library_daemon.py query missing --tag lyrics --root "/home/adam/driveBig/Music/My Playlist"
+    python library_daemon.py stop
+
+Linux only (inotify). No third-party requirements.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import time
+from pathlib import Path
+
+from library_index import DEFAULT_INDEX_FILE, FileRecord, LibraryIndex, overlay_tags
+from library_scan import DEFAULT_WORKERS
+from library_walk import walk_files
+
+DEFAULT_SOCKET = Path.home() / ".lastfm_genre_tagger" / "library_daemon.sock"
+
+# Seconds without new events before a burst of changes is re-read (a tag
+# write touches a file several times; an album copy creates many files).
+DEBOUNCE = 0.5
+
+# How long a client waits for the daemon before falling back.
+CLIENT_TIMEOUT = 30.0
+
+# linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT = struct.Struct("iIII")
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+class DaemonError(Exception):
+    pass
+
+
+def _is_flac(path):
+    return path.lower().endswith(".flac")
+
+
+def _under(path, root):
+    return path == root or path.startswith(os.path.join(root, ""))
+
+
+# --------------------------------------------------------------------------
+# inotify (via ctypes)
+# --------------------------------------------------------------------------
+
+class Inotify:
+    """Minimal recursive inotify watcher for a set of folder trees."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self._dirs = {}   # wd -> directory path
+        self._wds = {}    # directory path -> wd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def watch_tree(self, top):
+        """Watch top and every folder under it. Returns the folders added."""
+        added = []
+        for dirpath, dirnames, _files in os.walk(top):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached; raise "
+                                       "/proc/sys/fs/inotify/max_user_watches")
+                continue
+            self._dirs[wd] = dirpath
+            self._wds[dirpath] = wd
+            added.append(dirpath)
+        return added
+
+    def forget_tree(self, top):
+        for path in [p for p in self._wds if _under(p, top)]:
+            wd = self._wds.pop(path)
+            self._dirs.pop(wd, None)
+
+    def read_events(self):
+        """Yield (path, mask) for every queued event; (None, IN_Q_OVERFLOW) on overflow."""
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            pos = 0
+            while pos + _EVENT.size <= len(data):
+                wd, mask, _cookie, length = _EVENT.unpack_from(data, pos)
+                pos += _EVENT.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+                pos += length
+                if mask & IN_Q_OVERFLOW:
+                    yield None, mask
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None:
+                    continue
+                if mask & IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    self._wds.pop(directory, None)
+                    continue
+                yield (os.path.join(directory, name) if name else directory), mask
+
+
+# --------------------------------------------------------------------------
+# The daemon
+# --------------------------------------------------------------------------
+
+def _record_to_json(rec):
+    return {"path": str(rec.path), "size": rec.size, "mtime_ns": rec.mtime_ns, "tags": rec.tags,
+            "streaminfo": rec.streaminfo, "pictures": rec.pictures}
+
+
+class LibraryDaemon:
+    """Holds {path: FileRecord} for the watched roots and serves queries."""
+
+    def __init__(self, roots, index_file=DEFAULT_INDEX_FILE, socket_path=DEFAULT_SOCKET,
+                 workers=DEFAULT_WORKERS):
+        self.roots = [os.path.abspath(str(r)) for r in roots]
+        self.index = LibraryIndex(index_file)
+        self.index_file = index_file
+        self.socket_path = Path(socket_path).expanduser()
+        self.workers = workers
+        self.records = {}
+        self.unreadable = {}
+        self.inotify = Inotify()
+        self.dirty = set()
+        self.last_event = 0.0
+        self.running = False
+
+    # --- state ---
+
+    def load_all(self):
+        self.records.clear()
+        self.unreadable.clear()
+        for root in self.roots:
+            self.inotify.watch_tree(root)
+            paths = [p for p in walk_files(root, self.index_file) if _is_flac(p)]
+            records, failed = self.index.scan(paths, root=root, workers=self.workers)
+            for rec in records:
+                self.records[str(rec.path)] = rec
+            for path, e in failed:
+                self.unreadable[str(path)] = str(e)
+        log(f"Loaded {len(self.records)} file(s) under {len(self.roots)} root(s). {self.index.describe()}")
+
+    def note_events(self):
+        """Pull queued inotify events into the dirty set."""
+        for path, mask in self.inotify.read_events():
+            if path is None:
+                log("inotify queue overflowed; reloading everything.")
+                self.dirty.clear()
+                self.load_all()
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # A folder appeared (e.g. an album copied in): watch it
+                    # and pick up whatever is already inside.
+                    self.inotify.watch_tree(path)
+                    self.dirty.update(p for p in walk_files(path, None) if _is_flac(p))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.inotify.forget_tree(path)
+                    self.dirty.update(p for p in list(self.records) + list(self.unreadable) if _under(p, path))
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue
+            elif _is_flac(path):
+                self.dirty.add(path)
+            self.last_event = time.monotonic()
+
+    def apply_changes(self):
+        """Re-read or drop every dirty file."""
+        if not self.dirty:
+            return
+        dirty, self.dirty = sorted(self.dirty), set()
+        present = [p for p in dirty if os.path.isfile(p)]
+        gone = [p for p in dirty if p not in set(present)]
+        records, failed = self.index.scan(present, workers=self.workers) if present else ([], [])
+        for rec in records:
+            self.records[str(rec.path)] = rec
+            self.unreadable.pop(str(rec.path), None)
+        for path, e in failed:
+            self.records.pop(str(path), None)
+            self.unreadable[str(path)] = str(e)
+        for path in gone:
+            self.records.pop(path, None)
+            self.unreadable.pop(path, None)
+        if gone:
+            self.index.forget(gone)
+        log(f"Updated {len(records)} file(s), {len(failed)} unreadable, {len(gone)} removed.")
+
+    def _select(self, root):
+        if root:
+            root = os.path.abspath(root)
+        for path in sorted(self.records):
+            if not root or _under(path, root):
+                yield self.records[path]
+
+    # --- queries ---
+
+    def handle(self, request):
+        cmd = request.get("cmd")
+        root = request.get("root")
+        if root and not any(_under(os.path.abspath(root), r) for r in self.roots):
+            raise DaemonError(f"'{root}' isn't under a watched folder")
+
+        if cmd == "ping":
+            return {"roots": self.roots, "files": len(self.records), "unreadable": len(self.unreadable)}
+        if cmd == "files":
+            unreadable = sorted((p, e) for p, e in self.unreadable.items()
+                                if not root or _under(p, os.path.abspath(root)))
+            return {"records": [_record_to_json(rec) for rec in self._select(root)], "unreadable": unreadable}
+        if cmd == "albums":
+            albums = {}
+            for rec in self._select(root):
+                artist = rec.tag("albumartist") or rec.tag("artist")
+                album = rec.tag("album")
+                if artist and album:
+                    albums.setdefault(f"{artist} - {album}", []).append(str(rec.path))
+            return albums
+        if cmd == "artists":
+            artists = {}
+            for rec in self._select(root):
+                artist = rec.tag("albumartist") or rec.tag("artist")
+                if artist:
+                    artists.setdefault(artist, []).append(str(rec.path))
+            return artists
+        if cmd == "missing":
+            tag = (request.get("tag") or "").lower()
+            if not tag:
+                raise DaemonError("'missing' needs a tag")
+            return [str(rec.path) for rec in self._select(root) if not rec.tag(tag)]
+        if cmd == "pictures":
+            return {
+                str(rec.path): [{k: pic[k] for k in ("type", "width", "height", "sha256")} for pic in rec.pictures]
+                for rec in self._select(root)
+            }
+        if cmd == "stop":
+            self.running = False
+            return "stopping"
+        raise DaemonError(f"unknown command {cmd!r}")
+
+    def _serve_client(self, conn):
+        conn.settimeout(5.0)
+        with conn, conn.makefile("rwb") as stream:
+            line = stream.readline()
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                # Anything inotify already reported is applied first, so a
+                # tool that just wrote files sees its own writes.
+                self.note_events()
+                self.apply_changes()
+                reply = {"ok": True, "result": self.handle(request)}
+            except (ValueError, DaemonError) as e:
+                reply = {"ok": False, "error": str(e)}
+            stream.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+            stream.flush()
+
+    # --- main loop ---
+
+    def _open_socket(self):
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            try:
+                query("ping", socket_path=self.socket_path, timeout=2.0)
+            except DaemonUnavailable:
+                self.socket_path.unlink()   # stale socket from a crashed daemon
+            else:
+                raise DaemonError(f"a daemon is already listening on {self.socket_path}")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)   # socket readable/writable by this user only
+        try:
+            server.bind(str(self.socket_path))
+        finally:
+            os.umask(old_umask)
+        server.listen(16)
+        return server
+
+    def serve_forever(self):
+        server = self._open_socket()
+        self.load_all()
+        log(f"Listening on {self.socket_path}")
+        self.running = True
+        try:
+            while self.running:
+                timeout = None
+                if self.dirty:
+                    timeout = max(0.0, DEBOUNCE - (time.monotonic() - self.last_event))
+                ready, _, _ = select.select([self.inotify.fd, server], [], [], timeout)
+                if self.inotify.fd in ready:
+                    self.note_events()
+                if server in ready:
+                    conn, _ = server.accept()
+                    try:
+                        self._serve_client(conn)
+                    except OSError as e:
+                        log(f"Client error: {e}")
+                if self.dirty and time.monotonic() - self.last_event >= DEBOUNCE:
+                    self.apply_changes()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+            self.inotify.close()
+            self.index.close()
+            log("Stopped.")
+
+
+def log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+# --------------------------------------------------------------------------
+# Client side
+# --------------------------------------------------------------------------
+
+def query(cmd, socket_path=DEFAULT_SOCKET, timeout=CLIENT_TIMEOUT, **params):
+    """
+    Send one query to the daemon and return its result. Raises
+    DaemonUnavailable if no daemon is listening, DaemonError if it
+    rejected the query.
+    """
+    socket_path = Path(socket_path).expanduser()
+    if not hasattr(socket, "AF_UNIX") or not socket_path.exists():
+        raise DaemonUnavailable(f"no daemon socket at {socket_path}")
+    request = dict(params, cmd=cmd)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(socket_path))
+            with sock.makefile("rwb") as stream:
+                stream.write(json.dumps(request).encode("utf-8") + b"\n")
+                stream.flush()
+                line = stream.readline()
+    except OSError as e:
+        raise DaemonUnavailable(f"can't reach the daemon at {socket_path}: {e}")
+    if not line:
+        raise DaemonUnavailable("the daemon closed the connection")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise DaemonError(reply.get("error", "unknown error"))
+    return reply["result"]
+
+
+def daemon_records(root, overlay=None, path_type=Path, socket_path=DEFAULT_SOCKET):
+    """
+    (records, unreadable) for every FLAC under root, straight from the
+    daemon's memory -- the same shape LibraryIndex.scan returns, with
+    FileRecord.path built with path_type. Returns None if the daemon isn't
+    running or doesn't watch root, so callers fall back to their own scan.
+    overlay: pending tag-plan changes, applied as LibraryIndex.scan does.
+    """
+    abs_root = os.path.abspath(str(root))
+    try:
+        result = query("files", socket_path=socket_path, root=abs_root)
+    except (DaemonUnavailable, DaemonError):
+        return None
+
+    def shown(path):
+        # The daemon works in absolute paths; hand them back built on root
+        # as the caller gave it, like a walk of root would.
+        return path_type(str(root) + path[len(abs_root):])
+
+    records = []
+    for item in result["records"]:
+        path = shown(item["path"])
+        tags = item["tags"]
+        if overlay and str(path) in overlay:
+            tags = overlay_tags(tags, overlay[str(path)])
+        records.append(FileRecord(path, item["size"], item["mtime_ns"], tags, item["streaminfo"],
+                                  item["pictures"]))
+    unreadable = [(shown(path), error) for path, error in result["unreadable"]]
+    return records, unreadable
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the FLAC library's tags in memory and answer queries.")
+    parser.add_argument("--socket", type=str, default=str(DEFAULT_SOCKET),
+                        help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_p = sub.add_parser("serve", help="Run the daemon in the foreground.")
+    serve_p.add_argument("roots", nargs="+", help="Folders to watch, recursively")
+    serve_p.add_argument("--index-file", type=str, default=str(DEFAULT_INDEX_FILE),
+                         help=f"Library index to load from and keep updated (default: {DEFAULT_INDEX_FILE})")
+    serve_p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                         help=f"Parallel file reads (default: {DEFAULT_WORKERS})")
+
+    query_p = sub.add_parser("query", help="Send one query and print the JSON result.")
+    query_p.add_argument("cmd", choices=("ping", "files", "albums", "artists", "missing", "pictures"))
+    query_p.add_argument("--root", type=str, default=None, help="Only files under this folder")
+    query_p.add_argument("--tag", type=str, default=None, help="Tag name, for 'missing'")
+
+    sub.add_parser("stop", help="Ask a running daemon to exit.")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "serve":
+            for root in args.roots:
+                if not os.path.isdir(root):
+                    print(f"Error: '{root}' is not a valid directory.")
+                    sys.exit(1)
+            LibraryDaemon(args.roots, index_file=Path(args.index_file).expanduser(),
+                          socket_path=args.socket, workers=args.workers).serve_forever()
+        elif args.command == "stop":
+            query("stop", socket_path=args.socket)
+            print("Daemon stopping.")
+        else:
+            params = {k: v for k, v in (("root", args.root), ("tag", args.tag)) if v}
+            print(json.dumps(query(args.cmd, socket_path=args.socket, **params), indent=2, ensure_ascii=False))
+    except (DaemonUnavailable, DaemonError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+library_index.py
+
+Persistent on-disk index of a FLAC library, shared by every tool in this
+folder (genre tagger, capitalisation fixer, MusicBrainz ID tagger,
+image_fixer, tag_normaliser, final_check).
+
+Every one of those tools used to open every file with mutagen.flac.FLAC on
+every run. On a library of thousands of tracks on a spinning disk that's
+minutes of re-parsing the same bytes before any real work starts. Instead,
+this keeps one SQLite database (by default
+~/.lastfm_genre_tagger/library_index.sqlite) holding, per file:
+
+    - every Vorbis comment, as {lowercased_key: [value, ...]} -- the same
+      shape as a mutagen FLAC object, so existing helpers written as
+      audio.get("album", [None])[0] work unchanged on it
+    - the STREAMINFO fields (sample rate, channels, bit depth, ...)
+    - one entry per embedded picture: type, mime, width, height, byte
+      length and the SHA-256 digest of the image data
+
+keyed on (path, size, mtime). A file is only re-read when its size or
+mtime no longer match what's stored; everything else comes straight out
+of the database, so a re-run over an unchanged library costs one stat()
+per file.
+
+Usage from a tool:
+
+    from library_index import LibraryIndex
+
+    with LibraryIndex() as index:
+        records, unreadable = index.scan(paths, root=root)
+
+    for rec in records:
+        key = get_album_key(rec.tags)
+
+Pass index_file=None for a throwaway in-memory index (same code path,
+nothing persisted) -- that's what the tools' --no-index flag does.
+
+Files are read with flac_meta.read_flac_metadata (mmap, no mutagen), so
+re-indexing a changed file never copies its cover art into Python
+objects -- the picture digests are computed straight off the mapping.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from flac_meta import read_flac_metadata
+from library_scan import DEFAULT_WORKERS, scan_files
+
+# Lives next to the encrypted API key and the capitalisation cache.
+DEFAULT_INDEX_FILE = Path.home() / ".lastfm_genre_tagger" / "library_index.sqlite"
+
+# Bump whenever the stored record shape changes; an index written by an
+# older version is dropped and rebuilt from scratch on open.
+SCHEMA_VERSION = 2
+
+STREAMINFO_FIELDS = ("sample_rate", "channels", "bits_per_sample", "total_samples", "length",
+                     "md5_signature")
+
+
+class FileRecord:
+    """Everything the index knows about one FLAC file."""
+    __slots__ = ("path", "size", "mtime_ns", "tags", "streaminfo", "pictures")
+
+    def __init__(self, path, size, mtime_ns, tags, streaminfo, pictures):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.tags = tags
+        self.streaminfo = streaminfo
+        self.pictures = pictures
+
+    def tag(self, key):
+        """First value of a tag, stripped, or None if missing/empty."""
+        val = self.tags.get(key, [None])[0]
+        return val.strip() if val else None
+
+
+# --------------------------------------------------------------------------
+# Reading a single file
+# --------------------------------------------------------------------------
+
+def picture_digest(data):
+    """Hex digest stored for each embedded picture. Anything comparing
+    image bytes against the index (image_fixer) must hash the same way."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_file_record(path):
+    """
+    Parse one FLAC file into (tags, streaminfo, pictures). Raises
+    flac_meta.FlacMetaError / OSError on an unreadable file; callers
+    report it.
+    """
+    with read_flac_metadata(path) as meta:
+        streaminfo = {name: meta.streaminfo.get(name) for name in STREAMINFO_FIELDS}
+        pictures = [
+            {
+                "type": pic.type,
+                "mime": pic.mime,
+                "width": pic.width,
+                "height": pic.height,
+                "length": pic.length,
+                "sha256": picture_digest(pic.data),
+            }
+            for pic in meta.pictures
+        ]
+        return meta.tags, streaminfo, pictures
+
+
+def overlay_tags(tags, pending):
+    """Copy of a {key: [values]} tag dict with pending {field: [values] or
+    None} changes applied (None removes the field)."""
+    merged = dict(tags)
+    for field, values in pending.items():
+        if values is None:
+            merged.pop(field, None)
+        else:
+            merged[field] = list(values)
+    return merged
+
+
+# --------------------------------------------------------------------------
+# The index
+# --------------------------------------------------------------------------
+
+class LibraryIndex:
+    """
+    SQLite-backed cache of per-file FLAC metadata. Use as a context
+    manager, or call close() when done. index_file=None keeps everything
+    in memory for this process only.
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE):
+        if index_file is None:
+            self.path = ":memory:"
+        else:
+            index_file = Path(index_file).expanduser()
+            index_file.parent.mkdir(parents=True, exist_ok=True)
+            self.path = str(index_file)
+        self.conn = sqlite3.connect(self.path)
+        self._init_schema()
+        self.reused = 0
+        self.reread = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _init_schema(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS files")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " tags TEXT NOT NULL,"
+            " streaminfo TEXT NOT NULL,"
+            " pictures TEXT NOT NULL)"
+        )
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def _load_rows(self):
+        """{path_str: (size, mtime_ns, tags_json, streaminfo_json, pictures_json)}"""
+        rows = self.conn.execute("SELECT path, size, mtime_ns, tags, streaminfo, pictures FROM files")
+        return {row[0]: row[1:] for row in rows}
+
+    def scan(self, paths, root=None, workers=DEFAULT_WORKERS, processes=False, overlay=None,
+             order="path"):
+        """
+        Return (records, unreadable) for the given FLAC paths, sorted by
+        path. Files whose (size, mtime) match the index are served from it;
+        everything else is re-read (in parallel, see library_scan.py) and
+        stored.
+
+        records: [FileRecord, ...] -- FileRecord.path is the object passed in
+        unreadable: [(path, exception), ...]
+
+        root: pass the folder the paths were listed from when the scan is a
+        complete recursive listing of it, so index entries for files that
+        have since been deleted/moved out from under root are dropped.
+        workers/processes: size and kind of the pool used for re-reads.
+        order: the order re-reads are issued in ("path", "inode" or
+        "physical", see library_scan.order_paths); the result is path-sorted
+        either way.
+        overlay: {path_str: {field: [values] or None}} of tag changes that
+        are planned but not written yet (see tag_plan.pending_changes).
+        They're applied to the returned records' tags so a later pipeline
+        stage sees an earlier stage's edits; the index itself only ever
+        stores what's on disk.
+        """
+        paths = list(paths)
+        known = self._load_rows()
+        records = []
+        unreadable = []
+        updates = []
+        stale = {}
+
+        for path in paths:
+            key = str(path)
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                unreadable.append((path, e))
+                continue
+
+            row = known.get(key)
+            if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                self.reused += 1
+                records.append(FileRecord(path, row[0], row[1], json.loads(row[2]),
+                                          json.loads(row[3]), json.loads(row[4])))
+            else:
+                stale[path] = st
+
+        for path, result, error in scan_files(stale, read_file_record, workers=workers, processes=processes,
+                                              order=order):
+            if error is not None:
+                unreadable.append((path, error))
+                continue
+            st = stale[path]
+            tags, streaminfo, pictures = result
+            self.reread += 1
+            records.append(FileRecord(path, st.st_size, st.st_mtime_ns, tags, streaminfo, pictures))
+            updates.append((str(path), st.st_size, st.st_mtime_ns, json.dumps(tags),
+                            json.dumps(streaminfo), json.dumps(pictures)))
+
+        if overlay:
+            for rec in records:
+                pending = overlay.get(str(rec.path))
+                if pending:
+                    rec.tags = overlay_tags(rec.tags, pending)
+
+        records.sort(key=lambda rec: str(rec.path))
+        unreadable.sort(key=lambda item: str(item[0]))
+
+        with self.conn:
+            if updates:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, tags, streaminfo, pictures) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    updates,
+                )
+            if root is not None:
+                prefix = os.path.join(str(root), "")
+                seen = {str(p) for p in paths}
+                gone = [(k,) for k in known if k.startswith(prefix) and k not in seen]
+                if gone:
+                    self.conn.executemany("DELETE FROM files WHERE path = ?", gone)
+
+        return records, unreadable
+
+    def forget(self, paths):
+        """Drop the index entries for files that no longer exist."""
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(str(p),) for p in paths])
+
+    def describe(self):
+        """One-line summary of how much work the last scan(s) saved."""
+        where = "memory" if self.path == ":memory:" else self.path
+        return f"Library index: {self.reread} file(s) read, {self.reused} reused ({where})."
@@ -0,0 +1,191 @@
+"""
+library_walk.py
+
+Directory listing cache shared by the tools' file-finding helpers
+(find_flac_files in the genre tagger / capitalisation fixer / MusicBrainz
+ID tagger, image_fixer.find_flacs, get_flacs in fix_tags / final_check,
+lossless_checker.find_files).
+
+Each of those used to start with a full os.walk / Path.rglob of the
+library. On a spun-down HDD or a network mount that's a readdir of every
+folder -- often the slowest part of a run that then finds nothing new.
+A directory's mtime changes whenever an entry is added, removed or
+renamed directly inside it, so this stores, per directory, its mtime and
+its listing (sub-folder names + file names) in the same SQLite file as
+the library index (library_index.py). On the next walk, a directory whose
+mtime still matches reuses its stored listing: one stat() instead of a
+readdir. Only directories that actually changed are listed again.
+
+A directory modified within the last couple of seconds of being listed
+isn't cached (its mtime may not have ticked over yet on filesystems with
+coarse timestamps, e.g. SMB/FAT), so a file added in that window is never
+missed.
+
+Usage:
+
+    from library_walk import walk_files
+
+    flacs = [p for p in walk_files(root) if p.lower().endswith(".flac")]
+
+walk_files returns every file's full path (as a str), sorted; callers
+filter by extension themselves. index_file=None skips the cache and does
+a plain os.walk (the tools' --no-index).
+
+No third-party requirements.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from library_index import DEFAULT_INDEX_FILE
+
+# Directories modified this recently (seconds) aren't cached, see above.
+RACY_WINDOW = 2.0
+
+
+class DirCache:
+    """
+    SQLite-backed cache of directory listings. Use as a context manager,
+    or call close() when done.
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE):
+        index_file = Path(index_file).expanduser()
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(index_file)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            " path TEXT PRIMARY KEY,"
+            " mtime_ns INTEGER NOT NULL,"
+            " subdirs TEXT NOT NULL,"
+            " files TEXT NOT NULL)"
+        )
+        self.conn.commit()
+        self.listed = 0
+        self.reused = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _load_rows(self, root):
+        prefix = os.path.join(root, "")
+        rows = self.conn.execute(
+            "SELECT path, mtime_ns, subdirs, files FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+            (root, len(prefix), prefix),
+        )
+        return {row[0]: row[1:] for row in rows}
+
+    def walk(self, root, recursive=True):
+        """
+        Every file path under root (just root itself if not recursive),
+        sorted. Paths are built on root as given, like os.walk's; the
+        cache itself is keyed on absolute paths.
+        """
+        root = str(root)
+        abs_root = os.path.abspath(root)
+        known = self._load_rows(abs_root)
+        now_ns = time.time_ns()
+        racy_ns = int(RACY_WINDOW * 1e9)
+
+        found = []
+        seen = set()
+        updates = []
+        stack = [(abs_root, root)]
+        while stack:
+            directory, shown = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(directory)
+
+            row = known.get(directory)
+            if row is not None and row[0] == mtime_ns:
+                subdirs, files = json.loads(row[1]), json.loads(row[2])
+                self.reused += 1
+            else:
+                try:
+                    subdirs, files = _list_dir(directory)
+                except OSError:
+                    # Unreadable right now (permissions, a dropped share):
+                    # skip it this run and cache nothing, so it's listed
+                    # again next time instead of staying hidden.
+                    continue
+                self.listed += 1
+                if now_ns - mtime_ns > racy_ns:
+                    updates.append((directory, mtime_ns, json.dumps(subdirs), json.dumps(files)))
+                elif row is not None:
+                    # Still settling: forget the stale listing, list it again next time.
+                    updates.append((directory, -1, row[1], row[2]))
+
+            found.extend(os.path.join(shown, name) for name in files)
+            if recursive:
+                stack.extend((os.path.join(directory, name), os.path.join(shown, name)) for name in subdirs)
+
+        with self.conn:
+            if updates:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs, files) VALUES (?, ?, ?, ?)",
+                    updates,
+                )
+            if recursive:
+                gone = [(path,) for path in known if path not in seen]
+                if gone:
+                    self.conn.executemany("DELETE FROM dirs WHERE path = ?", gone)
+
+        found.sort()
+        return found
+
+    def describe(self):
+        return f"Directory cache: {self.listed} folder(s) listed, {self.reused} reused ({self.path})."
+
+
+def _list_dir(directory):
+    """(sorted sub-folder names, sorted file names) of one directory.
+    Symlinked folders aren't followed, same as os.walk / Path.rglob.
+    Raises OSError if the directory can't be listed."""
+    subdirs, files = [], []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    files.append(entry.name)
+            except OSError:
+                continue
+    return sorted(subdirs), sorted(files)
+
+
+def walk_files(root, index_file=DEFAULT_INDEX_FILE, recursive=True):
+    """
+    Every file path under root, sorted, reusing cached listings of
+    unchanged directories. index_file=None lists everything fresh without
+    touching the cache.
+    """
+    if index_file is None:
+        root = str(root)
+        if not recursive:
+            try:
+                return sorted(os.path.join(root, name) for name in _list_dir(root)[1])
+            except OSError:
+                return []
+        found = []
+        for dirpath, _dirs, filenames in os.walk(root):
+            found.extend(os.path.join(dirpath, name) for name in filenames)
+        return sorted(found)
+
+    with DirCache(index_file) as cache:
+        return cache.walk(root, recursive=recursive)
@@ -38,6 +38,10 @@ import numpy as np
 import soundfile as sf
 from scipy.signal import stft
 
+from library_index import DEFAULT_INDEX_FILE
+from library_scan import SCAN_ORDERS, order_paths
+from library_walk import walk_files
+
 LOSSLESS_EXTS = {".flac", ".wav", ".aif", ".aiff", ".alac", ".ape", ".wv"}
 
 # Rough map of cutoff frequency -> likely lossy source, for CD-quality (44.1/48kHz) audio
@@ -156,17 +160,13 @@ def _analyze_file_inner(path, n_windows=6, window_sec=8.0):
     }
 
 
-def find_files(root, recursive):
-    if recursive:
-        for dirpath, _, filenames in os.walk(root):
-            for name in filenames:
-                if os.path.splitext(name)[1].lower() in LOSSLESS_EXTS:
-                    yield os.path.join(dirpath, name)
-    else:
-        for name in os.listdir(root):
-            full = os.path.join(root, name)
-            if os.path.isfile(full) and os.path.splitext(name)[1].lower() in LOSSLESS_EXTS:
-                yield full
+def find_files(root, recursive, index_file=DEFAULT_INDEX_FILE, order="path"):
+    # Folders unchanged since the last run come from the shared directory
+    # cache instead of being re-listed (see library_walk.py). order sorts
+    # the list by path, inode or physical disk offset (library_scan.py).
+    files = [full for full in walk_files(root, index_file, recursive=recursive)
+             if os.path.splitext(full)[1].lower() in LOSSLESS_EXTS]
+    yield from order_paths(files, order)
 
 
 def main():
@@ -177,9 +177,16 @@ def main():
     ap.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Parallel workers")
     ap.add_argument("--resume", action="store_true",
                      help="If --csv already exists, skip files already recorded in it and append new results")
+    ap.add_argument("--no-dir-cache", action="store_true",
+                     help=f"List every folder fresh instead of using the directory cache in {DEFAULT_INDEX_FILE}")
+    ap.add_argument("--order", choices=SCAN_ORDERS, default="path",
+                     help="Order to submit files in: path (default), inode, or physical (disk offset via FIEMAP). "
+                          "inode/physical cut seeking on a spinning disk")
     args = ap.parse_args()
 
-    files = list(find_files(args.folder, args.recursive))
+    files = list(find_files(args.folder, args.recursive,
+                            index_file=None if args.no_dir_cache else DEFAULT_INDEX_FILE,
+                            order=args.order))
     if not files:
         print(f"No FLAC/WAV/AIFF files found in {args.folder}")
         sys.exit(0)
@@ -22,6 +22,11 @@ Disambiguation:
     MusicBrainz -- so you can recognize which one is actually in your
     library. You then pick a number, or skip.
 
+    Artists are first looked up --batch-size at a time, several names to
+    one search (MusicBrainz allows one request a second, so this is where
+    most of a run's time goes); a name that search can't settle on its
+    own gets a search of its own, as above.
+
 Requirements:
     pip install mutagen requests tqdm
 
@@ -34,6 +39,13 @@ Usage:
     # Re-check artists that already have an MBID tag:
     python musicbrainz_id_tagger.py /path/to/music/folder --contact "you@example.com" --force
 
+    # One search per artist, as before batching (slower, same results):
+    python musicbrainz_id_tagger.py /path/to/music/folder --contact "you@example.com" --batch-size 1
+
+    # Record the MBIDs in a shared tag plan instead of writing them (see
+    # tag_plan.py; later stages pointed at the same plan see them):
+    python musicbrainz_id_tagger.py /path/to/music/folder --contact "you@example.com" --plan run.jsonl
+
 Why --contact is required:
     MusicBrainz requires every API client to send a descriptive
     User-Agent string containing real contact info, so they can reach
@@ -54,16 +66,41 @@ import requests
 from mutagen.flac import FLAC
 from tqdm import tqdm
 
+import http_replay
+from flac_meta import VORBIS_COMMENT, read_flac_metadata
+from flac_writer import DEFAULT_PADDING_RESERVE, WriteStats, save_flac
+from library_daemon import daemon_records
+from library_index import DEFAULT_INDEX_FILE, LibraryIndex, overlay_tags
+from library_scan import DEFAULT_WORKERS, SCAN_ORDERS
+from library_walk import walk_files
+from rate_governor import governor
+from tag_plan import TagPlan, pending_changes
+
 MB_API_URL = "https://musicbrainz.org/ws/2"
 
 # MusicBrainz requires >=1 second between requests per IP. Keep a small
 # safety margin above that.
 MB_MIN_DELAY = 1.1
 
+# The same limit again, shared with any other process talking to
+# MusicBrainz from this machine (see rate_governor.py). None where the
+# platform has no fcntl; MB_MIN_DELAY alone applies then.
+MB_GOVERNOR = governor("musicbrainz.org")
+# How long every process holds off after MusicBrainz says 503.
+MB_BACKOFF = 5.0
+
+# Artists per batched search (see resolve_artists_batched), and the most
+# hits MusicBrainz returns for one search.
+DEFAULT_BATCH_SIZE = 10
+MB_SEARCH_LIMIT = 100
+
 
-def find_flac_files(root: Path):
-    """Recursively yield all .flac files under root."""
-    yield from root.rglob("*.flac")
+def find_flac_files(root: Path, index_file=DEFAULT_INDEX_FILE):
+    """Recursively yield all .flac files under root. Folders that haven't
+    changed since the last run aren't re-listed (see library_walk.py)."""
+    for path in walk_files(root, index_file):
+        if path.endswith(".flac"):
+            yield Path(path)
 
 
 def get_artist_name(audio: FLAC):
@@ -82,7 +119,8 @@ def has_artist_mbid(audio: FLAC):
     return bool(audio.get("musicbrainz_artistid", [None])[0])
 
 
-def scan_artists(root: Path, force: bool):
+def scan_artists(root: Path, force: bool, index_file=DEFAULT_INDEX_FILE, workers=DEFAULT_WORKERS,
+                 overlay=None, order="path", use_daemon=False):
     """
     Scan all FLAC files under root and group their paths by artist name.
     Returns a dict: {artist_name: [Path, Path, ...]}
@@ -92,28 +130,42 @@ def scan_artists(root: Path, force: bool):
     results (their artist name is still skipped as a whole only if ALL
     of that artist's files already have an MBID; otherwise the
     not-yet-tagged files are still included).
+
+    Tags come from the shared library index (library_index.py), so only
+    files changed since the last run are re-read, `workers` at a time.
+    overlay: pending plan changes (tag_plan.pending_changes) to read on
+    top of the files' tags. order: read order for changed files
+    (library_scan.order_paths). use_daemon: try a running
+    library_daemon.py first, falling back to the index.
     """
     artists = {}
     skipped = []
 
-    for flac_path in find_flac_files(root):
-        try:
-            audio = FLAC(flac_path)
-        except Exception as e:
-            tqdm.write(f"  [WARN] Could not read {flac_path}: {e}")
-            skipped.append(flac_path)
-            continue
-
-        name = get_artist_name(audio)
+    found = daemon_records(root, overlay=overlay) if use_daemon else None
+    if found is not None:
+        records, unreadable = found
+        tqdm.write(f"Library daemon: {len(records)} file(s) served from memory.")
+    else:
+        with LibraryIndex(index_file) as index:
+            records, unreadable = index.scan(find_flac_files(root, index_file), root=root, workers=workers,
+                                             overlay=overlay, order=order)
+            tqdm.write(index.describe())
+
+    for flac_path, e in unreadable:
+        tqdm.write(f"  [WARN] Could not read {flac_path}: {e}")
+        skipped.append(flac_path)
+
+    for rec in records:
+        name = get_artist_name(rec.tags)
         if not name:
-            tqdm.write(f"  [WARN] No ARTIST/ALBUMARTIST tag, skipping: {flac_path}")
-            skipped.append(flac_path)
+            tqdm.write(f"  [WARN] No ARTIST/ALBUMARTIST tag, skipping: {rec.path}")
+            skipped.append(rec.path)
             continue
 
-        if not force and has_artist_mbid(audio):
+        if not force and has_artist_mbid(rec.tags):
             continue
 
-        artists.setdefault(name, []).append(flac_path)
+        artists.setdefault(name, []).append(rec.path)
 
     return artists, skipped
 
@@ -122,11 +174,14 @@ def mb_request(session: requests.Session, path: str, params: dict, last_request_
     """
     Make a rate-limited GET request to the MusicBrainz API.
     last_request_time is a 1-element list used as a mutable timestamp
-    holder so callers can share rate-limit state across calls.
+    holder so callers can share rate-limit state across calls; MB_GOVERNOR
+    shares it with other processes as well.
     """
     elapsed = time.time() - last_request_time[0]
     if elapsed < MB_MIN_DELAY:
         time.sleep(MB_MIN_DELAY - elapsed)
+    if MB_GOVERNOR is not None:
+        MB_GOVERNOR.acquire()
 
     params = dict(params)
     params["fmt"] = "json"
@@ -134,6 +189,8 @@ def mb_request(session: requests.Session, path: str, params: dict, last_request_
     try:
         resp = session.get(f"{MB_API_URL}/{path}", params=params, timeout=20)
         last_request_time[0] = time.time()
+        if resp.status_code == 503 and MB_GOVERNOR is not None:
+            MB_GOVERNOR.pause(MB_BACKOFF)
         resp.raise_for_status()
         return resp.json()
     except requests.RequestException as e:
@@ -166,6 +223,77 @@ def search_artist_candidates(session, artist_name: str, last_request_time: list,
     return candidates
 
 
+def _lucene_phrase(text: str):
+    """text as a quoted Lucene phrase."""
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _same_name(a: str, b: str):
+    return " ".join(a.split()).casefold() == " ".join(b.split()).casefold()
+
+
+def _candidate_names(candidate: dict):
+    """Every name a MusicBrainz artist answers to: name, sort name, aliases."""
+    names = [candidate.get("name") or "", candidate.get("sort-name") or ""]
+    names += [alias.get("name") or "" for alias in candidate.get("aliases") or []]
+    return [n for n in names if n]
+
+
+def resolve_artists_batched(session, artist_names, last_request_time: list, batch_size: int = DEFAULT_BATCH_SIZE,
+                            auto_threshold: int = 95):
+    """
+    Look up artist_names batch_size at a time, one MusicBrainz search each
+    (artist:"A" OR artist:"B" OR ...), and hand the hits back out to the
+    names they belong to.
+
+    A name is only resolved here when exactly one hit is called exactly
+    that (ignoring case and spacing), no other hit has it as a sort name
+    or alias, and that hit passes resolve_artist_mbid's own test: a score
+    of at least auto_threshold, 10 or more ahead of the best other hit
+    whose name contains this one. If the page of hits was cut off, the
+    exact hit must also score above the last hit on it, or a namesake
+    could be waiting on the next page. Everything else is left for the
+    usual single query, which can prompt.
+
+    Returns ({artist_name: (mbid, resolved_name)}, number of requests sent).
+    """
+    resolved = {}
+    requests_sent = 0
+    names = list(artist_names)
+    for start in range(0, len(names), batch_size):
+        batch = names[start:start + batch_size]
+        data = mb_request(
+            session,
+            "artist",
+            {"query": " OR ".join(f"artist:{_lucene_phrase(name)}" for name in batch), "limit": MB_SEARCH_LIMIT},
+            last_request_time,
+        )
+        requests_sent += 1
+        if not data:
+            continue
+
+        hits = data.get("artists", [])
+        truncated = int(data.get("count", len(hits))) > len(hits)
+        for name in batch:
+            exact = [hit for hit in hits if _same_name(hit.get("name") or "", name)]
+            related = [hit for hit in hits if any(_same_name(n, name) for n in _candidate_names(hit))]
+            if len(exact) != 1 or len(related) != 1:
+                continue
+            score = int(exact[0].get("score", 0))
+            if score < auto_threshold:
+                continue
+            folded = " ".join(name.split()).casefold()
+            rivals = [int(hit.get("score", 0)) for hit in hits
+                      if hit is not exact[0] and folded in " ".join((hit.get("name") or "").split()).casefold()]
+            if rivals and score - max(rivals) < 10:
+                continue
+            if truncated and score <= int(hits[-1].get("score", 0)):
+                continue
+            if exact[0].get("id"):
+                resolved[name] = (exact[0].get("id"), exact[0].get("name"))
+    return resolved, requests_sent
+
+
 def fetch_top_recordings(session, artist_mbid: str, last_request_time: list, limit: int = 5):
     """
     Fetch a handful of recording titles credited to this artist MBID,
@@ -293,11 +421,22 @@ def resolve_artist_mbid(artist_name: str, session, last_request_time: list, inte
     return chosen.get("id"), chosen.get("name")
 
 
-def apply_mbid_tags(flac_path: Path, artist_mbid: str, audio_albumartist_matches: bool, dry_run: bool):
+def plan_mbid_tags(plan: TagPlan, flac_path: Path, tags: dict, artist_mbid: str,
+                   audio_albumartist_matches: bool):
+    """Record apply_mbid_tags' changes in a tag plan instead of writing them."""
+    plan.add(flac_path, "musicbrainz_artistid", tags.get("musicbrainz_artistid"), [artist_mbid])
+    if audio_albumartist_matches:
+        plan.add(flac_path, "musicbrainz_albumartistid", tags.get("musicbrainz_albumartistid"),
+                 [artist_mbid])
+
+
+def apply_mbid_tags(flac_path: Path, artist_mbid: str, audio_albumartist_matches: bool, dry_run: bool,
+                    padding_reserve: int = DEFAULT_PADDING_RESERVE, stats: Optional[WriteStats] = None):
     """
     Write MUSICBRAINZ_ARTISTID (always) and MUSICBRAINZ_ALBUMARTISTID
     (only if this file's ALBUMARTIST is the artist we resolved) to a
-    single FLAC file.
+    single FLAC file. Saved via flac_writer.save_flac, so the edit lands
+    in place whenever the file has enough padding.
     """
     audio = FLAC(flac_path)
 
@@ -307,7 +446,7 @@ def apply_mbid_tags(flac_path: Path, artist_mbid: str, audio_albumartist_matches
 
     if dry_run:
         return
-    audio.save()
+    save_flac(audio, padding_reserve, stats)
 
 
 def main():
@@ -332,10 +471,48 @@ def main():
         help="MusicBrainz match score (0-100) at/above which a dominant top result is "
              "auto-accepted without prompting. Default: 95."
     )
+    parser.add_argument(
+        "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help="Artists looked up per MusicBrainz search; only names that search leaves ambiguous "
+             f"get a search of their own (default: {DEFAULT_BATCH_SIZE}; 1 = one search per artist)."
+    )
     parser.add_argument(
         "--dry-run", action="store_true",
         help="Show what would happen without writing any tags to disk."
     )
+    parser.add_argument(
+        "--index-file", type=str, default=str(DEFAULT_INDEX_FILE),
+        help=f"Shared library index, so unchanged files aren't re-read (default: {DEFAULT_INDEX_FILE})."
+    )
+    parser.add_argument(
+        "--no-index", action="store_true",
+        help="Don't read or update the on-disk library index; read every file fresh."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS,
+        help=f"Parallel file reads while scanning (default: {DEFAULT_WORKERS}; 1 = no pool)."
+    )
+    parser.add_argument(
+        "--scan-order", choices=SCAN_ORDERS, default="path",
+        help="Order to read changed files in: path (default), inode, or physical (disk offset via "
+             "FIEMAP, falling back to inode). inode/physical cut seeking on a spinning disk; pair "
+             "them with a low --workers."
+    )
+    parser.add_argument(
+        "--no-daemon", action="store_true",
+        help="Don't ask a running library_daemon.py for the library's tags; always scan."
+    )
+    parser.add_argument(
+        "--padding-reserve", type=int, default=DEFAULT_PADDING_RESERVE,
+        help="Bytes of FLAC padding to add whenever a tag edit forces a full-file rewrite, so "
+             f"later edits are written in place (default: {DEFAULT_PADDING_RESERVE})."
+    )
+    parser.add_argument(
+        "--plan", type=str, default=None,
+        help="Don't write any files; append the MBID changes to this tag plan file instead, "
+             "to be written later with 'python tag_plan.py apply PLAN'. Changes other tools "
+             "already planned there are read on top of the files' tags."
+    )
     parser.add_argument(
         "--log-file", type=str, default=None,
         help="Path to write a list of artists that were skipped/unresolved, for later review."
@@ -348,12 +525,16 @@ def main():
         tqdm.write(f"Error: '{root}' is not a valid directory.")
         sys.exit(1)
 
-    session = requests.Session()
+    session = http_replay.attach(requests.Session())
     session.headers["User-Agent"] = f"FlacMBIDTagger/1.0 ( {args.contact} )"
     last_request_time = [0.0]
 
     tqdm.write(f"Scanning '{root}' for FLAC files...")
-    artists, skipped = scan_artists(root, force=args.force)
+    index_file = None if args.no_index else Path(args.index_file).expanduser()
+    pending = pending_changes(args.plan) if args.plan else None
+    artists, skipped = scan_artists(root, force=args.force, index_file=index_file,
+                                   workers=args.workers, overlay=pending, order=args.scan_order,
+                                   use_daemon=not args.no_daemon)
 
     if not artists:
         tqdm.write("No artists needing MBID lookup were found. Nothing to do.")
@@ -367,18 +548,36 @@ def main():
     if args.dry_run:
         tqdm.write("\n--- DRY RUN: no files will be modified ---")
 
+    plan = TagPlan(args.plan, source="musicbrainz_id_finder") if args.plan and not args.dry_run else None
+    if plan is not None:
+        tqdm.write(f"\n--- PLAN MODE: changes are recorded to '{plan.path}', no files will be modified ---")
+
+    batched, requests_sent = {}, 0
+    # Scores top out at 100, so a higher --auto-threshold means every match is
+    # chosen by hand and batched searches could never settle anything.
+    if args.batch_size > 1 and args.auto_threshold <= 100:
+        tqdm.write(f"\nLooking up {len(artists)} artist(s) on MusicBrainz, {args.batch_size} per search...")
+        batched, requests_sent = resolve_artists_batched(session, sorted(artists), last_request_time,
+                                                         args.batch_size, args.auto_threshold)
+
     unresolved = []
+    write_stats = WriteStats()
     progress = tqdm(sorted(artists.items()), desc="Artists", unit="artist")
 
     for artist_name, files in progress:
         progress.set_postfix_str(artist_name[:40])
         tqdm.write(f"\n'{artist_name}'  ({len(files)} track(s))")
 
-        mbid, resolved_name = resolve_artist_mbid(
-            artist_name, session, last_request_time,
-            interactive=not args.no_prompt,
-            auto_threshold=args.auto_threshold,
-        )
+        if artist_name in batched:
+            mbid, resolved_name = batched[artist_name]
+            tqdm.write(f"    Matched '{artist_name}' -> '{resolved_name}' (batched search)")
+        else:
+            mbid, resolved_name = resolve_artist_mbid(
+                artist_name, session, last_request_time,
+                interactive=not args.no_prompt,
+                auto_threshold=args.auto_threshold,
+            )
+            requests_sent += 1
 
         if not mbid:
             unresolved.append(artist_name)
@@ -386,17 +585,29 @@ def main():
 
         for f in tqdm(files, desc="  Tracks", unit="file", leave=False):
             try:
-                audio = FLAC(f)
-                album_artist = audio.get("albumartist", [None])[0]
+                with read_flac_metadata(f, blocks={VORBIS_COMMENT}) as meta:
+                    tags = meta.tags
+                if pending and str(f) in pending:
+                    tags = overlay_tags(tags, pending[str(f)])
+                album_artist = tags.get("albumartist", [None])[0]
                 matches_album_artist = (
                     album_artist is not None and album_artist.strip() == artist_name
                 )
-                apply_mbid_tags(f, mbid, matches_album_artist, dry_run=args.dry_run)
+                if plan is not None:
+                    plan_mbid_tags(plan, f, tags, mbid, matches_album_artist)
+                    tqdm.write(f"      Planned MBID for: {f.name}")
+                    continue
+                apply_mbid_tags(f, mbid, matches_album_artist, dry_run=args.dry_run,
+                                padding_reserve=args.padding_reserve, stats=write_stats)
                 action = "Would set" if args.dry_run else "Set"
                 tqdm.write(f"      {action} MBID on: {f.name}")
             except Exception as e:
                 tqdm.write(f"      [ERROR] Failed to write tag to {f}: {e}")
 
+    if batched:
+        tqdm.write(f"\n{len(batched)} of {len(artists)} artist(s) resolved from batched searches; "
+                   f"{requests_sent} artist search(es) sent in all.")
+
     if unresolved:
         tqdm.write(f"\n{len(unresolved)} artist(s) left unresolved:")
         for name in unresolved:
@@ -418,6 +629,12 @@ def main():
             except OSError as e:
                 tqdm.write(f"[ERROR] Could not write log file {log_path}: {e}")
 
+    if plan is not None:
+        plan.close()
+        tqdm.write(f"\n{plan.added} change(s) recorded. Apply them with: python tag_plan.py apply '{plan.path}'")
+    elif not args.dry_run:
+        tqdm.write(f"\n{write_stats.summary()}")
+
     tqdm.write("\nDone." if not args.dry_run else "\nDry run complete. Re-run without --dry-run to apply changes.")
 
 
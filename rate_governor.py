@@ -0,0 +1,139 @@
+"""
+rate_governor.py
+
+One request budget per API host, shared by every process on the machine.
+
+Each tool paces its own requests (lastfm_api.TokenBucket, the MusicBrainz
+tagger's MB_MIN_DELAY), but that only keeps one process under the limit:
+run the genre tagger, the capitalisation fixer and wishlistcehcker.py at
+the same time and together they send three times Last.fm's per-key rate
+and start getting error 29s back; two MusicBrainz runs each leave 1.1 s
+between their own requests and still hit the server twice a second.
+
+A governor is a token bucket kept in a small file per host (under
+~/.lastfm_genre_tagger/rate_limits/), read and updated under an exclusive
+fcntl lock, so all processes draw from the same bucket: however many
+tools run at once, together they send at most HOST_LIMITS[host]. When one
+of them gets a rate-limit reply, pause() stops every process for a while,
+not just that one.
+
+Usage:
+
+    from rate_governor import governor
+
+    gov = governor("musicbrainz.org")    # None if the host has no limit set
+    gov.acquire()                        # sleeps until this process may send
+    ...
+    gov.pause(5)                         # after a rate-limit reply
+
+Set RATE_GOVERNOR=off in the environment to leave each process to pace
+itself alone (e.g. when benchmarking against http_replay.py's stand-in,
+which isn't the real API). The same happens on a platform without fcntl.
+Linux/macOS. No third-party requirements.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DISABLE_ENV = "RATE_GOVERNOR"
+DEFAULT_STATE_DIR = Path.home() / ".lastfm_genre_tagger" / "rate_limits"
+
+# host: (requests per second, burst) for all processes together.
+HOST_LIMITS = {
+    "ws.audioscrobbler.com": (5.0, 5),      # Last.fm: 5/s per API key
+    "musicbrainz.org": (1 / 1.1, 1),        # MusicBrainz: 1/s per IP (with the same margin as MB_MIN_DELAY)
+}
+
+
+class SharedBucket:
+    """Token bucket whose state lives in a lock-protected file."""
+
+    def __init__(self, host, rate, burst, state_dir=DEFAULT_STATE_DIR):
+        state_dir = Path(state_dir).expanduser()
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.host = host
+        self.path = str(state_dir / f"{host}.json")
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _update(self, change):
+        """
+        Lock the state file, refill the bucket up to now, let change(now,
+        tokens, paused_until) return (result, tokens, paused_until), write
+        that back and return result.
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = json.loads(os.read(fd, 4096) or b"{}")
+            except ValueError:
+                state = {}
+            now = time.time()
+            tokens = float(state.get("tokens", self.capacity))
+            updated = float(state.get("updated", now))
+            paused_until = float(state.get("paused_until", 0.0))
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+
+            result, tokens, paused_until = change(now, tokens, paused_until)
+
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps({"tokens": tokens, "updated": max(now, paused_until),
+                                     "paused_until": paused_until}).encode("utf-8"))
+            return result
+        finally:
+            os.close(fd)     # also releases the lock
+
+    def acquire(self):
+        """Take one token, sleeping until one is free."""
+        def take(now, tokens, paused_until):
+            if now >= paused_until and tokens >= 1.0:
+                return 0.0, tokens - 1.0, paused_until
+            return max(paused_until - now, (1.0 - tokens) / self.rate), tokens, paused_until
+
+        while True:
+            # Threads of one process queue here rather than all hammering the lock file.
+            with self._lock:
+                wait = self._update(take)
+            if wait <= 0:
+                return
+            self.waited += wait
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """No tokens for anyone for the next `seconds`, then an empty bucket."""
+        def stop(now, tokens, paused_until):
+            return None, 0.0, max(paused_until, now + seconds)
+
+        with self._lock:
+            self._update(stop)
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def governor(host, state_dir=DEFAULT_STATE_DIR):
+    """The process's SharedBucket for host, or None if it has no entry in
+    HOST_LIMITS, this platform has no fcntl or RATE_GOVERNOR=off."""
+    if fcntl is None or host not in HOST_LIMITS or os.environ.get(DISABLE_ENV, "").lower() == "off":
+        return None
+    with _governors_lock:
+        if host not in _governors:
+            rate, burst = HOST_LIMITS[host]
+            try:
+                _governors[host] = SharedBucket(host, rate, burst, state_dir)
+            except OSError:
+                _governors[host] = None
+        return _governors[host]
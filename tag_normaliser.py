@@ -2,6 +2,9 @@
 """
 FLAC Tag Consistency Checker
 Finds inconsistencies in FLAC file tags and allows interactive standardization.
+
+Pass plan_file to normalise() to record the chosen fixes to a tag plan
+instead of writing them (apply later with: python tag_plan.py apply FILE).
 """
 
 import os
@@ -13,33 +16,43 @@ import mutagen
 from mutagen.flac import FLAC
 from tqdm import tqdm
 
+from flac_meta import VORBIS_COMMENT, read_flac_metadata
+from flac_writer import WriteStats, save_flac
+from library_index import DEFAULT_INDEX_FILE, LibraryIndex
+from tag_plan import TagPlan, pending_changes
+
 def get_flac_files(folder_path):
     """Get all FLAC files in the specified folder."""
     print("\nScanning for FLAC files...")
     return list(Path(folder_path).glob("*.flac"))
 
-def extract_tags(flac_files):
-    """Extract common tags from FLAC files."""
+def extract_tags(flac_files, index_file=DEFAULT_INDEX_FILE, overlay=None):
+    """Extract common tags from FLAC files (via the shared library index,
+    so only files changed since the last run are actually re-read).
+    overlay: pending tag-plan changes to read on top of the files' tags."""
     tags_data = []
     common_tags = ['artist', 'album', 'albumartist', 'genre', 'date']
     
     print("\nExtracting tags from files...")
-    for file_path in tqdm(flac_files, desc="Reading tags", unit="file"):
-        try:
-            audio = FLAC(file_path)
-            file_tags = {'file': file_path.name}
-            
-            for tag in common_tags:
-                if tag in audio:
-                    # Get first value if it's a list
-                    value = audio[tag][0] if isinstance(audio[tag], list) else audio[tag]
-                    file_tags[tag] = value
-                else:
-                    file_tags[tag] = None
-            
-            tags_data.append(file_tags)
-        except Exception as e:
-            tqdm.write(f"Error reading {file_path.name}: {e}")
+    with LibraryIndex(index_file) as index:
+        records, unreadable = index.scan(flac_files, overlay=overlay)
+        print(index.describe())
+    for file_path, e in unreadable:
+        tqdm.write(f"Error reading {file_path.name}: {e}")
+
+    for rec in records:
+        audio = rec.tags
+        file_tags = {'file': rec.path.name}
+        
+        for tag in common_tags:
+            if tag in audio:
+                # Get first value if it's a list
+                value = audio[tag][0] if isinstance(audio[tag], list) else audio[tag]
+                file_tags[tag] = value
+            else:
+                file_tags[tag] = None
+        
+        tags_data.append(file_tags)
     
     return tags_data
 
@@ -189,7 +202,24 @@ def choose_standard_value(group_num, total_groups, tag, variations):
         except (ValueError, IndexError):
             print("Invalid input. Try again.")
 
-def apply_changes(folder_path, tag, standard_value, variations):
+def plan_changes(plan, folder_path, tag, standard_value, files_to_update, pending=None):
+    """Record the change for each file in a TagPlan instead of writing it.
+    pending: changes already in the plan, so the recorded old value is
+    what the file will hold by then."""
+    for filename in files_to_update:
+        file_path = Path(folder_path) / filename
+        try:
+            with read_flac_metadata(file_path, blocks={VORBIS_COMMENT}) as meta:
+                current = meta.tags.get(tag)
+            if pending and str(file_path) in pending:
+                current = pending[str(file_path)].get(tag, current)
+        except Exception as e:
+            tqdm.write(f"Error reading {filename}: {e}")
+            continue
+        plan.add(file_path, tag, current, [standard_value])
+    print(f"✓ Recorded changes for {len(files_to_update)} file(s) in {plan.path}")
+
+def apply_changes(folder_path, tag, standard_value, variations, plan=None, pending=None):
     """Apply the standardized tag value to all affected files."""
     files_to_update = []
     
@@ -210,24 +240,28 @@ def apply_changes(folder_path, tag, standard_value, variations):
     
     confirm = input(f"\nChange '{tag}' to '{standard_value}' in these files? (y/n): ").strip().lower()
     
-    if confirm == 'y':
+    if confirm == 'y' and plan is not None:
+        plan_changes(plan, folder_path, tag, standard_value, files_to_update, pending)
+    elif confirm == 'y':
         updated = 0
+        write_stats = WriteStats()
         print()
         for filename in tqdm(files_to_update, desc="Updating files", unit="file"):
             try:
                 file_path = Path(folder_path) / filename
                 audio = FLAC(file_path)
                 audio[tag] = standard_value
-                audio.save()
+                save_flac(audio, stats=write_stats)
                 updated += 1
             except Exception as e:
                 tqdm.write(f"Error updating {filename}: {e}")
         
         print(f"✓ Successfully updated {updated} file(s)!")
+        print(f"  {write_stats.summary()}")
     else:
         print("Changes cancelled.")
 
-def normalise(path = None):
+def normalise(path = None, plan_file = None):
     print("FLAC Tag Consistency Checker")
     print("="*60)
     
@@ -238,7 +272,7 @@ def normalise(path = None):
     else:
         folder_path = path
     
-    folder_path = Path(folder_path)
+    folder_path = Path(folder_path).resolve()
     
     if not folder_path.exists():
         print(f"Error: Folder '{folder_path}' does not exist!")
@@ -254,7 +288,8 @@ def normalise(path = None):
     
     print(f"Found {len(flac_files)} FLAC file(s)")
     
-    tags_data = extract_tags(flac_files)
+    pending = pending_changes(plan_file) if plan_file else None
+    tags_data = extract_tags(flac_files, overlay=pending)
     
     inconsistency_groups = find_inconsistencies(tags_data)
     
@@ -268,14 +303,21 @@ def normalise(path = None):
     print("INTERACTIVE FIX MODE")
     print("="*60)
     
-    for i, group in enumerate(inconsistency_groups, 1):
-        tag = group['tag']
-        variations = group['variations']
-        
-        standard = choose_standard_value(i, len(inconsistency_groups), tag, variations)
-        if standard:
-            apply_changes(folder_path, tag, standard, variations)
-    
+    plan = TagPlan(plan_file, source="tag_normaliser") if plan_file else None
+    try:
+        for i, group in enumerate(inconsistency_groups, 1):
+            tag = group['tag']
+            variations = group['variations']
+            
+            standard = choose_standard_value(i, len(inconsistency_groups), tag, variations)
+            if standard:
+                apply_changes(folder_path, tag, standard, variations, plan=plan, pending=pending)
+    finally:
+        if plan is not None:
+            plan.close()
+    
+    if plan is not None:
+        print(f"\n{plan.added} change(s) recorded. Apply them with: python tag_plan.py apply '{plan.path}'")
     print("\n✓ All done!")
 
 if __name__ == "__main__":
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+tag_plan.py
+
+Plan/apply engine shared by the tag-editing tools.
+
+The genre tagger, capitalisation fixer and tag normaliser normally
+interleave network lookups, prompts and file writes, so a crash or Ctrl-C
+halfway through leaves a half-applied library. Run with --plan FILE, they
+instead only *record* what they would change, and this script applies it
+afterwards as one bulk, parallel write phase.
+
+A plan file is an append-only journal, one JSON object per line:
+
+    {"op": "set", "path": "...", "field": "genre", "old": ["Rock"], "new": ["Indie;Rock"]}
+    {"op": "move", "from": "...", "to": "..."}
+    {"op": "done", "path": "...", "status": "applied"}
+
+"old"/"new" are lists of values (a Vorbis field can repeat); "new": null
+removes the field. "set" lines also carry the "source" tool that planned
+them. "move" records a file renamed after changes were planned for it
+(fix_tags renames as it goes); its pending changes follow it. Each line is
+flushed as soon as it's decided, so an interrupted lookup run keeps
+everything decided so far and can simply be re-run with the same --plan
+file to add the rest.
+
+COMBINED RUNS: point every stage at the SAME plan file and each file is
+written exactly once at the end, however many stages touched it:
+
+    python -c "from fix_tags import fix_tags; fix_tags('/music', plan_file='run.jsonl')"
+    python "musicbrainz id finder.py" /music --contact you@example.com --plan run.jsonl
+    python "genre tagger.py" /music --plan run.jsonl
+    python "capitalisation fixer.py" /music --plan run.jsonl
+    python tag_plan.py apply run.jsonl
+
+Every stage reads the plan's pending changes on top of what's on disk
+(pending_changes() + the library index's overlay), so e.g. the genre
+tagger already sees the MBIDs and the capitalisation fixer the artist
+names planned by earlier stages. apply reports how many saves merging
+saved compared with each stage writing its own edits.
+
+Applying (python tag_plan.py apply FILE):
+    - every file's changes are written in one save, through a worker pool
+      (flac_writer.save_flac, so edits land in place where padding allows)
+    - a field whose current value already equals "new" is left alone; a
+      file where every field already matches isn't saved at all
+    - a field whose current value is neither "old" nor "new" was changed by
+      something else since the plan was made; the file is reported as a
+      conflict and not touched (--force writes it anyway)
+    - after each file written or found unchanged, a "done" line is appended
+      to the same journal, so re-running apply after an interruption
+      resumes where it stopped. Conflicted and failed files stay pending,
+      so a later apply (or apply --force) tries them again.
+      A file written but not yet marked done is harmless: on the re-run
+      its values already match and it's skipped.
+
+Usage:
+    python tag_plan.py show  /path/to/plan.jsonl
+    python tag_plan.py apply /path/to/plan.jsonl
+    python tag_plan.py apply /path/to/plan.jsonl --workers 8 --dry-run
+
+Requirements:
+    pip install mutagen tqdm
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+from mutagen.flac import FLAC
+from tqdm import tqdm
+
+from flac_writer import DEFAULT_PADDING_RESERVE, WriteStats, save_flac
+from library_scan import DEFAULT_WORKERS, scan_files
+
+# apply statuses that finish a file; anything else is tried again next run.
+DONE_STATUSES = ("applied", "unchanged")
+
+
+class PlanError(Exception):
+    pass
+
+
+def _as_values(value):
+    """Normalise a tag value to the journal's list-of-strings form (or None)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value]
+
+
+# --------------------------------------------------------------------------
+# Writing a plan
+# --------------------------------------------------------------------------
+
+class TagPlan:
+    """
+    Append-only writer for a plan journal. Use as a context manager, or
+    call close() when done. Opening an existing plan appends to it.
+    """
+
+    def __init__(self, plan_file, source=None):
+        self.path = Path(plan_file).expanduser()
+        self.source = source
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        torn = self._ends_mid_line()
+        self._fh = self.path.open("a", encoding="utf-8")
+        if torn:
+            # Last run died mid-write; start on a fresh line so the torn
+            # record stays one (ignored) line instead of corrupting ours.
+            self._fh.write("\n")
+        self.added = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _ends_mid_line(self):
+        try:
+            with self.path.open("rb") as f:
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False  # missing or empty
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+            self._fh = None
+
+    def _append(self, entry):
+        self._fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+    def add(self, path, field, old, new):
+        """Record that `field` of `path` should go from `old` to `new`.
+        No-op changes (old == new) aren't recorded."""
+        old, new = _as_values(old), _as_values(new)
+        if old == new:
+            return
+        entry = {"op": "set", "path": str(path), "field": field.lower(), "old": old, "new": new}
+        if self.source:
+            entry["source"] = self.source
+        self._append(entry)
+        self.added += 1
+
+    def move(self, old_path, new_path):
+        """Record that a file with planned changes was renamed."""
+        self._append({"op": "move", "from": str(old_path), "to": str(new_path)})
+
+    def mark_done(self, path, status):
+        self._append({"op": "done", "path": str(path), "status": status})
+
+
+# --------------------------------------------------------------------------
+# Reading a plan
+# --------------------------------------------------------------------------
+
+def load_plan(plan_file):
+    """
+    Read a plan journal. Returns (changes, done, sources):
+        changes: {path: {field: (old, new)}}, in first-seen path order; a
+                 later "set" for the same path/field replaces the new value
+                 but keeps the original old value
+        done:    {path: status} for files apply has finished with (applied
+                 or unchanged; conflicts stay pending for a re-run or --force)
+        sources: {path: {source, ...}} -- which tools planned each file's
+                 changes ("" for records without a source)
+    A line that isn't valid JSON is a record torn by a crash mid-write;
+    it's skipped.
+    """
+    plan_file = Path(plan_file).expanduser()
+    if not plan_file.is_file():
+        raise PlanError(f"Plan file '{plan_file}' not found.")
+
+    changes = {}
+    done = {}
+    sources = {}
+    with plan_file.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            _merge_entry(entry, changes, done, sources)
+    return changes, done, sources
+
+
+def _merge_entry(entry, changes, done, sources):
+    """Fold one journal record into load_plan's (changes, done, sources)."""
+    op = entry.get("op")
+    if op == "set":
+        if done.pop(entry["path"], None) is not None:
+            # A new change for a file that was already applied reopens it;
+            # what was applied is on disk now, so start from there.
+            changes.pop(entry["path"], None)
+            sources.pop(entry["path"], None)
+        fields = changes.setdefault(entry["path"], {})
+        old = fields[entry["field"]][0] if entry["field"] in fields else entry["old"]
+        fields[entry["field"]] = (old, entry["new"])
+        sources.setdefault(entry["path"], set()).add(entry.get("source", ""))
+    elif op == "move":
+        src, dst = entry["from"], entry["to"]
+        if src in changes:
+            moved = changes.pop(src)
+            changes.setdefault(dst, {}).update(moved)
+            sources.setdefault(dst, set()).update(sources.pop(src, ()))
+        if src in done:
+            done[dst] = done.pop(src)
+    elif op == "done" and entry.get("status", "applied") in DONE_STATUSES:
+        done[entry["path"]] = entry.get("status", "applied")
+
+
+def pending_changes(plan_file):
+    """
+    {path_str: {field: new_values}} for every file in the plan that apply
+    hasn't handled yet -- what a later stage should see on top of the
+    on-disk tags. {} if there's no plan file yet.
+    """
+    if plan_file is None or not Path(plan_file).expanduser().is_file():
+        return {}
+    changes, done, _ = load_plan(plan_file)
+    return {
+        path: {field: new for field, (_old, new) in fields.items()}
+        for path, fields in changes.items()
+        if path not in done
+    }
+
+
+# --------------------------------------------------------------------------
+# Applying a plan
+# --------------------------------------------------------------------------
+
+def apply_file(path, fields, force=False, dry_run=False,
+               padding_reserve=DEFAULT_PADDING_RESERVE, stats=None):
+    """
+    Apply one file's {field: (old, new)} changes in a single save.
+    Returns "applied", "unchanged" (everything already matched) or
+    "conflict" (some field changed since the plan was made).
+    """
+    audio = FLAC(path)
+    pending = {}
+    for field, (old, new) in fields.items():
+        current = list(audio[field]) if field in audio else None
+        if current == new:
+            continue
+        if current != old and not force:
+            return "conflict"
+        pending[field] = new
+
+    if not pending:
+        return "unchanged"
+    if dry_run:
+        return "applied"
+
+    for field, new in pending.items():
+        if new is None:
+            if field in audio:
+                del audio[field]
+        else:
+            audio[field] = new
+    save_flac(audio, padding_reserve, stats)
+    return "applied"
+
+
+def apply_plan(plan_file, workers=DEFAULT_WORKERS, force=False, dry_run=False,
+               padding_reserve=DEFAULT_PADDING_RESERVE):
+    """
+    Apply every file in the plan that isn't already marked done, in
+    parallel, appending a "done" line per file applied or unchanged (a
+    conflict or failure is retried by the next run). Returns a
+    Counter of statuses (applied / unchanged / conflict / failed /
+    resumed, plus merged_saves: saves avoided because several tools'
+    edits to a file went out in one write) and the WriteStats of the saves.
+    """
+    changes, done, sources = load_plan(plan_file)
+    todo = {path: fields for path, fields in changes.items() if path not in done}
+    counts = Counter(resumed=len(changes) - len(todo))
+    stats = WriteStats()
+
+    def work(path):
+        return apply_file(path, todo[path], force=force, dry_run=dry_run,
+                          padding_reserve=padding_reserve, stats=stats)
+
+    journal = None if dry_run else TagPlan(plan_file)
+    try:
+        results = scan_files(todo, work, workers=workers)
+        for path, status, error in tqdm(results, total=len(todo), desc="Applying", unit="file"):
+            if error is not None:
+                tqdm.write(f"  [ERROR] {path}: {error}")
+                counts["failed"] += 1
+                continue
+            if status == "conflict":
+                tqdm.write(f"  [CONFLICT] {path} changed since the plan was made; left untouched.")
+            counts[status] += 1
+            if status == "applied":
+                counts["merged_saves"] += max(0, len(sources.get(path, ())) - 1)
+            if journal is not None and status in DONE_STATUSES:
+                journal.mark_done(path, status)
+    finally:
+        if journal is not None:
+            journal.close()
+    return counts, stats
+
+
+def show_plan(plan_file):
+    changes, done, sources = load_plan(plan_file)
+    for path, fields in changes.items():
+        state = done.get(path, "pending")
+        by = ", ".join(sorted(s for s in sources.get(path, ()) if s))
+        print(f"{path}  [{state}]" + (f"  ({by})" if by else ""))
+        for field, (old, new) in fields.items():
+            old_s = "; ".join(old) if old else "(none)"
+            new_s = "; ".join(new) if new else "(removed)"
+            print(f"    {field.upper()}: {old_s} -> {new_s}")
+    pending = sum(1 for path in changes if path not in done)
+    print(f"\n{len(changes)} file(s) in plan, {pending} still to apply.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show or apply a tag-change plan written by the tagging tools' --plan option."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    show_p = sub.add_parser("show", help="List the changes in a plan and which are already applied.")
+    show_p.add_argument("plan", type=str, help="Path to the plan file")
+
+    apply_p = sub.add_parser("apply", help="Write a plan's changes to the files (resumable).")
+    apply_p.add_argument("plan", type=str, help="Path to the plan file")
+    apply_p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                         help=f"Files written in parallel (default: {DEFAULT_WORKERS}; 1 = no pool)")
+    apply_p.add_argument("--force", action="store_true",
+                         help="Write files even if their current value is neither the planned old nor new value.")
+    apply_p.add_argument("--dry-run", action="store_true",
+                         help="Report what would be written without touching files or the journal.")
+    apply_p.add_argument("--padding-reserve", type=int, default=DEFAULT_PADDING_RESERVE,
+                         help="Bytes of FLAC padding to add whenever an edit forces a full-file rewrite "
+                              f"(default: {DEFAULT_PADDING_RESERVE})")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "show":
+            show_plan(args.plan)
+            return
+
+        counts, stats = apply_plan(args.plan, workers=args.workers, force=args.force,
+                                   dry_run=args.dry_run, padding_reserve=args.padding_reserve)
+    except PlanError as e:
+        tqdm.write(f"Error: {e}")
+        sys.exit(1)
+
+    verb = "would be written" if args.dry_run else "written"
+    tqdm.write(f"\n{counts['applied']} file(s) {verb}, {counts['unchanged']} already up to date, "
+               f"{counts['conflict']} conflict(s), {counts['failed']} failed, "
+               f"{counts['resumed']} done in an earlier run.")
+    if counts["merged_saves"]:
+        tqdm.write(f"{counts['merged_saves']} save(s) avoided by writing several tools' edits "
+                   f"to the same file at once.")
+    if not args.dry_run and stats.in_place + stats.rewrites:
+        tqdm.write(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
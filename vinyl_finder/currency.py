@@ -9,6 +9,8 @@ rather than hitting the API per-item.
 
 import requests
 
+import http_replay
+
 FRANKFURTER_URL = "https://api.frankfurter.dev/v1/latest"
 
 
@@ -16,11 +18,12 @@ class CurrencyConverter:
     def __init__(self, base="NZD"):
         self.base = base
         self._rates = None  # dict like {"USD": 0.58, "EUR": 0.54, ...}
+        self.session = http_replay.attach(requests.Session())
 
     def _load_rates(self):
         if self._rates is not None:
             return
-        resp = requests.get(FRANKFURTER_URL, params={"base": self.base}, timeout=20)
+        resp = self.session.get(FRANKFURTER_URL, params={"base": self.base}, timeout=20)
         resp.raise_for_status()
         data = resp.json()
         # data["rates"] is {currency_code: how much 1 NZD buys}
@@ -49,6 +49,8 @@ What IS documented, stable, and used by this client:
 import time
 import requests
 
+import http_replay
+
 API_ROOT = "https://api.discogs.com"
 USER_AGENT = "VinylFinderScript/1.0 (personal use)"
 
@@ -61,7 +63,7 @@ class DiscogsClient:
     def __init__(self, token, request_delay=1.0):
         self.token = token
         self.request_delay = request_delay
-        self.session = requests.Session()
+        self.session = http_replay.attach(requests.Session())
         self.session.headers.update({
             "User-Agent": USER_AGENT,
             "Authorization": f"Discogs token={token}",
@@ -26,13 +26,15 @@ import requests
 from bs4 import BeautifulSoup
 from rapidfuzz import fuzz
 
+import http_replay
+
 
 class JBHiFiClient:
     def __init__(self, base_url, request_delay=1.0, fuzzy_threshold=72):
         self.base_url = base_url.rstrip("/")
         self.request_delay = request_delay
         self.fuzzy_threshold = fuzzy_threshold
-        self.session = requests.Session()
+        self.session = http_replay.attach(requests.Session())
         self.session.headers.update({
             "User-Agent": (
                 "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
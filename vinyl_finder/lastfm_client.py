@@ -4,12 +4,14 @@ Last.fm client - pulls your top artists and top albums, with scrobble counts.
 Uses the official, documented, no-auth-needed-for-reads Last.fm API:
   https://www.last.fm/api/show/user.getTopArtists
   https://www.last.fm/api/show/user.getTopAlbums
+
+Requests go through the shared client in the repo root's lastfm_api.py
+(pooled connections, token-bucket pacing, backoff on rate-limit errors).
 """
 
-import time
 import requests
 
-API_ROOT = "https://ws.audioscrobbler.com/2.0/"
+import lastfm_api
 
 
 class LastFmError(Exception):
@@ -17,28 +19,20 @@ class LastFmError(Exception):
 
 
 class LastFmClient:
-    def __init__(self, api_key, username, request_delay=1.0):
+    def __init__(self, api_key, username, rate=lastfm_api.DEFAULT_RATE):
         self.api_key = api_key
         self.username = username
-        self.request_delay = request_delay
-        self.session = requests.Session()
+        self.client = lastfm_api.LastFmClient(api_key, rate=rate, timeout=20)
 
     def _call(self, method, **params):
-        query = {
-            "method": method,
-            "user": self.username,
-            "api_key": self.api_key,
-            "format": "json",
-        }
+        query = {"method": method, "user": self.username}
         query.update(params)
-        resp = self.session.get(API_ROOT, params=query, timeout=20)
-        time.sleep(self.request_delay)
-        data = resp.json()
-        if "error" in data:
-            raise LastFmError(
-                f"Last.fm API error {data['error']}: {data.get('message')}"
-            )
-        return data
+        try:
+            return self.client.get(query)
+        except lastfm_api.LastFmError as e:
+            raise LastFmError(str(e))
+        except (requests.RequestException, ValueError) as e:
+            raise LastFmError(f"Last.fm request failed: {e}")
 
     def get_top_artists(self, period="overall", limit=100):
         """
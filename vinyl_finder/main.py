@@ -24,6 +24,8 @@ import sys
 import csv
 import argparse
 
+# Puts the repo root on sys.path for the modules below; keep it first.
+import repo_path  # noqa: F401
 import config
 from lastfm_client import LastFmClient, LastFmError
 from discogs_client import DiscogsClient, DiscogsError
@@ -55,8 +57,7 @@ def main():
 
     top_n = args.artists or config.TOP_N_ARTISTS
 
-    lastfm = LastFmClient(config.LASTFM_API_KEY, config.LASTFM_USERNAME,
-                           request_delay=config.REQUEST_DELAY_SECONDS)
+    lastfm = LastFmClient(config.LASTFM_API_KEY, config.LASTFM_USERNAME)
     discogs = DiscogsClient(config.DISCOGS_TOKEN,
                              request_delay=config.REQUEST_DELAY_SECONDS) if not args.skip_discogs else None
     jbhifi = JBHiFiClient(config.JBHIFI_BASE_URL,
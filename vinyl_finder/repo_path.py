@@ -0,0 +1,13 @@
+"""
+Puts the repo root on sys.path, so vinyl_finder's modules can use the
+shared modules there (lastfm_api.py, http_replay.py) as plain imports.
+main.py imports this before anything else; it goes after vinyl_finder's
+own folder, so a module here still wins over a same-named one there.
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
@@ -17,23 +17,20 @@ Wishlist CSV format (no header row required, but supported):
 import argparse
 import csv
 import sys
-import time
 import json
 
 try:
-    import requests
+    import requests  # noqa: F401  (lastfm_api needs it)
 except ImportError:
     sys.exit("Please install requests:  pip install requests")
 
+from lastfm_api import LastFmClient, LastFmError
+
 LASTFM_USERNAME = "sonicpanther101"
 LASTFM_API_KEY  = # get a free key at https://www.last.fm/api/account/create
-LASTFM_BASE     = "https://ws.audioscrobbler.com/2.0/"
 
-SESSION = requests.Session()
-SESSION.headers.update({
-    "User-Agent": "wishlist-lastfm-script/1.0 (github.com/user/wishlist-lastfm)",
-    "Accept": "application/json",
-})
+# Pooled connections + token-bucket pacing; see lastfm_api.py.
+CLIENT = LastFmClient(LASTFM_API_KEY, user_agent="wishlist-lastfm-script/1.0 (github.com/user/wishlist-lastfm)")
 
 OUTPUT_FIELDS = [
     "artist",
@@ -52,11 +49,9 @@ OUTPUT_FIELDS = [
 # ---------------------------------------------------------------------------
 
 def _call(params: dict) -> dict:
-    """Make a Last.fm API call and return the parsed JSON."""
-    params = {**params, "api_key": LASTFM_API_KEY, "format": "json"}
-    r = SESSION.get(LASTFM_BASE, params=params, timeout=10)
-    r.raise_for_status()
-    return r.json()
+    """Make a Last.fm API call and return the parsed JSON. Raises
+    lastfm_api.LastFmError for an API error reply."""
+    return CLIENT.get(params)
 
 
 def get_artist_stats(artist: str) -> dict:
@@ -68,8 +63,6 @@ def get_artist_stats(artist: str) -> dict:
             "username": LASTFM_USERNAME,
             "autocorrect": 1,
         })
-        if "error" in data:
-            return {"status": "artist_not_found"}
         info = data["artist"]
         return {
             "status": "ok",
@@ -77,6 +70,8 @@ def get_artist_stats(artist: str) -> dict:
             # 'userplaycount' only present when username is passed
             "artist_playcount": info.get("stats", {}).get("userplaycount", "0"),
         }
+    except LastFmError:
+        return {"status": "artist_not_found"}
     except Exception as e:
         return {"status": f"error: {e}"}
 
@@ -91,8 +86,6 @@ def get_album_stats(artist: str, album: str) -> dict:
             "username": LASTFM_USERNAME,
             "autocorrect": 1,
         })
-        if "error" in data:
-            return {"status": "album_not_found"}
         info = data["album"]
         tracks = info.get("tracks", {}).get("track", [])
         track_count = len(tracks) if isinstance(tracks, list) else (1 if tracks else 0)
@@ -102,6 +95,8 @@ def get_album_stats(artist: str, album: str) -> dict:
             "album_playcount": info.get("userplaycount", "0"),
             "album_tracks": track_count,
         }
+    except LastFmError:
+        return {"status": "album_not_found"}
     except Exception as e:
         return {"status": f"error: {e}"}
 
@@ -167,9 +162,7 @@ def main():
         print(f"  [{i}/{len(entries)}] {artist} — {album}")
 
         artist_stats = get_artist_stats(artist)
-        time.sleep(0.25)  # be polite to the API
         album_stats  = get_album_stats(artist, album)
-        time.sleep(0.25)
 
         # Merge statuses
         if artist_stats["status"] != "ok":